@@ -3,62 +3,81 @@ Chat API Endpoints
 
 This file defines the endpoints for the chatbot functionality.
 It handles incoming chat requests, interacts with the RAG service to generate
-responses, and returns the answers to the client.
+responses, and returns the answers to the client, either as a single JSON
+response or as a Server-Sent Events stream.
 """
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import Any
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, List, Optional
 from app.api import deps
 from app.schemas.chat import ChatRequest, ChatResponse
 from app.services.rag_service import RAGService
-from app.models import Chat, Session as DbSession, User
-from app.db.session import get_db
+from app.services.chat_history import ChatHistoryRepository
+from app.services.write_behind import WriteBehindQueue
+from app.models import Session as DbSession, User
+from app.db.session import get_async_db, AsyncSessionLocal
+from app.core.logging import logger
+import json
 import uuid
 
 router = APIRouter()
 
+async def _start_turn(db: AsyncSession, history: ChatHistoryRepository, request: ChatRequest) -> List[Dict[str, str]]:
+    """
+    Creates the user/session if needed, stores the user message and returns the recent history.
+    All writes happen in a single transaction.
+    """
+    async with db.begin():
+        # 1. Get or Create Session (Simple check)
+        db_session = await db.get(DbSession, request.session_id)
+        if not db_session:
+            # Check if user exists, if not create (Lazy creation for demo)
+            user = await db.get(User, request.user_id)
+            if not user:
+                # Create a dummy user if not exists for this ID (or handle error)
+                # ideally user creation is separate auth flow. 
+                # For now assuming user exists or we create one just to make it work
+                db.add(User(id=request.user_id, email=f"user{request.user_id}@example.com"))
+
+            db.add(DbSession(id=request.session_id, user_id=request.user_id, title=request.query[:30]))
+
+        # 2. Save User Message
+        history.stage_message(db, request.session_id, role="user", content=request.query)
+    history.record(request.session_id, "user", request.query)
+    
+    # 3. Retrieve History
+    # Only the last N messages (from the ring buffer when the session is warm)
+    return await history.arecent(db, request.session_id)
+
+async def _save_assistant_message(db: Optional[AsyncSession], history: ChatHistoryRepository, session_id: str, answer: str, chunks_used: List[Dict[str, Any]], token_usage: Dict[str, int], write_behind: Optional[WriteBehindQueue] = None):
+    # Convert chunks to list of dicts/indices for storage if needed, or just store IDs
+    # The Chat model expects chunks_used as JSON
+    fields = dict(
+        role="assistant",
+        content=answer,
+        chunks_used=[c.get('id') for c in chunks_used] if chunks_used else [], # Storing IDs
+        prompt_tokens=token_usage.get("input_tokens", 0),
+        completion_tokens=token_usage.get("output_tokens", 0)
+    )
+    if write_behind is not None:
+        # Persisted in the background; the history buffer is updated immediately
+        await write_behind.add_message(session_id, **fields)
+    else:
+        await history.aadd_message(db, session_id, **fields)
+
 @router.post("/", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    rag_service: RAGService = Depends(deps.get_rag_service),
+    history: ChatHistoryRepository = Depends(deps.get_chat_history),
+    write_behind: Optional[WriteBehindQueue] = Depends(deps.get_write_behind)
 ) -> Any:
     """
     Chat endpoint for RAG-based interaction.
     """
-    rag_service = RAGService()
-    
-    # 1. Get or Create Session (Simple check)
-    db_session = db.query(DbSession).filter(DbSession.id == request.session_id).first()
-    if not db_session:
-        # Check if user exists, if not create (Lazy creation for demo)
-        user = db.query(User).filter(User.id == request.user_id).first()
-        if not user:
-            # Create a dummy user if not exists for this ID (or handle error)
-            # ideally user creation is separate auth flow. 
-            # For now assuming user exists or we create one just to make it work
-            user = User(id=request.user_id, email=f"user{request.user_id}@example.com")
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-
-        db_session = DbSession(id=request.session_id, user_id=request.user_id, title=request.query[:30])
-        db.add(db_session)
-        db.commit()
-        db.refresh(db_session)
-        
-    # 2. Save User Message
-    user_msg = Chat(
-        session_id=request.session_id,
-        role="user",
-        content=request.query
-    )
-    db.add(user_msg)
-    db.commit()
-    
-    # 3. Retrieve History
-    # Get last N messages for history
-    full_history = db.query(Chat).filter(Chat.session_id == request.session_id).order_by(Chat.created_at).all()
-    history_dicts = [{"role": msg.role, "content": msg.content} for msg in full_history]
+    history_dicts = await _start_turn(db, history, request)
     
     # 4. Generate Answer
     str_user_id = str(request.user_id) # Service expects string
@@ -86,22 +105,61 @@ async def chat(
         chunks_used = chunks
 
     # 5. Save Assistant Message
-    # Convert chunks to list of dicts/indices for storage if needed, or just store IDs
-    # The Chat model expects chunks_used as JSON
-    assistant_msg = Chat(
-        session_id=request.session_id,
-        role="assistant",
-        content=rag_response.answer,
-        chunks_used=[c.get('id') for c in chunks_used] if chunks_used else [], # Storing IDs
-        prompt_tokens=token_usage.get("input_tokens", 0),
-        completion_tokens=token_usage.get("output_tokens", 0)
-    )
-    db.add(assistant_msg)
-    db.commit()
+    await _save_assistant_message(db, history, request.session_id, rag_response.answer, chunks_used, token_usage, write_behind)
     
     return ChatResponse(
         answer=rag_response.answer,
         session_id=request.session_id,
         chunks_used=chunks_used,
-        memory_saved=rag_response.memory_to_save
+        memory_saved=rag_response.memory_to_save,
+        cached=bool(token_usage.get("cache_hit"))
     )
+
+@router.post("/stream")
+async def chat_stream(
+    request: ChatRequest,
+    db: AsyncSession = Depends(get_async_db),
+    rag_service: RAGService = Depends(deps.get_rag_service),
+    history: ChatHistoryRepository = Depends(deps.get_chat_history),
+    write_behind: Optional[WriteBehindQueue] = Depends(deps.get_write_behind)
+) -> StreamingResponse:
+    """
+    Streaming chat endpoint (Server-Sent Events).
+    Emits `token` events with answer text as it is generated and a final `done`
+    event with cited chunk ids, memory_to_save, token usage and timings.
+    The assistant message is persisted (or queued for write-behind) before the
+    `done` event is sent.
+    """
+    history_dicts = await _start_turn(db, history, request)
+
+    async def event_stream():
+        try:
+            async for event in rag_service.generate_answer_stream(
+                query=request.query,
+                user_id=str(request.user_id),
+                session_id=request.session_id,
+                recent_history=history_dicts,
+                mode=request.mode,
+                metadata=request.metadata
+            ):
+                if event["event"] == "done":
+                    data = event["data"]
+                    if write_behind is not None:
+                        await _save_assistant_message(None, history, request.session_id, data["answer"], data["chunks_used"], data["usage"], write_behind)
+                    else:
+                        # The request-scoped session is closed once streaming starts
+                        async with AsyncSessionLocal() as write_db:
+                            await _save_assistant_message(write_db, history, request.session_id, data["answer"], data["chunks_used"], data["usage"])
+                yield _format_sse(event)
+        except Exception as e:
+            logger.exception("Chat stream failed for session %s", request.session_id)
+            yield _format_sse({"event": "error", "data": {"detail": str(e)}})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _format_sse(event: Dict[str, Any]) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
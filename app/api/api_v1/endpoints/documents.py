@@ -2,15 +2,126 @@
 Document API Endpoints
 
 This file provides endpoints for document ingestion and management.
-It allows users to upload or create documents that will be processed and stored
-in the vector database for RAG operations.
+Single texts, batches of texts and uploads (multi-file) are spooled to disk and
+ingested by background jobs; the endpoints return a job id right away and
+expose job status, progress and cancellation.
 """
-from fastapi import APIRouter
-from app.schemas.document import DocumentCreate, DocumentResponse
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from typing import List, Optional
+import asyncio
+import json
+import os
+from app.api import deps
+from app.core.config import settings
+from app.core.exceptions import NotFoundException
+from app.models import IngestionJob
+from app.schemas.document import DocumentCreate, DocumentResponse, DocumentBatchCreate
+from app.schemas.ingestion import IngestionJobResponse
+from app.services.ingestion_jobs import IngestionJobRunner
 
 router = APIRouter()
 
+# Text formats that can be ingested (see IngestionService.process_file)
+SUPPORTED_EXTENSIONS = (".txt", ".md")
+
 @router.post("/", response_model=DocumentResponse)
-async def create_document(doc: DocumentCreate):
-    # Call ingestion service
-    return DocumentResponse(id=1, title=doc.title, content=doc.content)
+async def create_document(
+    doc: DocumentCreate,
+    jobs: IngestionJobRunner = Depends(deps.get_ingestion_jobs)
+) -> DocumentResponse:
+    """
+    Queues one text for ingestion (its title is the source name). The request and
+    response keep their original shape; `job_id` tracks the ingestion.
+    """
+    job_id = jobs.new_job_id()
+    items = await asyncio.to_thread(_spool_texts, jobs.spool_dir(job_id), [(doc.title, doc.content)])
+    await jobs.submit(job_id, items, None, "")
+    return DocumentResponse(id=1, title=doc.title, content=doc.content, job_id=job_id)
+
+@router.post("/batch", response_model=IngestionJobResponse, status_code=202)
+async def create_documents(
+    batch: DocumentBatchCreate,
+    jobs: IngestionJobRunner = Depends(deps.get_ingestion_jobs)
+) -> IngestionJobResponse:
+    """
+    Queues a batch of texts for ingestion. Each document's title is its source name.
+    """
+    if not batch.documents:
+        raise HTTPException(status_code=400, detail="No documents given")
+
+    job_id = jobs.new_job_id()
+    items = await asyncio.to_thread(_spool_texts, jobs.spool_dir(job_id), [(doc.title, doc.content) for doc in batch.documents])
+    job = await jobs.submit(job_id, items, batch.metadata_schema, batch.system_prompt)
+    return _job_response(job)
+
+@router.post("/upload", response_model=IngestionJobResponse, status_code=202)
+async def upload_documents(
+    files: List[UploadFile] = File(...),
+    metadata_schema: Optional[str] = Form(None, description="JSON schema of the metadata to extract"),
+    system_prompt: str = Form(""),
+    jobs: IngestionJobRunner = Depends(deps.get_ingestion_jobs)
+) -> IngestionJobResponse:
+    """
+    Queues uploaded files for ingestion. Files are streamed to disk, never held in memory whole.
+    """
+    for file in files:
+        if not (file.filename or "").endswith(SUPPORTED_EXTENSIONS):
+            raise HTTPException(status_code=400, detail=f"Unsupported file type: {file.filename}")
+    try:
+        schema = json.loads(metadata_schema) if metadata_schema else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="metadata_schema is not valid JSON")
+
+    job_id = jobs.new_job_id()
+    spool_dir = jobs.spool_dir(job_id)
+    await asyncio.to_thread(os.makedirs, spool_dir, exist_ok=True)
+    items = []
+    for i, file in enumerate(files):
+        path = os.path.join(spool_dir, str(i))
+        out = await asyncio.to_thread(open, path, "wb")
+        try:
+            while block := await file.read(settings.INGEST_READ_BLOCK_BYTES):
+                await asyncio.to_thread(out.write, block)
+        finally:
+            out.close()
+        items.append({"source_file": file.filename, "path": path})
+
+    job = await jobs.submit(job_id, items, schema, system_prompt)
+    return _job_response(job)
+
+@router.get("/jobs/{job_id}", response_model=IngestionJobResponse)
+async def get_job(job_id: str, jobs: IngestionJobRunner = Depends(deps.get_ingestion_jobs)) -> IngestionJobResponse:
+    job = await jobs.get(job_id)
+    if job is None:
+        raise NotFoundException("Ingestion job not found")
+    return _job_response(job)
+
+@router.post("/jobs/{job_id}/cancel", response_model=IngestionJobResponse)
+async def cancel_job(job_id: str, jobs: IngestionJobRunner = Depends(deps.get_ingestion_jobs)) -> IngestionJobResponse:
+    job = await jobs.cancel(job_id)
+    if job is None:
+        raise NotFoundException("Ingestion job not found")
+    return _job_response(job)
+
+def _spool_texts(spool_dir: str, documents: List[tuple]) -> List[dict]:
+    os.makedirs(spool_dir, exist_ok=True)
+    items = []
+    for i, (title, content) in enumerate(documents):
+        path = os.path.join(spool_dir, str(i))
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        items.append({"source_file": title, "path": path})
+    return items
+
+def _job_response(job: IngestionJob) -> IngestionJobResponse:
+    return IngestionJobResponse(
+        job_id=job.id,
+        status=job.status,
+        sources=[item["source_file"] for item in job.items],
+        items_done=job.items_done or 0,
+        progress=job.progress or {},
+        error=job.error,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at
+    )
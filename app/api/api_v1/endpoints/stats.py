@@ -0,0 +1,16 @@
+"""
+Stats API Endpoints
+
+This file exposes runtime statistics of the shared services (embedding
+batching, caches, queues) so they can be monitored and tuned.
+"""
+from fastapi import APIRouter, Depends
+from typing import Any, Dict
+from app.api import deps
+from app.services.container import ServiceContainer
+
+router = APIRouter()
+
+@router.get("/")
+def get_stats(services: ServiceContainer = Depends(deps.get_services)) -> Dict[str, Any]:
+    return services.stats()
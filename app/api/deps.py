@@ -5,8 +5,35 @@ This file contains dependency injection functions for FastAPI endpoints.
 Common dependencies include fetching the current user, establishing database
 sessions, or configuring shared services per request.
 """
+from typing import Optional
+from fastapi import Request
+from app.services.container import ServiceContainer
+from app.services.rag_service import RAGService
+from app.services.ingestion_service import IngestionService
+from app.services.chat_history import ChatHistoryRepository
+from app.services.write_behind import WriteBehindQueue
+from app.services.ingestion_jobs import IngestionJobRunner
 # from fastapi import Depends, HTTPException
 # from app.core.security import verify_password
 
 # def get_current_user():
 #     pass
+
+def get_services(request: Request) -> ServiceContainer:
+    """Returns the app-lifetime service container built in the lifespan."""
+    return request.app.state.services
+
+def get_rag_service(request: Request) -> RAGService:
+    return get_services(request).rag_service
+
+def get_ingestion_service(request: Request) -> IngestionService:
+    return get_services(request).ingestion_service
+
+def get_chat_history(request: Request) -> ChatHistoryRepository:
+    return get_services(request).chat_history
+
+def get_write_behind(request: Request) -> Optional[WriteBehindQueue]:
+    return get_services(request).write_behind
+
+def get_ingestion_jobs(request: Request) -> IngestionJobRunner:
+    return get_services(request).ingestion_jobs
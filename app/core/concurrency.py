@@ -0,0 +1,64 @@
+"""
+Concurrency Utilities
+
+This file provides bounded thread pools used to run blocking work (vector
+database HTTP calls, CPU-bound helpers) off the asyncio event loop.
+Each pool has its own size so one kind of work cannot starve another.
+"""
+from typing import Any, Callable, Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import threading
+from app.core.config import settings
+
+
+class BoundedPool:
+    """A named, fixed-size thread pool with an awaitable `run` helper."""
+
+    def __init__(self, max_workers: int, name: str):
+        self.max_workers = max(1, max_workers)
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+_vector_io_pool: Optional[BoundedPool] = None
+_ingestion_io_pool: Optional[BoundedPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_vector_io_pool() -> BoundedPool:
+    """Returns the process-wide pool used for vector index I/O."""
+    global _vector_io_pool
+    if _vector_io_pool is None:
+        with _pool_lock:
+            if _vector_io_pool is None:
+                _vector_io_pool = BoundedPool(settings.VECTOR_IO_MAX_WORKERS, "vector-io")
+    return _vector_io_pool
+
+
+def get_ingestion_io_pool() -> BoundedPool:
+    """Returns the process-wide pool used for the vector writes of ingestion."""
+    global _ingestion_io_pool
+    if _ingestion_io_pool is None:
+        with _pool_lock:
+            if _ingestion_io_pool is None:
+                _ingestion_io_pool = BoundedPool(settings.INGEST_IO_MAX_WORKERS, "ingestion-io")
+    return _ingestion_io_pool
+
+
+def shutdown_pools():
+    global _vector_io_pool, _ingestion_io_pool
+    with _pool_lock:
+        for pool in (_vector_io_pool, _ingestion_io_pool):
+            if pool is not None:
+                pool.shutdown()
+        _vector_io_pool = None
+        _ingestion_io_pool = None
@@ -11,9 +11,127 @@ class Settings(BaseSettings):
     PROJECT_NAME: str = "FC Chatbot"
     API_V1_STR: str = "/api/v1"
     OPENAI_API_KEY: str
-    PINECONE_API_KEY: str
-    PINECONE_INDEX_NAME: str
+    # Optional OpenAI-compatible endpoint (proxy or local stub server)
+    OPENAI_BASE_URL: str = ""
+    PINECONE_API_KEY: str = ""
+    PINECONE_INDEX_NAME: str = ""
     DATABASE_URL: str = "sqlite:///./sql_app.db"
+    # Async driver URL; derived from DATABASE_URL (aiosqlite / asyncpg) when empty
+    DATABASE_ASYNC_URL: str = ""
+    # Connection pool (per engine; ignored for in-memory SQLite)
+    DATABASE_POOL_SIZE: int = 5
+    DATABASE_MAX_OVERFLOW: int = 10
+    DATABASE_POOL_TIMEOUT: float = 30.0
+    DATABASE_POOL_RECYCLE: int = 1800
+    # Apply idempotent schema updates (indexes, new tables) at startup; see app/db/migrations.py
+    DATABASE_AUTO_MIGRATE: bool = True
+
+    # Embeddings (shared, micro-batched engine)
+    EMBEDDING_MODEL_NAME: str = "all-MiniLM-L6-v2"
+    EMBEDDING_MAX_BATCH_SIZE: int = 64
+    EMBEDDING_MAX_WAIT_MS: float = 5.0
+    EMBEDDING_NUM_WORKERS: int = 1
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 10000
+    EMBEDDING_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    EMBEDDING_CACHE_TTL_SECONDS: float = 3600.0
+    # Worker processes that embed for ingestion, so bulk ingestion doesn't share the chat
+    # embedding engine (0 = embed in-process with the shared engine)
+    EMBEDDING_PROCESS_WORKERS: int = 1
+    EMBEDDING_PROCESS_SHARD_SIZE: int = 64
+    # In-memory / local-index embedding storage: "float32", "float16" or "int8" (per-vector scale)
+    EMBEDDING_STORAGE_DTYPE: str = "int8"
+
+    # Vector index backend: "pinecone", "local" (exact) or "local_ivf" (approximate)
+    VECTOR_BACKEND: str = "pinecone"
+    LOCAL_INDEX_PATH: str = "./data/vector_index"
+    IVF_NPROBE: int = 8
+    IVF_MIN_TRAIN_SIZE: int = 10000
+    # Local docstore for chunk/memory text and vectors; the index then returns ids and scores only.
+    # Must be shared by all processes using the index.
+    DOCSTORE_ENABLED: bool = False
+    DOCSTORE_PATH: str = "./data/docstore.sqlite3"
+    # Vector index I/O runs in its own bounded thread pool
+    VECTOR_IO_MAX_WORKERS: int = 16
+    # Ingestion writes (upserts, relinks, deletes) use their own pool so they never queue ahead of chat queries
+    INGEST_IO_MAX_WORKERS: int = 4
+
+    # In-process BM25 index over chunk text: exact identifier lookups and hybrid retrieval
+    LEXICAL_INDEX_ENABLED: bool = False
+    LEXICAL_INDEX_PATH: str = "./data/lexical_index"
+    # Identifier queries found in at most this many chunks are answered from the lexical index
+    LEXICAL_EXACT_MATCH_MAX_DOCS: int = 10
+    # Fuse lexical and vector candidates (reciprocal rank fusion) before MMR
+    HYBRID_SEARCH_ENABLED: bool = True
+    HYBRID_RRF_K: int = 60
+
+    # Semantic answer cache in front of RAGService
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95
+    ANSWER_CACHE_TTL_SECONDS: float = 3600.0
+    ANSWER_CACHE_MAX_ENTRIES: int = 5000
+    # Detailed-mode QueryPlan cache, keyed by query similarity and request metadata;
+    # lookups below the threshold plan live
+    PLAN_CACHE_ENABLED: bool = True
+    PLAN_CACHE_SIMILARITY_THRESHOLD: float = 0.92
+    PLAN_CACHE_TTL_SECONDS: float = 3600.0
+    PLAN_CACHE_MAX_ENTRIES: int = 5000
+
+    # Prompt token budget for memories, knowledge chunks and history
+    CONTEXT_TOKEN_BUDGET: int = 6000
+    CONTEXT_HISTORY_TURNS: int = 3
+    # Merge the previous/next chunks of retrieved hits into the context (one batched fetch)
+    CONTEXT_NEIGHBOR_EXPANSION: bool = False
+    CONTEXT_NEIGHBOR_TOKEN_BUDGET: int = 1024
+
+    # Chat history: messages loaded per turn, and sessions kept in the in-process ring buffer
+    CHAT_HISTORY_WINDOW: int = 10
+    CHAT_HISTORY_CACHE_SESSIONS: int = 10000
+
+    # Write-behind queue for memory upserts and assistant messages
+    WRITE_BEHIND_ENABLED: bool = True
+    WRITE_BEHIND_QUEUE_SIZE: int = 10000
+    WRITE_BEHIND_MAX_BATCH_SIZE: int = 64
+    WRITE_BEHIND_MAX_WAIT_MS: float = 20.0
+    WRITE_BEHIND_MAX_RETRIES: int = 3
+    WRITE_BEHIND_RETRY_BACKOFF_S: float = 0.5
+
+    # Ingestion: chunking and the streaming pipeline's batch / concurrency limits
+    INGEST_CHUNK_SIZE: int = 1000
+    INGEST_CHUNK_OVERLAP: int = 200
+    INGEST_READ_BLOCK_BYTES: int = 1024 * 1024
+    INGEST_BATCH_SIZE: int = 64
+    INGEST_MAX_INFLIGHT_BATCHES: int = 2
+    INGEST_METADATA_CONCURRENCY: int = 8
+    # Background ingestion jobs: worker tasks and where uploads are spooled (with several
+    # app processes, the spool directory must be shared by all of them)
+    INGEST_JOB_WORKERS: int = 2
+    INGEST_SPOOL_PATH: str = "./data/ingestion_spool"
+    # A running job's runner renews its lease every heartbeat; jobs whose lease expired
+    # (runner died) are picked up by another runner
+    INGEST_JOB_LEASE_SECONDS: float = 60.0
+    INGEST_JOB_HEARTBEAT_SECONDS: float = 15.0
+    # Per-source chunk manifests used for incremental re-ingestion
+    INGEST_MANIFEST_PATH: str = "./data/ingestion_manifests"
+    # Metadata extraction packs several chunks per LLM request within this token budget
+    INGEST_METADATA_BATCHING: bool = True
+    INGEST_METADATA_BATCH_TOKENS: int = 4000
+    INGEST_METADATA_MAX_BATCH_SIZE: int = 16
+
+    # Client-side LLM scheduler: provider limits, adaptive concurrency and retries
+    LLM_REQUESTS_PER_MINUTE: int = 500
+    LLM_TOKENS_PER_MINUTE: int = 200000
+    LLM_MAX_CONCURRENCY: int = 32
+    LLM_MIN_CONCURRENCY: int = 2
+    LLM_TARGET_LATENCY_S: float = 20.0
+    # Share of the concurrency limit bulk (ingestion) calls may use
+    LLM_BULK_MAX_SHARE: float = 0.75
+    LLM_EXPECTED_OUTPUT_TOKENS: int = 512
+    LLM_MAX_RETRIES: int = 5
+    LLM_BACKOFF_BASE_S: float = 0.5
+    LLM_BACKOFF_MAX_S: float = 30.0
+
+    # Run a dummy encode / vector / LLM call before the app reports ready
+    WARMUP_ON_STARTUP: bool = False
 
     class Config:
         env_file = ".env"
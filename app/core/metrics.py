@@ -0,0 +1,52 @@
+"""
+Runtime Metrics
+
+This file keeps lightweight in-process latency metrics, such as
+time-to-first-token and total duration of streamed chat responses,
+so they can be logged and exposed through the stats endpoint.
+"""
+from typing import Dict, Any, List
+from collections import deque
+import threading
+
+
+class LatencyRecorder:
+    """Keeps the most recent samples of a few named latencies and summarizes them."""
+
+    def __init__(self, names: List[str], window: int = 1000):
+        self._samples = {name: deque(maxlen=window) for name in names}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def record(self, **values: float):
+        with self._lock:
+            self._count += 1
+            for name, value in values.items():
+                self._samples[name].append(value)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            summary: Dict[str, Any] = {"count": self._count}
+            for name, samples in self._samples.items():
+                ordered = sorted(samples)
+                if not ordered:
+                    summary[name] = {}
+                    continue
+                summary[name] = {
+                    "avg": sum(ordered) / len(ordered),
+                    "p50": ordered[len(ordered) // 2],
+                    "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                    "max": ordered[-1],
+                }
+            return summary
+
+
+class StreamMetrics(LatencyRecorder):
+    def __init__(self):
+        super().__init__(["ttft_ms", "duration_ms"])
+
+    def record(self, ttft_ms: float, duration_ms: float):
+        super().record(ttft_ms=ttft_ms, duration_ms=duration_ms)
+
+
+stream_metrics = StreamMetrics()
@@ -0,0 +1,67 @@
+"""
+Schema Updates
+
+This file applies the additive schema changes the application depends on to
+an existing database. The project has no migration framework and the original
+tables are created outside the app, so every step here is idempotent: missing
+tables in NEW_TABLES are created, missing columns in ADDED_COLUMNS are added
+and SCHEMA_STATEMENTS use IF NOT EXISTS. It runs at startup when
+DATABASE_AUTO_MIGRATE is on; with it off, apply the same changes once by hand.
+"""
+from typing import List, Tuple
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from app.core.logging import logger
+from app.db.base import Base
+from app.models import IngestionJob
+
+# Tables added by the application itself
+NEW_TABLES = [IngestionJob.__table__]
+
+# (table, column) added to tables that may predate the column
+ADDED_COLUMNS: List[Tuple[str, str]] = [
+    ("ingestion_jobs", "owner"),
+    ("ingestion_jobs", "lease_expires_at"),
+]
+
+# (table the statement needs, DDL); statements for tables that don't exist yet are skipped
+SCHEMA_STATEMENTS: List[Tuple[str, str]] = [
+    # Chat history is read as "latest messages of one session"
+    ("chats", "CREATE INDEX IF NOT EXISTS ix_chats_session_id_created_at ON chats (session_id, created_at)"),
+]
+
+
+def _apply(sync_conn) -> int:
+    applied = 0
+    inspector = inspect(sync_conn)
+    tables = set(inspector.get_table_names())
+
+    missing = [table for table in NEW_TABLES if table.name not in tables]
+    if missing:
+        Base.metadata.create_all(sync_conn, tables=missing)
+        applied += len(missing)
+        tables.update(table.name for table in missing)
+
+    for table_name, column_name in ADDED_COLUMNS:
+        if table_name not in tables:
+            continue
+        if column_name in {c["name"] for c in inspect(sync_conn).get_columns(table_name)}:
+            continue
+        column = Base.metadata.tables[table_name].columns[column_name]
+        column_type = column.type.compile(dialect=sync_conn.dialect)
+        sync_conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"))
+        applied += 1
+
+    for table_name, statement in SCHEMA_STATEMENTS:
+        if table_name not in tables:
+            logger.warning("Schema update skipped, table %s does not exist: %s", table_name, statement)
+            continue
+        sync_conn.execute(text(statement))
+        applied += 1
+    return applied
+
+
+async def apply_schema_updates(engine: AsyncEngine) -> int:
+    """Creates missing tables, columns and indexes; returns how many steps ran."""
+    async with engine.begin() as conn:
+        return await conn.run_sync(_apply)
@@ -2,21 +2,65 @@
 Database Session
 
 This file configures the database connection and session management.
-It creates the SQLAlchemy engine and provides a dependency for getting
+It creates the SQLAlchemy engines and provides dependencies for getting
 database sessions, ensuring efficient connection reuse and transaction handling.
+
+Request handlers use the async engine (aiosqlite for SQLite, asyncpg for
+Postgres) so database I/O never blocks the event loop; the synchronous engine
+remains for scripts and background threads.
 """
+from typing import Any, AsyncGenerator, Dict
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from app.core.config import settings
 
-engine = create_engine(
-    settings.DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
-)
+
+def async_database_url(url: str) -> str:
+    """Maps a sync DATABASE_URL to its async driver (sqlite -> aiosqlite, postgres -> asyncpg)."""
+    if settings.DATABASE_ASYNC_URL:
+        return settings.DATABASE_ASYNC_URL
+    scheme, sep, rest = url.partition("://")
+    if "+" in scheme and not scheme.endswith(("+pysqlite", "+psycopg2", "+psycopg")):
+        return url # already names an (async) driver
+    base = scheme.split("+")[0]
+    if base == "sqlite":
+        return f"sqlite+aiosqlite{sep}{rest}"
+    if base in ("postgresql", "postgres"):
+        return f"postgresql+asyncpg{sep}{rest}"
+    return url
+
+
+def _engine_options(url: str) -> Dict[str, Any]:
+    options: Dict[str, Any] = {"pool_pre_ping": True}
+    if "sqlite" in url:
+        options["connect_args"] = {"check_same_thread": False}
+        if ":memory:" in url or not url.partition("://")[2]:
+            return options # in-memory SQLite uses a single static connection
+    options.update(
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+        pool_recycle=settings.DATABASE_POOL_RECYCLE,
+    )
+    return options
+
+
+engine = create_engine(settings.DATABASE_URL, **_engine_options(settings.DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+ASYNC_DATABASE_URL = async_database_url(settings.DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL))
+# Objects stay usable after commit (no implicit refresh on attribute access)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,4 @@
+from app.models.user import User
+from app.models.session import Session
+from app.models.chat import Chat
+from app.models.ingestion_job import IngestionJob
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, String, DateTime, Text, JSON, Boolean, Integer, Index
+from datetime import datetime
+from app.db.base import Base
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+    # Workers look up unfinished jobs on startup
+    __table_args__ = (
+        Index("ix_ingestion_jobs_status_created_at", "status", "created_at"),
+    )
+
+    id = Column(String, primary_key=True, index=True) # UUID
+    status = Column(String, nullable=False, default="queued") # queued | running | succeeded | failed | cancelled
+    # [{"source_file": ..., "path": ...}] - uploads are spooled to disk so a restarted worker can resume
+    items = Column(JSON, nullable=False)
+    metadata_schema = Column(JSON, nullable=True)
+    system_prompt = Column(Text, nullable=True)
+    items_done = Column(Integer, default=0)
+    progress = Column(JSON, nullable=True) # Summed IngestionProgress counters
+    error = Column(Text, nullable=True)
+    cancel_requested = Column(Boolean, default=False)
+    # Runner (process) working on a running job; it renews the lease while alive,
+    # and running jobs whose lease expired are picked up by another runner
+    owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
@@ -17,3 +17,4 @@ class ChatResponse(BaseModel):
     session_id: str
     chunks_used: List[Dict[str, Any]] = []
     memory_saved: Optional[str] = None
+    cached: bool = False # True when served from the semantic answer cache
@@ -6,7 +6,7 @@ It schemas for creating new documents (requests) and returning document details
 ensuring consistent data structure for document ingestion.
 """
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List, Dict, Any
 
 class DocumentBase(BaseModel):
     title: str
@@ -18,3 +18,11 @@ class DocumentCreate(DocumentBase):
 class DocumentResponse(DocumentBase):
     id: int
     # Metadata
+    # Background job ingesting the document (GET /documents/jobs/{job_id})
+    job_id: Optional[str] = None
+
+class DocumentBatchCreate(BaseModel):
+    """A batch of texts ingested by one background job; `title` is used as the source name."""
+    documents: List[DocumentCreate]
+    metadata_schema: Optional[Dict[str, Any]] = None
+    system_prompt: str = ""
@@ -1,5 +1,7 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Optional, Dict, Any, Union
+from datetime import datetime
+from app.services.compact_embedding import CompactEmbedding
 
 class ChunkMetadata(BaseModel):
     """Metadata extracted from a document chunk."""
@@ -10,9 +12,41 @@ class ChunkMetadata(BaseModel):
 
 class ProcessedChunk(BaseModel):
     """A processed chunk of text with its metadata and embedding."""
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     chunk_id: str
     text: str
     metadata: ChunkMetadata
-    embedding: List[float]
+    # A row of the batch's EmbeddingBatch (no per-float boxing); lists are still accepted
+    embedding: Union[CompactEmbedding, List[float]]
     source_file: str
     date_added: str
+
+class IngestionProgress(BaseModel):
+    """Progress counters of a streaming ingestion run."""
+    source_file: str
+    bytes_read: int = 0
+    chunks_read: int = 0
+    chunks_embedded: int = 0
+    chunks_extracted: int = 0
+    chunks_upserted: int = 0
+    # Incremental re-ingestion
+    chunks_skipped: int = 0
+    chunks_relinked: int = 0
+    chunks_deleted: int = 0
+    batches: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    done: bool = False
+
+class IngestionJobResponse(BaseModel):
+    """Status of a background ingestion job."""
+    job_id: str
+    status: str
+    sources: List[str] = []
+    items_done: int = 0
+    progress: Dict[str, int] = Field(default_factory=dict, description="Chunks read/embedded/extracted/upserted/... over all sources")
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
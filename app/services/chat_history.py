@@ -0,0 +1,145 @@
+"""
+Chat History Service
+
+This service reads and writes chat messages for the conversation history.
+Only the last `window` messages of a session are ever loaded (using the
+`(session_id, created_at)` index on `chats`), and they are kept in a small
+per-session ring buffer that is updated whenever a message is written, so most
+turns don't query the database for history at all.
+
+The buffer is per process: with several worker processes, route a session to
+one worker or set CHAT_HISTORY_CACHE_SESSIONS=0 to always read from the DB.
+"""
+from typing import List, Dict, Any, Optional
+from collections import OrderedDict, deque
+from datetime import datetime
+import threading
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.models import Chat
+
+
+class ChatHistoryRepository:
+    def __init__(self, window: int = settings.CHAT_HISTORY_WINDOW, max_sessions: int = settings.CHAT_HISTORY_CACHE_SESSIONS):
+        self.window = window
+        self.max_sessions = max_sessions
+        self._buffers: "OrderedDict[str, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def recent(self, db: Session, session_id: str) -> List[Dict[str, str]]:
+        """Returns the last `window` messages of the session, oldest first."""
+        messages = self._buffered(session_id)
+        if messages is not None:
+            return messages
+        rows = db.execute(self._window_query(session_id)).all()
+        return self._load(session_id, rows)
+
+    async def arecent(self, db: AsyncSession, session_id: str) -> List[Dict[str, str]]:
+        """Async version of `recent`."""
+        messages = self._buffered(session_id)
+        if messages is not None:
+            return messages
+        rows = (await db.execute(self._window_query(session_id))).all()
+        return self._load(session_id, rows)
+
+    def stage_message(
+        self,
+        db,
+        session_id: str,
+        role: str,
+        content: str,
+        chunks_used: Optional[List[Any]] = None,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        created_at: Optional[datetime] = None,
+    ) -> Chat:
+        """
+        Adds a message to the caller's transaction (sync or async session).
+        Call `record` once that transaction has committed.
+        """
+        msg = Chat(
+            session_id=session_id,
+            role=role,
+            content=content,
+            chunks_used=chunks_used,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens
+        )
+        if created_at is not None:
+            msg.created_at = created_at
+        db.add(msg)
+        return msg
+
+    def record(self, session_id: str, role: str, content: str):
+        """Appends a committed (or write-behind queued) message to the session's buffer, if it is loaded."""
+        with self._lock:
+            buffer = self._buffers.get(session_id)
+            if buffer is not None:
+                buffer.append({"role": role, "content": content})
+                self._buffers.move_to_end(session_id)
+
+    def add_message(self, db: Session, session_id: str, role: str, content: str, **fields) -> Chat:
+        """Stores a message in its own transaction and updates the buffer."""
+        msg = self.stage_message(db, session_id, role, content, **fields)
+        db.commit()
+        self.record(session_id, role, content)
+        return msg
+
+    async def aadd_message(self, db: AsyncSession, session_id: str, role: str, content: str, **fields) -> Chat:
+        """Async version of `add_message`."""
+        msg = self.stage_message(db, session_id, role, content, **fields)
+        await db.commit()
+        self.record(session_id, role, content)
+        return msg
+
+    def forget(self, session_id: str):
+        with self._lock:
+            self._buffers.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "sessions": len(self._buffers),
+                "window": self.window,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _window_query(self, session_id: str):
+        return (
+            select(Chat.role, Chat.content)
+            .where(Chat.session_id == session_id)
+            .order_by(Chat.created_at.desc(), Chat.id.desc())
+            .limit(self.window)
+        )
+
+    def _buffered(self, session_id: str) -> Optional[List[Dict[str, str]]]:
+        with self._lock:
+            buffer = self._buffers.get(session_id)
+            if buffer is not None:
+                self._buffers.move_to_end(session_id)
+                self.hits += 1
+                return list(buffer)
+            self.misses += 1
+            return None
+
+    def _load(self, session_id: str, rows) -> List[Dict[str, str]]:
+        messages = [{"role": role, "content": content} for role, content in reversed(rows)]
+        with self._lock:
+            # A concurrent write may have loaded the session meanwhile; keep that buffer
+            if session_id not in self._buffers:
+                self._remember(session_id, deque(messages, maxlen=self.window))
+        return messages
+
+    def _remember(self, session_id: str, buffer: deque):
+        if self.max_sessions <= 0:
+            return
+        self._buffers[session_id] = buffer
+        while len(self._buffers) > self.max_sessions:
+            self._buffers.popitem(last=False)
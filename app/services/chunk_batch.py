@@ -0,0 +1,164 @@
+"""
+Chunk Batches
+
+This file defines `ChunkBatch`, the columnar form of a batch of document
+chunks used inside ingestion. Instead of one `ProcessedChunk` +
+`ChunkMetadata` Pydantic model per chunk, a batch holds:
+
+- ids and previous/next link ids as lists
+- all chunk texts in one string buffer, with an offsets array
+- embeddings as one EmbeddingBatch (filled in once the batch is encoded)
+- extracted metadata as columns (field name -> list of values)
+- the source file and ingestion date once for the whole batch
+
+It goes from the chunker to the embedder to `VectorStore.aupsert_batch`,
+which builds the index metadata dicts straight from the columns. Pydantic
+models are only built at API boundaries (`to_processed_chunks`).
+"""
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+import numpy as np
+from app.schemas.ingestion import ProcessedChunk, ChunkMetadata
+from app.services.compact_embedding import EmbeddingBatch, as_float_matrix
+
+# Metadata values the index stores as-is; anything else is stored as str()
+_SCALAR_TYPES = (str, int, float, bool)
+
+
+class ChunkBatch:
+    __slots__ = ("ids", "previous_ids", "next_ids", "text_buffer", "offsets", "source_file", "date_added", "embeddings", "columns")
+
+    def __init__(
+        self,
+        ids: List[str],
+        texts: Sequence[str],
+        previous_ids: List[Optional[str]],
+        next_ids: List[Optional[str]],
+        source_file: str,
+        date_added: str = "",
+        embeddings: Optional[EmbeddingBatch] = None,
+        columns: Optional[Dict[str, List[Any]]] = None,
+    ):
+        self.ids = ids
+        self.previous_ids = previous_ids
+        self.next_ids = next_ids
+        self.text_buffer = "".join(texts)
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in texts], out=offsets[1:])
+        self.offsets = offsets
+        self.source_file = source_file
+        self.date_added = date_added
+        self.embeddings = embeddings
+        # Extracted metadata, one list per field (None where a chunk lacks the field)
+        self.columns: Dict[str, List[Any]] = columns or {}
+
+    @classmethod
+    def from_linked(cls, items: Sequence[Tuple[str, str, Optional[str], Optional[str]]], source_file: str, date_added: str = "") -> "ChunkBatch":
+        """Builds a batch from (chunk_id, text, previous_chunk_id, next_chunk_id) tuples."""
+        return cls(
+            ids=[item[0] for item in items],
+            texts=[item[1] for item in items],
+            previous_ids=[item[2] for item in items],
+            next_ids=[item[3] for item in items],
+            source_file=source_file,
+            date_added=date_added,
+        )
+
+    @classmethod
+    def from_processed_chunks(cls, chunks: Sequence[ProcessedChunk]) -> "ChunkBatch":
+        """Columnar copy of API-level chunks (all from one source file and ingestion)."""
+        if any(c.source_file != chunks[0].source_file or c.date_added != chunks[0].date_added for c in chunks):
+            raise ValueError("ChunkBatch chunks must share source_file and date_added")
+        batch = cls(
+            ids=[c.chunk_id for c in chunks],
+            texts=[c.text for c in chunks],
+            previous_ids=[c.metadata.previous_chunk_id for c in chunks],
+            next_ids=[c.metadata.next_chunk_id for c in chunks],
+            source_file=chunks[0].source_file if chunks else "",
+            date_added=chunks[0].date_added if chunks else "",
+            embeddings=EmbeddingBatch.from_float(as_float_matrix([c.embedding for c in chunks])) if chunks else None,
+        )
+        batch.set_metadata([c.metadata.data for c in chunks])
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def text(self, i: int) -> str:
+        return self.text_buffer[self.offsets[i]:self.offsets[i + 1]]
+
+    def texts(self) -> List[str]:
+        bounds = self.offsets.tolist()
+        return [self.text_buffer[bounds[i]:bounds[i + 1]] for i in range(len(self.ids))]
+
+    def set_metadata(self, records: Sequence[Dict[str, Any]]):
+        """Stores per-chunk extracted metadata dicts as columns."""
+        columns: Dict[str, List[Any]] = {}
+        n = len(records)
+        for i, record in enumerate(records):
+            for key, value in record.items():
+                column = columns.get(key)
+                if column is None:
+                    column = columns[key] = [None] * n
+                column[i] = value
+        self.columns = columns
+
+    def metadata_records(self) -> List[Dict[str, Any]]:
+        """Per-chunk extracted metadata (only the fields each chunk has)."""
+        records: List[Dict[str, Any]] = [{} for _ in self.ids]
+        for key, column in self.columns.items():
+            for record, value in zip(records, column):
+                if value is not None:
+                    record[key] = value
+        return records
+
+    def index_vectors(self) -> List[Tuple[str, Any, Dict[str, Any]]]:
+        """
+        (id, embedding, metadata) tuples for the vector index. Extracted fields
+        are flattened into the metadata, non-scalar values stored as str().
+        """
+        if self.embeddings is None:
+            raise ValueError("ChunkBatch has no embeddings yet")
+        # Normalize each column once instead of type-checking per chunk and field
+        flat_columns = {
+            key: [v if v is None or isinstance(v, _SCALAR_TYPES) else str(v) for v in column]
+            for key, column in self.columns.items()
+        }
+        texts = self.texts()
+        vectors = []
+        for i, chunk_id in enumerate(self.ids):
+            metadata = {
+                "text": texts[i],
+                "source_file": self.source_file,
+                "date_added": self.date_added,
+                "previous_chunk_id": self.previous_ids[i] or "",
+                "next_chunk_id": self.next_ids[i] or "",
+                "type": "document_chunk",
+            }
+            for key, column in flat_columns.items():
+                if column[i] is not None:
+                    metadata[key] = column[i]
+            vectors.append((chunk_id, self.embeddings[i], metadata))
+        return vectors
+
+    def to_processed_chunks(self) -> List[ProcessedChunk]:
+        """API-boundary view: one ProcessedChunk per chunk."""
+        records = self.metadata_records()
+        texts = self.texts()
+        return [
+            ProcessedChunk(
+                chunk_id=chunk_id,
+                text=texts[i],
+                metadata=ChunkMetadata(
+                    previous_chunk_id=self.previous_ids[i],
+                    next_chunk_id=self.next_ids[i],
+                    data=records[i],
+                ),
+                embedding=self.embeddings[i],
+                source_file=self.source_file,
+                date_added=self.date_added,
+            )
+            for i, chunk_id in enumerate(self.ids)
+        ]
+
+    def __repr__(self) -> str:
+        return f"ChunkBatch(n={len(self)}, source_file={self.source_file!r}, fields={list(self.columns)})"
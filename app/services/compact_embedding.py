@@ -0,0 +1,213 @@
+"""
+Compact Embeddings
+
+This file provides the in-memory representation of embeddings used between
+the embedding engine, ingestion, the vector index and MMR. Instead of Python
+`List[float]` (a 384-d vector is ~12 KB of boxed floats), vectors are kept in
+NumPy arrays of one of three storage dtypes:
+
+- float32: exact.
+- float16: half the memory of float32; ~3 significant digits per component.
+- int8: a quarter of float32 plus one float32 scale per vector
+  (x ~= codes * scale, scale = max|x| / 127); also the fastest to scan, as
+  NumPy widens int8 faster than float16.
+
+Run benchmarks/embedding_quantization_benchmark.py for memory, accuracy and
+recall of each dtype.
+
+`EmbeddingBatch` holds many vectors (codes matrix + scales) and
+`CompactEmbedding` is one row of it, a view rather than a copy. Both convert
+to float32 only where a computation needs it; `tolist()` is meant for
+boundaries that require JSON (the Pinecone client).
+"""
+from typing import List, Optional, Sequence, Union, Any
+import numpy as np
+from app.core.config import settings
+
+STORAGE_DTYPES = {
+    "float32": np.float32,
+    "float16": np.float16,
+    "int8": np.int8,
+}
+
+# Rows dequantized at a time when scoring; small blocks keep the float32 temporary in cache
+_SCORE_BLOCK_ROWS = 2048
+
+
+def storage_dtype(name: str) -> np.dtype:
+    try:
+        return np.dtype(STORAGE_DTYPES[name])
+    except KeyError:
+        raise ValueError(f"Unknown embedding storage dtype: {name} (expected one of {', '.join(STORAGE_DTYPES)})")
+
+
+def quantize(matrix: np.ndarray, dtype: Union[str, np.dtype]) -> tuple:
+    """Encodes a float (n, dim) matrix as (codes, scales); scales is None unless dtype is int8."""
+    dtype = storage_dtype(dtype) if isinstance(dtype, str) else np.dtype(dtype)
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if dtype != np.int8:
+        return matrix.astype(dtype, copy=False), None
+    scales = np.abs(matrix).max(axis=-1) / 127.0 if matrix.size else np.zeros(matrix.shape[:-1], dtype=np.float32)
+    scales = scales.astype(np.float32)
+    safe = np.where(scales > 0, scales, 1.0)
+    codes = np.rint(matrix / safe[..., None]).clip(-127, 127).astype(np.int8)
+    return codes, scales
+
+
+def dequantize(codes: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+    matrix = np.asarray(codes, dtype=np.float32)
+    if scales is not None:
+        matrix = matrix * np.asarray(scales, dtype=np.float32)[..., None]
+    return matrix
+
+
+def dot(codes: np.ndarray, scales: Optional[np.ndarray], other: np.ndarray) -> np.ndarray:
+    """
+    `dequantize(codes, scales) @ other` for a query vector (dim,) or matrix (dim, k),
+    computed block by block so no full float32 copy of `codes` is made.
+    """
+    other = np.asarray(other, dtype=np.float32)
+    n = codes.shape[0]
+    if codes.dtype == np.float32 and scales is None:
+        return codes @ other
+    out = np.empty((n,) + other.shape[1:], dtype=np.float32)
+    for start in range(0, n, _SCORE_BLOCK_ROWS):
+        end = min(start + _SCORE_BLOCK_ROWS, n)
+        block = codes[start:end].astype(np.float32) @ other
+        if scales is not None:
+            block *= scales[start:end] if block.ndim == 1 else scales[start:end, None]
+        out[start:end] = block
+    return out
+
+
+class CompactEmbedding:
+    """One embedding: a row of codes plus its scale (int8 only)."""
+
+    __slots__ = ("codes", "scale")
+
+    def __init__(self, codes: np.ndarray, scale: Optional[float] = None):
+        self.codes = codes
+        self.scale = scale
+
+    @classmethod
+    def from_float(cls, vector: Sequence[float], dtype: str = settings.EMBEDDING_STORAGE_DTYPE) -> "CompactEmbedding":
+        codes, scales = quantize(np.asarray(vector, dtype=np.float32)[None, :], dtype)
+        return cls(codes[0], None if scales is None else float(scales[0]))
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.codes.dtype
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (4 if self.scale is not None else 0)
+
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+
+    def to_float(self) -> np.ndarray:
+        vector = self.codes.astype(np.float32)
+        if self.scale is not None:
+            vector *= self.scale
+        return vector
+
+    def __array__(self, dtype=None, copy=None):
+        vector = self.to_float()
+        return vector if dtype is None else vector.astype(dtype, copy=False)
+
+    def tolist(self) -> List[float]:
+        return self.to_float().tolist()
+
+    def __repr__(self) -> str:
+        return f"CompactEmbedding(dim={len(self)}, dtype={self.dtype})"
+
+
+class EmbeddingBatch:
+    """A (n, dim) block of embeddings in a storage dtype, with per-vector scales for int8."""
+
+    __slots__ = ("codes", "scales")
+
+    def __init__(self, codes: np.ndarray, scales: Optional[np.ndarray] = None):
+        self.codes = codes
+        self.scales = scales
+
+    @classmethod
+    def from_float(cls, matrix: np.ndarray, dtype: str = settings.EMBEDDING_STORAGE_DTYPE) -> "EmbeddingBatch":
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(0 if matrix.size == 0 else 1, -1)
+        return cls(*quantize(matrix, dtype))
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.codes.dtype
+
+    @property
+    def dim(self) -> int:
+        return self.codes.shape[1] if self.codes.ndim == 2 else 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, np.integer)):
+            return CompactEmbedding(self.codes[i], None if self.scales is None else float(self.scales[i]))
+        return EmbeddingBatch(self.codes[i], None if self.scales is None else self.scales[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def to_float(self) -> np.ndarray:
+        return dequantize(self.codes, self.scales)
+
+    def __array__(self, dtype=None, copy=None):
+        matrix = self.to_float()
+        return matrix if dtype is None else matrix.astype(dtype, copy=False)
+
+    def dot(self, other: np.ndarray) -> np.ndarray:
+        return dot(self.codes, self.scales, other)
+
+    def tolist(self) -> List[List[float]]:
+        return self.to_float().tolist()
+
+    def __repr__(self) -> str:
+        return f"EmbeddingBatch(n={len(self)}, dim={self.dim}, dtype={self.dtype})"
+
+
+def as_float_vector(vector: Any) -> np.ndarray:
+    """A float32 1-D array from a CompactEmbedding, NumPy array or list."""
+    if isinstance(vector, CompactEmbedding):
+        return vector.to_float()
+    return np.asarray(vector, dtype=np.float32).reshape(-1)
+
+
+def as_float_matrix(vectors: Any) -> np.ndarray:
+    """
+    A float32 (n, dim) matrix from an EmbeddingBatch, a 2-D array, or a
+    sequence of CompactEmbeddings / arrays / lists.
+    """
+    if isinstance(vectors, EmbeddingBatch):
+        return vectors.to_float()
+    if isinstance(vectors, np.ndarray):
+        return vectors.astype(np.float32, copy=False)
+    vectors = list(vectors)
+    if not vectors:
+        return np.zeros((0, 0), dtype=np.float32)
+    if all(isinstance(v, CompactEmbedding) for v in vectors):
+        codes = np.stack([v.codes for v in vectors])
+        if vectors[0].scale is None:
+            return codes.astype(np.float32)
+        return dequantize(codes, np.array([v.scale for v in vectors], dtype=np.float32))
+    return np.stack([as_float_vector(v) for v in vectors])
+
+
+def as_list(vector: Any) -> List[float]:
+    """Plain float list for JSON boundaries (e.g. the Pinecone client)."""
+    if isinstance(vector, list):
+        return vector
+    return as_float_vector(vector).tolist()
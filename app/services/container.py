@@ -0,0 +1,184 @@
+"""
+Service Container
+
+This file builds the application's long-lived services once per process.
+The container is created in the FastAPI lifespan, handed to endpoints through
+`app/api/deps.py`, optionally warmed up before the app reports ready, and
+shut down cleanly when the server stops.
+"""
+from typing import Dict, Any
+import time
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.metrics import stream_metrics
+from app.core.concurrency import get_vector_io_pool, get_ingestion_io_pool, shutdown_pools
+from app.db.session import async_engine, AsyncSessionLocal
+from app.db.migrations import apply_schema_updates
+from app.services.embedding_service import get_embedding_engine
+from app.services.embedding_pool import ProcessEmbeddingPool
+from app.services.llm_service import LLMService
+from app.services.vector_index import create_vector_index
+from app.services.vector_store import VectorStore
+from app.services.docstore import DocStore
+from app.services.lexical_index import LexicalIndex
+from app.services.memory_service import MemoryService
+from app.services.rag_service import RAGService
+from app.services.semantic_cache import SemanticCache
+from app.services.plan_cache import PlanCache
+from app.services.ingestion_service import IngestionService
+from app.services.chat_history import ChatHistoryRepository
+from app.services.write_behind import WriteBehindQueue
+from app.services.ingestion_jobs import IngestionJobRunner
+
+
+class ServiceContainer:
+    def __init__(self):
+        self.embedding_engine = get_embedding_engine()
+        self.llm_service = LLMService()
+
+        # One index handle (Pinecone or local) shared by knowledge base and memory
+        self.index = create_vector_index()
+
+        self.io_pool = get_vector_io_pool()
+
+        # Text and vectors of query results are read from here instead of the index
+        self.docstore = DocStore() if settings.DOCSTORE_ENABLED else None
+
+        # BM25 index over knowledge-base text for identifier lookups and hybrid retrieval
+        self.lexical_index = LexicalIndex() if settings.LEXICAL_INDEX_ENABLED else None
+
+        self.vector_store = VectorStore(
+            embedding_engine=self.embedding_engine,
+            index=self.index,
+            io_pool=self.io_pool,
+            # Ingestion writes don't compete with chat queries for index I/O threads
+            write_pool=get_ingestion_io_pool(),
+            docstore=self.docstore,
+            lexical_index=self.lexical_index,
+        )
+        self.memory_service = MemoryService(embedding_engine=self.embedding_engine, index=self.index, io_pool=self.io_pool, docstore=self.docstore)
+        self.answer_cache = SemanticCache(
+            threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+            max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+        ) if settings.ANSWER_CACHE_ENABLED else None
+        # Detailed-mode query plans, reused for similar questions with the same metadata
+        self.plan_cache = PlanCache() if settings.PLAN_CACHE_ENABLED else None
+        self.chat_history = ChatHistoryRepository()
+        # Memory upserts and assistant messages are persisted in the background, in batches
+        self.write_behind = WriteBehindQueue(
+            memory_service=self.memory_service,
+            chat_history=self.chat_history,
+            session_factory=AsyncSessionLocal,
+        ) if settings.WRITE_BEHIND_ENABLED else None
+        self.rag_service = RAGService(
+            memory_service=self.memory_service,
+            vector_store=self.vector_store,
+            llm_service=self.llm_service,
+            answer_cache=self.answer_cache,
+            plan_cache=self.plan_cache,
+            write_behind=self.write_behind,
+        )
+        # Ingestion embeds in worker processes so jobs don't compete with chat for the
+        # embedding engine or the GIL (EMBEDDING_PROCESS_WORKERS=0 shares the chat engine)
+        self.embedding_pool = ProcessEmbeddingPool() if settings.EMBEDDING_PROCESS_WORKERS > 0 else None
+        self.ingestion_service = IngestionService(
+            embedding_engine=self.embedding_pool or self.embedding_engine,
+            llm_service=self.llm_service,
+        )
+        # Background ingestion jobs, run by their own worker tasks
+        self.ingestion_jobs = IngestionJobRunner(
+            ingestion_service=self.ingestion_service,
+            vector_store=self.vector_store,
+            session_factory=AsyncSessionLocal,
+        )
+
+    async def start(self):
+        """Applies schema updates and starts background workers (resuming unfinished ingestion jobs)."""
+        if settings.DATABASE_AUTO_MIGRATE:
+            try:
+                await apply_schema_updates(async_engine)
+            except Exception as e:
+                logger.error("Could not apply schema updates: %s", e)
+        if self.lexical_index is not None and self.docstore is not None and not len(self.lexical_index):
+            # Lexical index enabled on an existing corpus: build it from the docstore
+            try:
+                count = await self.io_pool.run(self.vector_store.rebuild_lexical_index)
+                if count:
+                    logger.info("Built lexical index from the docstore (%d chunks)", count)
+            except Exception as e:
+                logger.error("Could not build lexical index: %s", e)
+        try:
+            await self.ingestion_jobs.start()
+        except Exception as e:
+            logger.error("Could not start ingestion job workers: %s", e)
+
+    async def warmup(self):
+        """
+        Runs a dummy encode, vector-store call and LLM call so the first real
+        request doesn't pay for model loading and connection setup.
+        Failures are logged and do not prevent startup.
+        """
+        started = time.perf_counter()
+
+        try:
+            await self.embedding_engine.aencode("warmup")
+        except Exception as e:
+            logger.warning("Embedding warmup failed: %s", e)
+
+        try:
+            await self.io_pool.run(self.index.describe_index_stats)
+        except Exception as e:
+            logger.warning("Vector store warmup failed: %s", e)
+
+        try:
+            # Cheap authenticated call that opens the HTTP connection pool
+            await self.llm_service.client.models.retrieve(self.llm_service.model)
+        except Exception as e:
+            logger.warning("LLM warmup failed: %s", e)
+
+        logger.info("Service warmup finished in %.0f ms", (time.perf_counter() - started) * 1000)
+
+    async def shutdown(self):
+        """Releases clients and background workers."""
+        await self.ingestion_jobs.close()
+        # Flush queued writes first; they need the embedding engine, index and DB
+        if self.write_behind is not None:
+            try:
+                await self.write_behind.close()
+            except Exception as e:
+                logger.warning("Error flushing write-behind queue: %s", e)
+        try:
+            await self.llm_service.close()
+        except Exception as e:
+            logger.warning("Error closing LLM client: %s", e)
+        self.embedding_engine.close()
+        if self.embedding_pool is not None:
+            self.embedding_pool.close()
+        shutdown_pools()
+        self.index.close()
+        if self.docstore is not None:
+            self.docstore.close()
+        if self.lexical_index is not None:
+            self.lexical_index.close()
+        await async_engine.dispose()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "embedding_engine": self.embedding_engine.stats(),
+            "embedding_pool": self.embedding_pool.stats() if self.embedding_pool is not None else None,
+            "llm_scheduler": self.llm_service.scheduler.stats(),
+            "kb_version": self.vector_store.kb_version,
+            "docstore": self.docstore.stats() if self.docstore is not None else None,
+            "lexical_index": self.lexical_index.stats() if self.lexical_index is not None else None,
+            "chat_stream": stream_metrics.stats(),
+            "chat_history": self.chat_history.stats(),
+            "ingestion_jobs": self.ingestion_jobs.stats(),
+        }
+        if self.write_behind is not None:
+            stats["write_behind"] = self.write_behind.stats()
+        if self.answer_cache is not None:
+            stats["answer_cache"] = self.answer_cache.stats()
+        if self.plan_cache is not None:
+            stats["plan_cache"] = self.plan_cache.stats()
+        return stats
@@ -0,0 +1,135 @@
+"""
+Context Expansion
+
+This service widens retrieved knowledge chunks with their neighbours in the
+source document. Ingestion links every chunk to the previous and next chunk
+(`previous_chunk_id` / `next_chunk_id`); when a hit sits on a chunk boundary,
+the text around it is often what the answer needs.
+
+After MMR selection, the neighbour ids of all hits are collected, deduplicated
+and read with one batched fetch (docstore or index) - no extra similarity
+queries. Neighbours are admitted best hit first while they fit a token budget,
+then every run of adjacent chunks is merged into one context item, dropping the
+INGEST_CHUNK_OVERLAP characters the chunks share so no text appears twice.
+"""
+from typing import List, Dict, Any, Callable, Optional
+from app.core.config import settings
+from app.services.vector_store import VectorStore
+
+
+def overlap_length(left: str, right: str, overlap: int = settings.INGEST_CHUNK_OVERLAP) -> int:
+    """
+    Characters at the start of `right` repeated from the end of `left` (0 when
+    the two chunks don't overlap, e.g. ingested with another overlap setting).
+    """
+    k = min(overlap, len(left), len(right))
+    return k if k and left.endswith(right[:k]) else 0
+
+
+def merge_texts(texts: List[str], overlap: int = settings.INGEST_CHUNK_OVERLAP) -> str:
+    """Joins consecutive chunk texts, keeping their shared overlap once."""
+    if not texts:
+        return ""
+    merged = [texts[0]]
+    for left, right in zip(texts, texts[1:]):
+        k = overlap_length(left, right, overlap)
+        merged.append(right[k:] if k else "\n" + right)
+    return "".join(merged)
+
+
+class NeighborExpander:
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        count_tokens: Callable[[str], int],
+        token_budget: int = settings.CONTEXT_NEIGHBOR_TOKEN_BUDGET,
+        overlap: int = settings.INGEST_CHUNK_OVERLAP,
+    ):
+        self.vector_store = vector_store
+        self.count_tokens = count_tokens
+        # Tokens of neighbour text added per turn, on top of the retrieved chunks
+        self.token_budget = token_budget
+        self.overlap = overlap
+
+    async def aexpand(self, chunks: List[Dict[str, Any]], namespace: str = "knowledge_base") -> List[Dict[str, Any]]:
+        """
+        Returns `chunks` (best first) with neighbours merged in. Hits that are
+        adjacent to each other become one item; each item keeps the id, score
+        and metadata of its best hit, and lists the merged ids in
+        metadata["expanded_chunk_ids"].
+        """
+        if not chunks or self.token_budget <= 0:
+            return chunks
+        by_id = {c["id"]: c for c in chunks}
+
+        # 1. Neighbour ids of all hits, deduplicated, in hit order
+        wanted: List[str] = []
+        for chunk in chunks:
+            for link in ("previous_chunk_id", "next_chunk_id"):
+                neighbor_id = chunk["metadata"].get(link) or ""
+                if neighbor_id and neighbor_id not in by_id and neighbor_id not in wanted:
+                    wanted.append(neighbor_id)
+        if not wanted:
+            return chunks
+
+        # 2. One batched read for all of them
+        neighbors = await self.vector_store.afetch_chunks(wanted, namespace=namespace)
+
+        # 3. Admit neighbours best hit first, counting only the text they add
+        included: Dict[str, Dict[str, Any]] = dict(by_id)
+        remaining = self.token_budget
+        for chunk in chunks:
+            previous = neighbors.get(chunk["metadata"].get("previous_chunk_id") or "")
+            if previous is not None and previous["id"] not in included:
+                k = overlap_length(previous["text"], chunk["text"], self.overlap)
+                cost = self.count_tokens(previous["text"][:len(previous["text"]) - k])
+                if cost <= remaining:
+                    included[previous["id"]] = previous
+                    remaining -= cost
+            following = neighbors.get(chunk["metadata"].get("next_chunk_id") or "")
+            if following is not None and following["id"] not in included:
+                k = overlap_length(chunk["text"], following["text"], self.overlap)
+                cost = self.count_tokens(following["text"][k:])
+                if cost <= remaining:
+                    included[following["id"]] = following
+                    remaining -= cost
+
+        # 4. Merge each run of adjacent chunks into one item, ordered by its best hit
+        rank = {c["id"]: i for i, c in enumerate(chunks)}
+        expanded: List[tuple] = []
+        for chunk_id, chunk in included.items():
+            if (chunk["metadata"].get("previous_chunk_id") or "") in included:
+                continue # Not the start of a run
+            run = [chunk]
+            seen = {chunk_id}
+            next_id = chunk["metadata"].get("next_chunk_id") or ""
+            while next_id in included and next_id not in seen:
+                run.append(included[next_id])
+                seen.add(next_id)
+                next_id = included[next_id]["metadata"].get("next_chunk_id") or ""
+            merged = self._merge_run(run, rank)
+            if merged is not None:
+                expanded.append(merged)
+
+        # Inconsistent links (a cycle, or a run without a hit) can't come from
+        # ingestion; make sure no hit is ever lost to them
+        covered = {cid for _, item in expanded for cid in item["metadata"]["expanded_chunk_ids"]}
+        for chunk in chunks:
+            if chunk["id"] not in covered:
+                expanded.append((rank[chunk["id"]], chunk))
+
+        expanded.sort(key=lambda item: item[0])
+        return [item for _, item in expanded]
+
+    def _merge_run(self, run: List[Dict[str, Any]], rank: Dict[str, int]) -> Optional[tuple]:
+        hits = [c for c in run if c["id"] in rank]
+        if not hits:
+            return None
+        best = min(hits, key=lambda c: rank[c["id"]])
+        item = dict(
+            best,
+            text=merge_texts([c["text"] for c in run], self.overlap),
+            metadata={**best["metadata"], "expanded_chunk_ids": [c["id"] for c in run]},
+        )
+        return rank[best["id"]], item
+
@@ -0,0 +1,141 @@
+"""
+Context Packer
+
+This service fits retrieved context into a fixed prompt token budget.
+It counts tokens with the LLM's tiktoken encoding, caches per-item counts
+(chunks and memories are re-used across turns), and keeps the most relevant
+items by retrieval score, trimming the last one that only partially fits
+instead of letting the prompt grow without bound.
+"""
+from typing import List, Dict, Any, Optional, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import hashlib
+import threading
+from app.core.config import settings
+
+# Tokens added per item by the prompt formatting ("[i] ", "- ", role prefix, newline)
+_ITEM_OVERHEAD_TOKENS = 4
+
+
+@dataclass
+class PackedContext:
+    memories: List[Dict[str, Any]] = field(default_factory=list)
+    knowledge_chunks: List[Dict[str, Any]] = field(default_factory=list)
+    history: List[Dict[str, Any]] = field(default_factory=list)
+    tokens: int = 0
+    dropped: int = 0
+    trimmed: int = 0
+
+
+class ContextPacker:
+    def __init__(
+        self,
+        encoding,
+        token_budget: int = settings.CONTEXT_TOKEN_BUDGET,
+        history_turns: int = settings.CONTEXT_HISTORY_TURNS,
+        history_share: float = 0.25,
+        min_trim_tokens: int = 48,
+        cache_size: int = 50000,
+    ):
+        self.encoding = encoding
+        self.token_budget = token_budget
+        self.history_turns = history_turns
+        self.history_share = history_share
+        self.min_trim_tokens = min_trim_tokens
+        self.cache_size = cache_size
+        self._counts: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, text: str, key: Optional[str] = None) -> int:
+        """Token count of `text`, cached under `key` (or a hash of the text)."""
+        cache_key = f"{key}:{len(text)}" if key else hashlib.sha1(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            cached = self._counts.get(cache_key)
+            if cached is not None:
+                self._counts.move_to_end(cache_key)
+                return cached
+        n = len(self.encoding.encode(text))
+        with self._lock:
+            self._counts[cache_key] = n
+            if len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+        return n
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        tokens = self.encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return self.encoding.decode(tokens[:max_tokens])
+
+    def pack(self, fixed_text: str, memories: List[Dict], knowledge_chunks: List[Dict], recent_history: List[Dict]) -> PackedContext:
+        """
+        `fixed_text` is everything always sent (system prompt, template, query).
+        History gets up to `history_share` of what remains, newest turns first;
+        memories and knowledge chunks then compete for the rest by score.
+        Kept items retain their original order.
+        """
+        packed = PackedContext()
+        used = self.count(fixed_text)
+        remaining = max(0, self.token_budget - used)
+
+        # Conversation history (most recent turns first)
+        history_budget = int(remaining * self.history_share)
+        kept_history: List[Dict[str, Any]] = []
+        for msg in reversed(recent_history[-self.history_turns:] if self.history_turns else []):
+            content = msg.get("content", "")
+            cost = self.count(content) + _ITEM_OVERHEAD_TOKENS
+            if cost <= history_budget:
+                kept_history.append(msg)
+                history_budget -= cost
+                used += cost
+            elif history_budget - _ITEM_OVERHEAD_TOKENS >= self.min_trim_tokens:
+                trimmed = dict(msg, content="..." + self._truncate_head(content, history_budget - _ITEM_OVERHEAD_TOKENS))
+                kept_history.append(trimmed)
+                used += history_budget
+                history_budget = 0
+                packed.trimmed += 1
+            else:
+                packed.dropped += 1
+                break
+        packed.history = list(reversed(kept_history))
+        remaining = max(0, self.token_budget - used)
+
+        # Memories and knowledge chunks, best score first
+        candidates: List[Tuple[float, int, str, Dict[str, Any]]] = []
+        for i, m in enumerate(memories):
+            candidates.append((m.get("score") or 0.0, i, "memory", m))
+        for i, c in enumerate(knowledge_chunks):
+            candidates.append((c.get("score") or 0.0, i, "chunk", c))
+        candidates.sort(key=lambda item: -item[0])
+
+        kept: Dict[str, Dict[int, Dict[str, Any]]] = {"memory": {}, "chunk": {}}
+        for score, i, kind, item in candidates:
+            text = item.get("text", "")
+            cost = self.count(text, key=item.get("id")) + _ITEM_OVERHEAD_TOKENS
+            if kind == "memory":
+                cost += 8 # "(Date: ...)" suffix
+            if cost <= remaining:
+                kept[kind][i] = item
+                remaining -= cost
+                used += cost
+            elif remaining - _ITEM_OVERHEAD_TOKENS >= self.min_trim_tokens and kind == "chunk":
+                # Trim the best chunk that doesn't fit to the space left
+                kept[kind][i] = dict(item, text=self.truncate(text, remaining - _ITEM_OVERHEAD_TOKENS), truncated=True)
+                used += remaining
+                remaining = 0
+                packed.trimmed += 1
+            else:
+                packed.dropped += 1
+
+        packed.memories = [kept["memory"][i] for i in sorted(kept["memory"])]
+        packed.knowledge_chunks = [kept["chunk"][i] for i in sorted(kept["chunk"])]
+        packed.tokens = used
+        return packed
+
+    def _truncate_head(self, text: str, max_tokens: int) -> str:
+        """Keeps the end of `text` (the most recent part of a long message)."""
+        tokens = self.encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return self.encoding.decode(tokens[-max_tokens:])
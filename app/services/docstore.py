@@ -0,0 +1,212 @@
+"""
+Document Store
+
+This service keeps the payload of knowledge-base chunks and memories locally,
+keyed by (namespace, id): their text, their (compact) embedding and their full
+metadata. With it enabled (DOCSTORE_ENABLED), the vector index only holds the
+vectors plus the filterable metadata, so queries ask the index for ids and
+scores alone and the text and vectors of the results are read here with one
+batched SQLite query.
+
+Ids the docstore does not know (e.g. written before it was enabled) are
+fetched from the index once and backfilled. The docstore must be shared by
+every process that writes or reads the index, like the local index backends.
+"""
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
+from dataclasses import dataclass, field
+import json
+import os
+import sqlite3
+import threading
+import numpy as np
+from app.core.config import settings
+from app.core.logging import logger
+from app.services.compact_embedding import CompactEmbedding, storage_dtype
+from app.services.vector_index import IndexMatch, VectorIndex
+
+# SQLite limits the number of bound parameters per statement
+_MAX_PARAMS = 500
+
+
+@dataclass
+class StoredDoc:
+    id: str
+    text: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    embedding: Optional[CompactEmbedding] = None
+
+
+class DocStore:
+    def __init__(self, path: Optional[str] = settings.DOCSTORE_PATH, dtype: str = settings.EMBEDDING_STORAGE_DTYPE):
+        # path=None keeps documents in an in-memory database (useful for tests)
+        self.path = path
+        self.dtype = dtype
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            if path is not None:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS docs ("
+                " namespace TEXT NOT NULL, id TEXT NOT NULL, text TEXT NOT NULL, metadata TEXT NOT NULL,"
+                " dtype TEXT, scale REAL, vector BLOB,"
+                " PRIMARY KEY (namespace, id)) WITHOUT ROWID"
+            )
+
+    # -- Writes ---------------------------------------------------------------
+
+    def put_many(self, namespace: str, records: Iterable[Tuple[str, Any, Dict[str, Any]]]):
+        """
+        Stores (id, embedding, metadata) records, as upserted to the index. The
+        metadata's "text" goes to its own column.
+        """
+        rows = []
+        for vid, embedding, metadata in records:
+            metadata = dict(metadata)
+            text = metadata.pop("text", "")
+            if embedding is not None and not isinstance(embedding, CompactEmbedding):
+                embedding = CompactEmbedding.from_float(embedding, self.dtype)
+            rows.append((
+                namespace, vid, text, json.dumps(metadata),
+                None if embedding is None else embedding.dtype.name,
+                None if embedding is None else embedding.scale,
+                None if embedding is None else np.ascontiguousarray(embedding.codes).tobytes(),
+            ))
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def update_metadata(self, namespace: str, updates: List[Tuple[str, Dict[str, Any]]]):
+        """Merges each (id, set_metadata) into the stored metadata of that id."""
+        if not updates:
+            return
+        with self._lock, self._conn:
+            current = self._select(namespace, [vid for vid, _ in updates], "id, metadata")
+            stored = {vid: json.loads(metadata) for vid, metadata in current}
+            self._conn.executemany(
+                "UPDATE docs SET metadata = ? WHERE namespace = ? AND id = ?",
+                [
+                    (json.dumps({**stored[vid], **set_metadata}), namespace, vid)
+                    for vid, set_metadata in updates if vid in stored
+                ],
+            )
+
+    def delete(self, namespace: str, ids: List[str]):
+        if not ids:
+            return
+        with self._lock, self._conn:
+            for start in range(0, len(ids), _MAX_PARAMS):
+                batch = ids[start:start + _MAX_PARAMS]
+                self._conn.execute(
+                    f"DELETE FROM docs WHERE namespace = ? AND id IN ({','.join('?' * len(batch))})",
+                    [namespace, *batch],
+                )
+
+    # -- Reads ----------------------------------------------------------------
+
+    def _select(self, namespace: str, ids: List[str], columns: str) -> List[tuple]:
+        rows = []
+        for start in range(0, len(ids), _MAX_PARAMS):
+            batch = ids[start:start + _MAX_PARAMS]
+            rows.extend(self._conn.execute(
+                f"SELECT {columns} FROM docs WHERE namespace = ? AND id IN ({','.join('?' * len(batch))})",
+                [namespace, *batch],
+            ).fetchall())
+        return rows
+
+    def get_many(self, namespace: str, ids: List[str], with_vectors: bool = False) -> Dict[str, StoredDoc]:
+        """Reads the given ids in one batched query; unknown ids are left out."""
+        if not ids:
+            return {}
+        columns = "id, text, metadata, dtype, scale, vector" if with_vectors else "id, text, metadata"
+        with self._lock:
+            rows = self._select(namespace, list(dict.fromkeys(ids)), columns)
+        docs = {}
+        for row in rows:
+            embedding = None
+            if with_vectors and row[5] is not None:
+                embedding = CompactEmbedding(np.frombuffer(row[5], dtype=storage_dtype(row[3])), row[4])
+            docs[row[0]] = StoredDoc(id=row[0], text=row[1], metadata=json.loads(row[2]), embedding=embedding)
+        return docs
+
+    def iter_texts(self, namespace: str, batch_size: int = 1000) -> Iterator[List[Tuple[str, str, Dict[str, Any]]]]:
+        """All (id, text, metadata) of a namespace, in batches (e.g. to rebuild a derived index)."""
+        last_id = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, text, metadata FROM docs WHERE namespace = ? AND id > ? ORDER BY id LIMIT ?",
+                    (namespace, last_id, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            yield [(vid, text, json.loads(metadata)) for vid, text, metadata in rows]
+            last_id = rows[-1][0]
+
+    def hydrate(self, index: VectorIndex, matches: List[IndexMatch], namespace: str = "", include_values: bool = False) -> List[IndexMatch]:
+        """
+        Fills id/score matches from an index query with their text (in
+        metadata["text"], as before), metadata and, optionally, vectors.
+        Ids missing here are fetched from the index and backfilled.
+        """
+        return self.hydrate_many(index, [matches], namespace, include_values)[0]
+
+    def hydrate_many(self, index: VectorIndex, match_lists: List[List[IndexMatch]], namespace: str = "", include_values: bool = False) -> List[List[IndexMatch]]:
+        """`hydrate` for the results of several queries, with one read for all of them."""
+        ids = [m.id for matches in match_lists for m in matches]
+        if not ids:
+            return [[] for _ in match_lists]
+        docs = self.get_many(namespace, ids, with_vectors=include_values)
+        missing = list(dict.fromkeys(vid for vid in ids if vid not in docs))
+        if missing:
+            docs.update(self._backfill(index, missing, namespace, include_values))
+
+        return [
+            [
+                IndexMatch(
+                    id=m.id,
+                    score=m.score,
+                    values=docs[m.id].embedding if include_values else None,
+                    metadata={**docs[m.id].metadata, "text": docs[m.id].text},
+                )
+                for m in matches if m.id in docs
+            ]
+            for matches in match_lists
+        ]
+
+    def _backfill(self, index: VectorIndex, ids: List[str], namespace: str, include_values: bool) -> Dict[str, StoredDoc]:
+        fetched = index.fetch(ids, namespace=namespace)
+        records = [(vid, found.values, found.metadata) for vid, found in fetched.items() if "text" in found.metadata]
+        if records:
+            logger.info("Backfilling %d documents into the docstore (namespace %r)", len(records), namespace)
+            self.put_many(namespace, records)
+        docs = {}
+        for vid, found in fetched.items():
+            metadata = dict(found.metadata)
+            text = metadata.pop("text", "")
+            embedding = None
+            if include_values and found.values is not None:
+                embedding = found.values if isinstance(found.values, CompactEmbedding) else CompactEmbedding.from_float(found.values, self.dtype)
+            docs[vid] = StoredDoc(id=vid, text=text, metadata=metadata, embedding=embedding)
+        return docs
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+        return {
+            "documents": count,
+            "bytes": os.path.getsize(self.path) if self.path is not None and os.path.exists(self.path) else None,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def index_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """The metadata kept in the vector index when a docstore holds the text."""
+    return {k: v for k, v in metadata.items() if k != "text"}
@@ -0,0 +1,271 @@
+"""
+Embedding Process Pool
+
+This service is an opt-in, multi-process embedding backend for corpus-scale
+ingestion. Encoding is CPU-bound and holds the GIL, so a large backfill on the
+in-process EmbeddingEngine pegs one core of the API process. The pool instead
+shards batches of texts across N worker processes that each load the model
+once, and each worker writes its embeddings into a shared-memory buffer owned
+by the parent, so results are copied straight into a numpy array instead of
+being pickled back.
+
+It provides the parts of the EmbeddingEngine interface ingestion uses
+(`submit`, `encode`, `aencode`, `model_name`, `normalized`, `stats`, `close`)
+and produces the same L2-normalized float32 vectors. Enable it with
+EMBEDDING_PROCESS_WORKERS > 0.
+"""
+from typing import List, Dict, Any, Optional, Union
+from concurrent.futures import Future
+from collections import deque
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+import asyncio
+import itertools
+import multiprocessing as mp
+import os
+import threading
+import time
+import numpy as np
+from app.core.config import settings
+from app.core.logging import logger
+
+
+def _worker_main(worker_id: int, model_name: str, shard_size: int, threads: int, tasks, results):
+    """Worker process: loads the model, then encodes shards into the parent's shared buffer."""
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    try:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(model_name, device="cpu")
+        dim = model.get_sentence_embedding_dimension()
+    except Exception as e:
+        results.put(("failed", worker_id, repr(e)))
+        return
+    results.put(("ready", worker_id, dim))
+
+    shm = None
+    buffer = None
+    try:
+        while True:
+            message = tasks.get()
+            if message is None:
+                return
+            if message[0] == "attach":
+                shm = shared_memory.SharedMemory(name=message[1])
+                buffer = np.ndarray((shard_size, dim), dtype=np.float32, buffer=shm.buf)
+                continue
+            _, task_id, texts = message
+            try:
+                buffer[:len(texts)] = model.encode(
+                    texts,
+                    batch_size=len(texts),
+                    convert_to_numpy=True,
+                    normalize_embeddings=True,
+                    show_progress_bar=False,
+                )
+                results.put(("done", worker_id, task_id, len(texts)))
+            except Exception as e:
+                results.put(("error", worker_id, task_id, repr(e)))
+    finally:
+        buffer = None
+        if shm is not None:
+            shm.close()
+
+
+@dataclass
+class _Job:
+    """One submit() call; its shards are encoded independently and copied into `output`."""
+    size: int
+    single: bool
+    future: Future
+    remaining: int
+    output: Optional[np.ndarray] = None
+    failed: bool = False
+
+
+class ProcessEmbeddingPool:
+    # encode() always L2-normalizes, so dot product == cosine similarity
+    normalized = True
+
+    def __init__(
+        self,
+        num_workers: int = settings.EMBEDDING_PROCESS_WORKERS,
+        model_name: str = settings.EMBEDDING_MODEL_NAME,
+        shard_size: int = settings.EMBEDDING_PROCESS_SHARD_SIZE,
+        threads_per_worker: Optional[int] = None,
+    ):
+        self.model_name = model_name
+        self.num_workers = max(1, num_workers)
+        self.shard_size = max(1, shard_size)
+        threads = threads_per_worker or max(1, (os.cpu_count() or 1) // self.num_workers)
+
+        self._lock = threading.Lock()
+        self._closed = False
+        self._dim: Optional[int] = None
+        self._buffers: Dict[int, shared_memory.SharedMemory] = {}
+        self._idle: deque = deque()
+        self._failed_workers = 0
+        # (job, start offset, texts) waiting for an idle worker
+        self._pending: deque = deque()
+        # worker id -> (task id, job, start offset) being encoded
+        self._assigned: Dict[int, tuple] = {}
+        self._task_ids = itertools.count()
+
+        # Stats
+        self._texts = 0
+        self._shards = 0
+        self._started = time.perf_counter()
+
+        # spawn: workers must not inherit the parent's threads or model state
+        ctx = mp.get_context("spawn")
+        self._results = ctx.Queue()
+        self._task_queues = [ctx.Queue() for _ in range(self.num_workers)]
+        self._processes = [
+            ctx.Process(
+                target=_worker_main,
+                args=(i, model_name, self.shard_size, threads, self._task_queues[i], self._results),
+                name=f"embedding-pool-{i}",
+                daemon=True,
+            )
+            for i in range(self.num_workers)
+        ]
+        for process in self._processes:
+            process.start()
+        self._collector = threading.Thread(target=self._collect, name="embedding-pool-collector", daemon=True)
+        self._collector.start()
+        logger.info("Started embedding process pool with %d workers (%d threads each)", self.num_workers, threads)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def dimension(self) -> Optional[int]:
+        return self._dim
+
+    def submit(self, texts: Union[str, List[str]]) -> Future:
+        """Queues texts for encoding; resolves to a 1-D vector for a string, a 2-D matrix for a list."""
+        if self._closed:
+            raise RuntimeError("ProcessEmbeddingPool is closed")
+        future: Future = Future()
+        single = isinstance(texts, str)
+        text_list = [texts] if single else list(texts)
+        if not text_list:
+            future.set_result(np.empty((0, 0), dtype=np.float32))
+            return future
+
+        shards = [(start, text_list[start:start + self.shard_size]) for start in range(0, len(text_list), self.shard_size)]
+        job = _Job(size=len(text_list), single=single, future=future, remaining=len(shards))
+        with self._lock:
+            if self._failed_workers == self.num_workers:
+                future.set_exception(RuntimeError("All embedding pool workers failed to start"))
+                return future
+            for start, shard in shards:
+                self._pending.append((job, start, shard))
+            self._dispatch()
+        return future
+
+    def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        return self.submit(texts).result()
+
+    async def aencode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        return await asyncio.wrap_future(self.submit(texts))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = time.perf_counter() - self._started
+            return {
+                "model_name": self.model_name,
+                "num_workers": self.num_workers,
+                "ready_workers": len(self._buffers),
+                "busy_workers": len(self._assigned),
+                "pending_shards": len(self._pending),
+                "shard_size": self.shard_size,
+                "texts": self._texts,
+                "shards": self._shards,
+                "texts_per_s": self._texts / elapsed if elapsed > 0 else 0.0,
+            }
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """Stops the workers and releases the shared buffers."""
+        if self._closed:
+            return
+        self._closed = True
+        for tasks in self._task_queues:
+            tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=timeout)
+            if process.is_alive():
+                process.terminate()
+        self._results.put(None)
+        self._collector.join(timeout=timeout)
+        with self._lock:
+            for job, _, _ in self._pending:
+                self._fail(job, RuntimeError("ProcessEmbeddingPool closed"))
+            self._pending.clear()
+            for shm in self._buffers.values():
+                shm.close()
+                shm.unlink()
+            self._buffers.clear()
+
+    # -- Internals (called with self._lock held) ------------------------------
+
+    def _dispatch(self):
+        while self._pending and self._idle:
+            job, start, shard = self._pending.popleft()
+            if job.failed:
+                continue
+            worker_id = self._idle.popleft()
+            task_id = next(self._task_ids)
+            self._assigned[worker_id] = (task_id, job, start)
+            self._task_queues[worker_id].put(("encode", task_id, shard))
+
+    def _fail(self, job: _Job, error: Exception):
+        if not job.failed:
+            job.failed = True
+            if not job.future.done():
+                job.future.set_exception(error)
+
+    def _collect(self):
+        while True:
+            message = self._results.get()
+            if message is None:
+                return
+            kind, worker_id = message[0], message[1]
+            with self._lock:
+                if kind == "ready":
+                    dim = message[2]
+                    self._dim = self._dim or dim
+                    shm = shared_memory.SharedMemory(create=True, size=self.shard_size * dim * 4)
+                    self._buffers[worker_id] = shm
+                    self._task_queues[worker_id].put(("attach", shm.name))
+                    self._idle.append(worker_id)
+                elif kind == "failed":
+                    logger.error("Embedding pool worker %d failed to start: %s", worker_id, message[2])
+                    self._failed_workers += 1
+                    if self._failed_workers == self.num_workers:
+                        for job, _, _ in self._pending:
+                            self._fail(job, RuntimeError(f"Embedding pool workers failed to start: {message[2]}"))
+                        self._pending.clear()
+                else:
+                    _, job, start = self._assigned.pop(worker_id)
+                    if kind == "done":
+                        n = message[3]
+                        if job.output is None:
+                            job.output = np.empty((job.size, self._dim), dtype=np.float32)
+                        view = np.ndarray((self.shard_size, self._dim), dtype=np.float32, buffer=self._buffers[worker_id].buf)
+                        # Copy out before the worker may reuse its buffer
+                        job.output[start:start + n] = view[:n]
+                        del view
+                        self._texts += n
+                        self._shards += 1
+                        job.remaining -= 1
+                        if job.remaining == 0 and not job.failed and not job.future.done():
+                            job.future.set_result(job.output[0] if job.single else job.output)
+                    else:
+                        self._fail(job, RuntimeError(f"Embedding pool worker {worker_id} failed: {message[3]}"))
+                    self._idle.append(worker_id)
+                self._dispatch()
@@ -0,0 +1,304 @@
+"""
+Embedding Service
+
+This service owns the process-wide sentence embedding model.
+Instead of every service loading its own SentenceTransformer and encoding one
+string at a time, callers submit texts to a shared EmbeddingEngine which gathers
+concurrent requests into micro-batches and resolves a future per caller.
+"""
+from typing import List, Dict, Any, Optional, Union
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+import asyncio
+import queue
+import threading
+import time
+import numpy as np
+from app.core.config import settings
+from app.core.logging import logger
+from app.services.embedding_cache import EmbeddingCache, normalize_text
+
+# Upper bounds of the batch-size histogram buckets reported by stats()
+_BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+
+
+@dataclass
+class _EncodeRequest:
+    texts: List[str]
+    single: bool
+    future: Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class EmbeddingEngine:
+    """
+    Shared embedding model with dynamic micro-batching.
+
+    Requests are queued and drained by `num_workers` background threads; each
+    waits at most `max_wait_ms` for more requests to arrive, up to
+    `max_batch_size` texts, and then runs a single forward pass for the batch.
+    The worker count bounds how many encodes run concurrently.
+    """
+
+    def __init__(
+        self,
+        model_name: str = settings.EMBEDDING_MODEL_NAME,
+        max_batch_size: int = settings.EMBEDDING_MAX_BATCH_SIZE,
+        max_wait_ms: float = settings.EMBEDDING_MAX_WAIT_MS,
+        num_workers: int = settings.EMBEDDING_NUM_WORKERS,
+        cache: Optional[EmbeddingCache] = None,
+    ):
+        self.model_name = model_name
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[_EncodeRequest]]" = queue.Queue()
+        self._closed = False
+
+        # Query-embedding cache, plus in-flight misses so concurrent callers share one encode
+        self.cache = cache or EmbeddingCache(
+            max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+            max_bytes=settings.EMBEDDING_CACHE_MAX_BYTES,
+            ttl_seconds=settings.EMBEDDING_CACHE_TTL_SECONDS,
+        )
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+
+        # Stats
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._texts = 0
+        self._requests = 0
+        self._max_batch_seen = 0
+        self._total_wait = 0.0
+        self._total_encode = 0.0
+        self._histogram = [0] * (len(_BATCH_SIZE_BUCKETS) + 1)
+
+        self._workers = [
+            threading.Thread(target=self._run, name=f"embedding-engine-{i}", daemon=True)
+            for i in range(max(1, num_workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def model(self):
+        """Lazily loads the SentenceTransformer so importing this module stays cheap."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    logger.info("Loading embedding model %s", self.model_name)
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    # encode() always L2-normalizes, so dot product == cosine similarity
+    normalized = True
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def submit(self, texts: Union[str, List[str]]) -> Future:
+        """
+        Queues texts for encoding and returns a future resolving to a numpy array.
+        A single string resolves to a 1-D vector, a list to a 2-D matrix.
+        """
+        if self._closed:
+            raise RuntimeError("EmbeddingEngine is closed")
+
+        future: Future = Future()
+        single = isinstance(texts, str)
+        text_list = [texts] if single else list(texts)
+        if not text_list:
+            future.set_result(np.empty((0, 0), dtype=np.float32))
+            return future
+
+        self._queue.put(_EncodeRequest(texts=text_list, single=single, future=future))
+        return future
+
+    def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        """Blocking encode, drop-in replacement for SentenceTransformer.encode."""
+        return self.submit(texts).result()
+
+    async def aencode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        """Awaitable encode; the forward pass runs on the engine's worker threads."""
+        return await asyncio.wrap_future(self.submit(texts))
+
+    def submit_query(self, text: str) -> Future:
+        """
+        Cached single-query encode. The text is normalized, looked up in the cache
+        and only encoded on a miss; identical concurrent misses share one future.
+        """
+        key = normalize_text(text)
+        cached = self.cache.get(self.model_name, key)
+        if cached is not None:
+            future: Future = Future()
+            future.set_result(cached)
+            return future
+
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            future = self.submit(key)
+            self._inflight[key] = future
+
+        def _store(done: Future):
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            if not done.cancelled() and done.exception() is None:
+                self.cache.put(self.model_name, key, done.result())
+
+        future.add_done_callback(_store)
+        return future
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """Blocking cached query encode."""
+        return self.submit_query(text).result()
+
+    async def aembed_query(self, text: str) -> np.ndarray:
+        """Awaitable cached query encode."""
+        return await asyncio.wrap_future(self.submit_query(text))
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns queue-depth and batch-size statistics for tuning."""
+        with self._stats_lock:
+            histogram = {}
+            lower = 1
+            for upper, count in zip(_BATCH_SIZE_BUCKETS, self._histogram):
+                histogram[f"{lower}-{upper}" if lower != upper else str(upper)] = count
+                lower = upper + 1
+            histogram[f"{lower}+"] = self._histogram[-1]
+
+            return {
+                "model_name": self.model_name,
+                "queue_depth": self._queue.qsize(),
+                "num_workers": len(self._workers),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "requests": self._requests,
+                "batches": self._batches,
+                "texts": self._texts,
+                "avg_batch_size": self._texts / self._batches if self._batches else 0.0,
+                "max_batch_size_seen": self._max_batch_seen,
+                "avg_queue_wait_ms": (self._total_wait / self._requests * 1000.0) if self._requests else 0.0,
+                "avg_encode_ms": (self._total_encode / self._batches * 1000.0) if self._batches else 0.0,
+                "batch_size_histogram": histogram,
+                "query_cache": self.cache.stats(),
+            }
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """Stops accepting work, drains the queue and stops the worker."""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout=timeout)
+
+    # -- Worker -----------------------------------------------------------
+
+    def _run(self):
+        pending: Optional[_EncodeRequest] = None
+        while True:
+            first = pending if pending is not None else self._queue.get()
+            pending = None
+            if first is None:
+                return
+
+            batch = [first]
+            size = len(first.texts)
+            deadline = time.perf_counter() + self.max_wait
+            stop = False
+
+            # Gather more requests until the batch is full or the wait budget is spent
+            while size < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    nxt = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                if size + len(nxt.texts) > self.max_batch_size:
+                    # Keep it for the next batch rather than overflow this one
+                    pending = nxt
+                    break
+                batch.append(nxt)
+                size += len(nxt.texts)
+
+            self._encode_batch(batch)
+            if stop:
+                self._drain()
+                return
+
+    def _drain(self):
+        while True:
+            try:
+                req = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if req is None:
+                # Another worker's stop signal; hand it back
+                self._queue.put(None)
+                return
+            self._encode_batch([req])
+
+    def _encode_batch(self, batch: List[_EncodeRequest]):
+        started = time.perf_counter()
+        texts = [t for req in batch for t in req.texts]
+        try:
+            embeddings = self.model.encode(
+                texts,
+                batch_size=self.max_batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+            ).astype(np.float32, copy=False)
+        except Exception as e:
+            for req in batch:
+                if not req.future.cancelled():
+                    req.future.set_exception(e)
+            return
+        finished = time.perf_counter()
+
+        offset = 0
+        for req in batch:
+            n = len(req.texts)
+            result = embeddings[offset:offset + n]
+            offset += n
+            if not req.future.cancelled():
+                req.future.set_result(result[0] if req.single else result)
+
+        with self._stats_lock:
+            self._batches += 1
+            self._texts += len(texts)
+            self._requests += len(batch)
+            self._max_batch_seen = max(self._max_batch_seen, len(texts))
+            self._total_encode += finished - started
+            self._total_wait += sum(started - req.enqueued_at for req in batch)
+            bucket = next((i for i, upper in enumerate(_BATCH_SIZE_BUCKETS) if len(texts) <= upper), len(_BATCH_SIZE_BUCKETS))
+            self._histogram[bucket] += 1
+
+
+_engine: Optional[EmbeddingEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_embedding_engine() -> EmbeddingEngine:
+    """Returns the process-wide EmbeddingEngine, creating it on first use."""
+    global _engine
+    if _engine is None or _engine.closed:
+        with _engine_lock:
+            if _engine is None or _engine.closed:
+                _engine = EmbeddingEngine()
+    return _engine
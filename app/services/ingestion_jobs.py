@@ -0,0 +1,371 @@
+"""
+Ingestion Jobs Service
+
+This service runs document ingestion as background jobs.
+The API spools uploaded files and texts to disk, records a job in the
+`ingestion_jobs` table and returns its id immediately; a fixed pool of worker
+tasks then ingests the job's sources one by one with
+`IngestionService.ingest_stream` (LLM calls at bulk priority), persisting
+progress as it goes. Ingestion embeds through its own engine (the embedding
+process pool) and writes through its own I/O pool, apart from chat requests.
+
+Job state lives in the database, shared by every process running a runner:
+- a job is claimed with a conditional update that sets `owner` and a lease
+  (`lease_expires_at`), which the owner renews on every progress update and
+  heartbeat;
+- a running job is only taken over once its lease has expired (its runner
+  died), so several API workers or a rolling restart never run a job twice;
+- cancellation is a `cancel_requested` flag that the owner polls between
+  batches, so any process can cancel any job;
+- a taken-over job resumes at the first source that had not completed.
+"""
+from typing import List, Dict, Any, Optional, AsyncIterator, Callable, Set
+from datetime import datetime, timedelta
+import asyncio
+import os
+import shutil
+import socket
+import uuid
+from sqlalchemy import and_, or_, select, update
+from app.core.config import settings
+from app.core.logging import logger
+from app.models import IngestionJob
+from app.schemas.ingestion import IngestionProgress
+from app.services.ingestion_service import IngestionService
+from app.services.vector_store import VectorStore
+
+# Counters summed over a job's sources
+_PROGRESS_FIELDS = [
+    "bytes_read", "chunks_read", "chunks_embedded", "chunks_extracted", "chunks_upserted",
+    "chunks_skipped", "chunks_relinked", "chunks_deleted", "input_tokens", "output_tokens",
+]
+_UNFINISHED = ("queued", "running")
+
+
+class _JobCancelled(Exception):
+    """Cancellation was requested for the job (possibly from another process)."""
+
+
+class _LeaseLost(Exception):
+    """Another runner owns the job now; stop without touching its row."""
+
+
+class IngestionJobRunner:
+    def __init__(
+        self,
+        ingestion_service: IngestionService,
+        vector_store: VectorStore,
+        session_factory: Callable[[], Any],
+        num_workers: int = settings.INGEST_JOB_WORKERS,
+        spool_path: str = settings.INGEST_SPOOL_PATH,
+        lease_seconds: float = settings.INGEST_JOB_LEASE_SECONDS,
+        heartbeat_seconds: float = settings.INGEST_JOB_HEARTBEAT_SECONDS,
+    ):
+        self.ingestion_service = ingestion_service
+        self.vector_store = vector_store
+        # Returns a new AsyncSession (async context manager), e.g. AsyncSessionLocal
+        self.session_factory = session_factory
+        self.num_workers = max(1, num_workers)
+        self.spool_path = spool_path
+        self.lease = timedelta(seconds=lease_seconds)
+        self.heartbeat_seconds = heartbeat_seconds
+        # Identifies this runner in `IngestionJob.owner`
+        self.runner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._queued: Set[str] = set()
+        self._workers: List[asyncio.Task] = []
+        self._heartbeat: Optional[asyncio.Task] = None
+        # Jobs running in this process, so they can be stopped
+        self._running: Dict[str, asyncio.Task] = {}
+        # Running jobs to stop as cancelled / because their lease was taken over
+        self._cancelled: Set[str] = set()
+        self._lost: Set[str] = set()
+
+    async def start(self):
+        """Queues waiting jobs and jobs whose runner's lease expired, and starts the workers."""
+        pending = await self._claimable_jobs()
+        for job_id in pending:
+            self._enqueue(job_id)
+        if pending:
+            logger.info("Resuming %d queued ingestion jobs", len(pending))
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"ingestion-worker-{i}")
+            for i in range(self.num_workers)
+        ]
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop(), name="ingestion-heartbeat")
+
+    async def close(self):
+        """Stops the workers; interrupted jobs go back to `queued` and resume on the next start."""
+        tasks = self._workers + ([self._heartbeat] if self._heartbeat is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._heartbeat = None
+
+    # -- API ----------------------------------------------------------------
+
+    def spool_dir(self, job_id: str) -> str:
+        return os.path.join(self.spool_path, job_id)
+
+    async def submit(self, job_id: str, items: List[Dict[str, str]], metadata_schema: Optional[Dict[str, Any]], system_prompt: str) -> IngestionJob:
+        """Records a job whose sources were spooled under `spool_dir(job_id)` and queues it."""
+        job = IngestionJob(
+            id=job_id,
+            status="queued",
+            items=items,
+            metadata_schema=metadata_schema,
+            system_prompt=system_prompt,
+            items_done=0,
+            progress={},
+        )
+        async with self.session_factory() as db:
+            db.add(job)
+            await db.commit()
+        self._enqueue(job_id)
+        return job
+
+    @staticmethod
+    def new_job_id() -> str:
+        return str(uuid.uuid4())
+
+    async def get(self, job_id: str) -> Optional[IngestionJob]:
+        async with self.session_factory() as db:
+            return await db.get(IngestionJob, job_id)
+
+    async def cancel(self, job_id: str) -> Optional[IngestionJob]:
+        """
+        Cancels a queued or running job. A running job stops after its current
+        batch, in whichever process runs it. Chunks already upserted stay in the index.
+        """
+        async with self.session_factory() as db:
+            job = await db.get(IngestionJob, job_id)
+            if job is None or job.status not in _UNFINISHED:
+                return job
+            job.cancel_requested = True
+            if job.status == "queued":
+                job.status = "cancelled"
+                job.finished_at = datetime.utcnow()
+            await db.commit()
+
+        # Running here: stop right away instead of at the next batch
+        self._stop(job_id, self._cancelled)
+        return await self.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "runner_id": self.runner_id,
+            "workers": len(self._workers),
+            "queued": self._queue.qsize(),
+            "running": len(self._running),
+        }
+
+    # -- Workers ------------------------------------------------------------
+
+    def _enqueue(self, job_id: str):
+        if job_id not in self._queued and job_id not in self._running:
+            self._queued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    def _stop(self, job_id: str, reason: Set[str]):
+        task = self._running.get(job_id)
+        if task is not None:
+            reason.add(job_id)
+            task.cancel()
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                if not await self._claim(job_id):
+                    continue
+                task = asyncio.ensure_future(self._run(job_id))
+                self._running[job_id] = task
+                try:
+                    await asyncio.shield(task)
+                except asyncio.CancelledError:
+                    if task.done() or job_id in self._cancelled or job_id in self._lost:
+                        continue
+                    # Worker shutdown: stop the job and let it resume later
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    raise
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ingestion job %s crashed", job_id)
+            finally:
+                self._running.pop(job_id, None)
+                self._cancelled.discard(job_id)
+                self._lost.discard(job_id)
+                self._queue.task_done()
+
+    def _claimable(self, now: datetime):
+        """Jobs a runner may claim: queued, or running under an expired lease."""
+        return and_(
+            IngestionJob.cancel_requested.is_not(True),
+            or_(
+                IngestionJob.status == "queued",
+                and_(
+                    IngestionJob.status == "running",
+                    or_(IngestionJob.lease_expires_at.is_(None), IngestionJob.lease_expires_at < now),
+                ),
+            ),
+        )
+
+    async def _claimable_jobs(self) -> List[str]:
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            # A job whose runner died after cancellation was requested is just cancelled
+            await db.execute(
+                update(IngestionJob)
+                .where(
+                    IngestionJob.status == "running",
+                    IngestionJob.cancel_requested.is_(True),
+                    or_(IngestionJob.lease_expires_at.is_(None), IngestionJob.lease_expires_at < now),
+                )
+                .values(status="cancelled", finished_at=now, owner=None, lease_expires_at=None)
+            )
+            await db.commit()
+            rows = await db.execute(
+                select(IngestionJob.id).where(self._claimable(now)).order_by(IngestionJob.created_at)
+            )
+            return [job_id for (job_id,) in rows.all()]
+
+    async def _claim(self, job_id: str) -> bool:
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(IngestionJob)
+                .where(IngestionJob.id == job_id, self._claimable(now))
+                .values(status="running", started_at=now, owner=self.runner_id, lease_expires_at=now + self.lease)
+            )
+            await db.commit()
+            return result.rowcount == 1
+
+    async def _heartbeat_loop(self):
+        """Renews the leases of this runner's jobs and picks up jobs orphaned by dead runners."""
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                await self._renew_leases()
+                for job_id in await self._claimable_jobs():
+                    self._enqueue(job_id)
+            except Exception as e:
+                logger.warning("Ingestion job heartbeat failed: %s", e)
+
+    async def _renew_leases(self):
+        running = list(self._running)
+        if not running:
+            return
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            await db.execute(
+                update(IngestionJob)
+                .where(IngestionJob.id.in_(running), IngestionJob.owner == self.runner_id, IngestionJob.status == "running")
+                .values(lease_expires_at=now + self.lease)
+            )
+            await db.commit()
+            rows = await db.execute(
+                select(IngestionJob.id, IngestionJob.owner, IngestionJob.status, IngestionJob.cancel_requested)
+                .where(IngestionJob.id.in_(running))
+            )
+            states = {job_id: (owner, status, cancel) for job_id, owner, status, cancel in rows.all()}
+        for job_id in running:
+            owner, status, cancel = states.get(job_id, (None, None, False))
+            if owner != self.runner_id or status != "running":
+                logger.warning("Lost the lease of ingestion job %s, stopping it", job_id)
+                self._stop(job_id, self._lost)
+            elif cancel:
+                self._stop(job_id, self._cancelled)
+
+    async def _run(self, job_id: str):
+        job = await self.get(job_id)
+        totals = {name: (job.progress or {}).get(name, 0) for name in _PROGRESS_FIELDS}
+        items_done = job.items_done or 0
+
+        try:
+            for item in job.items[items_done:]:
+                before = dict(totals)
+
+                async def on_progress(progress: IngestionProgress, before=before):
+                    for name in _PROGRESS_FIELDS:
+                        totals[name] = before[name] + getattr(progress, name)
+                    # Runs after every batch: persists progress, renews the lease, checks for cancellation
+                    await self._checkpoint(job_id, progress=dict(totals))
+
+                await self.ingestion_service.ingest_stream(
+                    _file_blocks(item["path"]),
+                    item["source_file"],
+                    self.vector_store,
+                    metadata_schema=job.metadata_schema,
+                    system_prompt=job.system_prompt or "",
+                    on_progress=on_progress,
+                )
+                items_done += 1
+                await self._checkpoint(job_id, items_done=items_done, progress=dict(totals))
+        except _JobCancelled:
+            await self._finish(job_id, "cancelled")
+            return
+        except _LeaseLost:
+            logger.warning("Ingestion job %s was taken over by another runner", job_id)
+            return
+        except asyncio.CancelledError:
+            if job_id in self._cancelled:
+                await asyncio.shield(self._finish(job_id, "cancelled"))
+            elif job_id not in self._lost:
+                await asyncio.shield(self._update(job_id, status="queued", owner=None, lease_expires_at=None))
+            raise
+        except Exception as e:
+            logger.exception("Ingestion job %s failed", job_id)
+            await self._finish(job_id, "failed", error=str(e))
+            return
+
+        await self._finish(job_id, "succeeded")
+
+    async def _checkpoint(self, job_id: str, **values):
+        """Saves `values` and renews the lease; raises if the job was cancelled or taken over."""
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(IngestionJob)
+                .where(IngestionJob.id == job_id, IngestionJob.owner == self.runner_id)
+                .values(lease_expires_at=now + self.lease, **values)
+            )
+            cancel = await db.scalar(select(IngestionJob.cancel_requested).where(IngestionJob.id == job_id))
+            await db.commit()
+        if result.rowcount != 1:
+            raise _LeaseLost(job_id)
+        if cancel:
+            raise _JobCancelled(job_id)
+
+    async def _finish(self, job_id: str, status: str, **values):
+        if await self._update(job_id, status=status, finished_at=datetime.utcnow(), owner=None, lease_expires_at=None, **values):
+            self._remove_spool(job_id)
+
+    async def _update(self, job_id: str, **values) -> bool:
+        """Updates a job this runner owns; returns False if it doesn't own it anymore."""
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(IngestionJob).where(IngestionJob.id == job_id, IngestionJob.owner == self.runner_id).values(**values)
+            )
+            await db.commit()
+            return result.rowcount == 1
+
+    def _remove_spool(self, job_id: str):
+        shutil.rmtree(self.spool_dir(job_id), ignore_errors=True)
+
+
+async def _file_blocks(path: str) -> AsyncIterator[bytes]:
+    """Reads a spooled file in blocks without blocking the event loop."""
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        while True:
+            block = await asyncio.to_thread(f.read, settings.INGEST_READ_BLOCK_BYTES)
+            if not block:
+                return
+            yield block
+    finally:
+        f.close()
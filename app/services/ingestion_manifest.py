@@ -0,0 +1,87 @@
+"""
+Ingestion Manifest
+
+This service remembers, per source file, which chunks the last ingestion
+stored in the vector index (their content-addressed ids, in document order)
+and the settings that produced them. Re-ingesting a file compares the new
+chunk ids with the manifest, so only new or changed chunks are embedded and
+sent to the LLM, removed chunks are deleted and neighbour links are fixed
+only where they changed.
+
+Manifests are JSON files under INGEST_MANIFEST_PATH, written atomically
+after an ingestion has finished. Run syncs of one source from a single
+process that shares this directory.
+"""
+from typing import List, Dict, Any, Optional
+from dataclasses import dataclass, field
+from datetime import datetime
+import hashlib
+import json
+import os
+import threading
+from app.core.config import settings
+
+
+def chunk_id(source_file: str, text: str, occurrence: int = 0) -> str:
+    """
+    Deterministic id of a chunk: a hash of its source, its text and how many
+    identical chunks precede it in the same source.
+    """
+    digest = hashlib.sha256()
+    digest.update(source_file.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(str(occurrence).encode("ascii"))
+    digest.update(b"\0")
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+@dataclass
+class SourceManifest:
+    source_file: str
+    chunk_ids: List[str] = field(default_factory=list)
+    # Hash of what else shaped the stored chunks (embedding model, metadata schema, prompt)
+    config_hash: str = ""
+    updated_at: str = ""
+
+
+class ManifestStore:
+    def __init__(self, path: Optional[str] = settings.INGEST_MANIFEST_PATH):
+        # path=None keeps manifests in RAM (useful for tests)
+        self.path = path
+        self._memory: Dict[str, SourceManifest] = {}
+        self._lock = threading.Lock()
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def _file(self, source_file: str) -> str:
+        name = hashlib.sha1(source_file.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, f"{name}.json")
+
+    def load(self, source_file: str) -> Optional[SourceManifest]:
+        if self.path is None:
+            with self._lock:
+                return self._memory.get(source_file)
+        try:
+            with open(self._file(source_file)) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        return SourceManifest(**data)
+
+    def save(self, manifest: SourceManifest):
+        manifest.updated_at = datetime.now().isoformat()
+        if self.path is None:
+            with self._lock:
+                self._memory[manifest.source_file] = manifest
+            return
+        target = self._file(manifest.source_file)
+        tmp = f"{target}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest.__dict__, f)
+        os.replace(tmp, target)
+
+
+def config_hash(**parts: Any) -> str:
+    """Stable hash of the settings that determine a chunk's stored vector and metadata."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
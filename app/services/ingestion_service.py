@@ -4,21 +4,63 @@ Ingestion Service
 This service manages the processing of uploaded documents.
 It handles text extraction, chunking, and preparing data for indexing into the
 vector store, ensuring raw files are converted into queryable knowledge.
+Large documents go through `ingest_stream`, which chunks, embeds, extracts
+metadata and upserts in bounded batches instead of holding the whole file.
+Chunks move through the pipeline as columnar ChunkBatch objects; Pydantic
+ProcessedChunk models are only built for callers of `process_text`.
 """
-from typing import List, Dict, Any, Optional
-import uuid
-from sentence_transformers import SentenceTransformer
+from typing import List, Dict, Any, Optional, Union, Iterable, AsyncIterable, AsyncIterator, BinaryIO, Callable, Set, Tuple
+from app.core.config import settings
+from app.core.logging import logger
 from app.services.llm_service import LLMService
-from app.schemas.ingestion import ProcessedChunk, ChunkMetadata
+from app.services.rate_limiter import Priority
+from app.services.embedding_service import EmbeddingEngine, get_embedding_engine
+from app.services.embedding_pool import ProcessEmbeddingPool
+from app.services.vector_store import VectorStore
+from app.services.compact_embedding import EmbeddingBatch
+from app.services.ingestion_manifest import ManifestStore, SourceManifest, chunk_id as make_chunk_id, config_hash
+from app.services.chunk_batch import ChunkBatch
+from app.schemas.ingestion import ProcessedChunk, IngestionProgress
 
 from datetime import datetime
 import asyncio
+import codecs
+import inspect
+
+# Raw document input for streaming ingestion: blocks of bytes (or str), a file
+# object (sync or async `read`) or an async iterator of blocks
+ByteSource = Union[Iterable[Union[bytes, str]], AsyncIterable[Union[bytes, str]], BinaryIO, Any]
+
+
+async def _read_blocks(source: ByteSource, block_size: int) -> AsyncIterator[Union[bytes, str]]:
+    if isinstance(source, (bytes, str)):
+        yield source
+    elif hasattr(source, "read"):
+        while True:
+            block = source.read(block_size)
+            if inspect.isawaitable(block):
+                block = await block
+            if not block:
+                return
+            yield block
+    elif hasattr(source, "__aiter__"):
+        async for block in source:
+            yield block
+    else:
+        for block in source:
+            yield block
+
 
 class IngestionService:
-    def __init__(self):
-        self.llm_service = LLMService()
-        # Initialize embedding model (lazy loading or at startup)
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+    def __init__(self, embedding_engine: Optional[Union[EmbeddingEngine, ProcessEmbeddingPool]] = None, llm_service: Optional[LLMService] = None, metadata_concurrency: int = settings.INGEST_METADATA_CONCURRENCY, manifest_store: Optional[ManifestStore] = None):
+        self.llm_service = llm_service or LLMService()
+        # Shared embedding engine (model is loaded once per process), or a
+        # ProcessEmbeddingPool for corpus-scale ingestion
+        self.embedding_model = embedding_engine or get_embedding_engine()
+        # Upper bound on concurrent metadata-extraction LLM calls per ingestion
+        self.metadata_concurrency = max(1, metadata_concurrency)
+        # Per-source chunk manifests for incremental re-ingestion
+        self.manifests = manifest_store or ManifestStore()
 
     async def process_file(self, file_content: bytes, filename: str, metadata_schema: Optional[Dict[str, Any]], system_prompt: str) -> List[ProcessedChunk]:
         """
@@ -36,56 +78,375 @@ class IngestionService:
     async def process_text(self, text: str, source_file: str, metadata_schema: Optional[Dict[str, Any]], system_prompt: str) -> List[ProcessedChunk]:
         """
         Process text content: chunk, embed, extract metadata, and link.
+        Returns API-level ProcessedChunk models; use `process_text_batch` to
+        keep the columnar ChunkBatch (e.g. to upsert it).
+        """
+        batch = await self.process_text_batch(text, source_file, metadata_schema, system_prompt)
+        return batch.to_processed_chunks()
+
+    async def process_text_batch(self, text: str, source_file: str, metadata_schema: Optional[Dict[str, Any]], system_prompt: str) -> ChunkBatch:
+        """
+        Columnar `process_text`: one ChunkBatch with ids, links, embeddings and metadata columns.
         """
         chunks = self._chunk_text(text)
+        occurrences: Dict[str, int] = {}
+        ids = [self._next_chunk_id(source_file, chunk_text, occurrences) for chunk_text in chunks]
+        batch = ChunkBatch(
+            ids=ids,
+            texts=chunks,
+            previous_ids=[None] + ids[:-1] if ids else [],
+            next_ids=ids[1:] + [None] if ids else [],
+            source_file=source_file,
+            date_added=datetime.now().isoformat(),
+        )
         
         # 1. Batch Generate Embeddings (Much faster than loop)
-        embeddings = self.embedding_model.encode(chunks).tolist()
+        embed_task = asyncio.ensure_future(self.embedding_model.aencode(chunks)) if chunks else None
         
-        # 2. Parallel Metadata Extraction (Concurrent LLM calls)
-        async def extract_for_chunk(chunk_text: str):
-            if metadata_schema:
-                user_prompt = f"Extract metadata from the following text based on the provided schema:\n\n{chunk_text}"
-                result,tokens = await self.llm_service.get_structured_response(
+        # 2. Parallel Metadata Extraction (Concurrent LLM calls, capped)
+        semaphore = asyncio.Semaphore(self.metadata_concurrency)
+        metadata_results, _tokens = await self._extract_all_metadata(chunks, metadata_schema, system_prompt, semaphore)
+        batch.set_metadata(metadata_results)
+        if embed_task is not None:
+            batch.embeddings = EmbeddingBatch.from_float(await embed_task)
+        return batch
+
+    async def ingest_stream(
+        self,
+        source: ByteSource,
+        source_file: str,
+        vector_store: VectorStore,
+        metadata_schema: Optional[Dict[str, Any]] = None,
+        system_prompt: str = "",
+        batch_size: int = settings.INGEST_BATCH_SIZE,
+        max_inflight_batches: int = settings.INGEST_MAX_INFLIGHT_BATCHES,
+        on_progress: Optional[Callable[[IngestionProgress], Any]] = None,
+        incremental: bool = True,
+    ) -> IngestionProgress:
+        """
+        Pipelined ingestion for large documents.
+
+        Chunks are cut lazily from `source` (bytes blocks, a file object or an
+        async iterator such as an upload stream) and processed in batches of
+        `batch_size`: one embedding call per batch, metadata extraction capped at
+        `metadata_concurrency` LLM calls across all batches, then one upsert per
+        batch. At most `max_inflight_batches` batches are in memory at a time, so
+        peak memory does not depend on the document size.
+        `on_progress` (sync or async) is called after every upserted batch.
+
+        Chunk ids are content hashes. With `incremental`, the source's manifest
+        from the previous ingestion decides what to do per chunk: unchanged
+        chunks are skipped, chunks whose neighbours changed only get their
+        links updated, new chunks are embedded and extracted, and chunks no
+        longer in the document are deleted. A change of embedding model,
+        metadata schema or prompt re-processes every chunk.
+        """
+        progress = IngestionProgress(source_file=source_file)
+        current_config = config_hash(
+            embedding_model=self.embedding_model.model_name,
+            metadata_schema=metadata_schema,
+            system_prompt=system_prompt if metadata_schema else None,
+        )
+        previous = await asyncio.to_thread(self.manifests.load, source_file) if incremental else None
+        # chunk id -> (previous_chunk_id, next_chunk_id) as stored by the last ingestion
+        stored_links: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        reusable = previous is not None and previous.config_hash == current_config
+        if previous is not None:
+            ids = previous.chunk_ids
+            for i, stored_id in enumerate(ids):
+                stored_links[stored_id] = (ids[i - 1] if i > 0 else None, ids[i + 1] if i + 1 < len(ids) else None)
+        chunk_ids: List[str] = []
+        relinks: List[Tuple[str, Optional[str], Optional[str]]] = []
+        semaphore = asyncio.Semaphore(self.metadata_concurrency)
+        slots = asyncio.Semaphore(max(1, max_inflight_batches))
+        tasks: Set[asyncio.Task] = set()
+        failure: List[BaseException] = []
+
+        def batch_finished(task: asyncio.Task):
+            tasks.discard(task)
+            # The error is kept in `failure` and re-raised below
+            if not task.cancelled():
+                task.exception()
+
+        async def run_batch(chunks: ChunkBatch):
+            try:
+                texts = chunks.texts()
+                embed_task = asyncio.ensure_future(self.embedding_model.aencode(texts))
+                metadata_results, tokens = await self._extract_all_metadata(texts, metadata_schema, system_prompt, semaphore)
+                progress.chunks_extracted += len(chunks)
+                progress.input_tokens += tokens.get("input_tokens", 0)
+                progress.output_tokens += tokens.get("output_tokens", 0)
+                chunks.embeddings = EmbeddingBatch.from_float(await embed_task)
+                progress.chunks_embedded += len(chunks)
+
+                chunks.set_metadata(metadata_results)
+                chunks.date_added = datetime.now().isoformat()
+                await vector_store.aupsert_chunks(chunks)
+                progress.chunks_upserted += len(chunks)
+                progress.batches += 1
+                await self._report(on_progress, progress)
+            except BaseException as e:
+                failure.append(e)
+                raise
+            finally:
+                slots.release()
+
+        batch: List[Tuple[str, str, Optional[str], Optional[str]]] = []
+        async for item in self._linked_chunks(source, source_file, progress):
+            chunk_id, _, previous_id, next_id = item
+            chunk_ids.append(chunk_id)
+            if reusable and chunk_id in stored_links:
+                if stored_links[chunk_id] == (previous_id, next_id):
+                    progress.chunks_skipped += 1
+                else:
+                    relinks.append((chunk_id, previous_id, next_id))
+                    if len(relinks) >= batch_size:
+                        await vector_store.arelink_chunks(relinks)
+                        progress.chunks_relinked += len(relinks)
+                        relinks = []
+                continue
+            batch.append(item)
+            if len(batch) < batch_size:
+                continue
+            await slots.acquire()
+            if failure:
+                slots.release()
+                break
+            task = asyncio.ensure_future(run_batch(ChunkBatch.from_linked(batch, source_file)))
+            tasks.add(task)
+            task.add_done_callback(batch_finished)
+            batch = []
+
+        try:
+            if batch and not failure:
+                await slots.acquire()
+                await run_batch(ChunkBatch.from_linked(batch, source_file))
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        # Finished batches are no longer in `tasks`, so gather doesn't see their errors
+        if failure:
+            raise failure[0]
+
+        await vector_store.arelink_chunks(relinks)
+        progress.chunks_relinked += len(relinks)
+
+        # Removing the previous version is only safe once every chunk of this one is stored
+        stored = progress.chunks_upserted + progress.chunks_skipped + progress.chunks_relinked
+        if stored != len(chunk_ids):
+            raise RuntimeError(f"Ingestion of {source_file} stored {stored} of {len(chunk_ids)} chunks")
+
+        # Chunks of the previous version that are gone (ids no longer produced)
+        if previous is not None:
+            current_ids = set(chunk_ids)
+            removed = [stored_id for stored_id in previous.chunk_ids if stored_id not in current_ids]
+            await vector_store.adelete_chunks(removed)
+            progress.chunks_deleted += len(removed)
+
+        # Saved last: a failed or interrupted run leaves the old manifest (and the old
+        # chunks) in place, and the next run is redone against it
+        manifest = SourceManifest(source_file=source_file, chunk_ids=chunk_ids, config_hash=current_config)
+        await asyncio.to_thread(self.manifests.save, manifest)
+
+        progress.done = True
+        await self._report(on_progress, progress)
+        return progress
+
+    async def _linked_chunks(self, source: ByteSource, source_file: str, progress: IngestionProgress) -> AsyncIterator[Tuple[str, str, Optional[str], Optional[str]]]:
+        """
+        Yields (chunk_id, text, previous_chunk_id, next_chunk_id) in document order.
+        Reads one chunk ahead so each chunk knows whether a next one exists.
+        """
+        previous_id: Optional[str] = None
+        current: Optional[Tuple[str, str]] = None
+        occurrences: Dict[str, int] = {}
+        async for text in self.iter_chunks(source, progress=progress):
+            chunk_id = self._next_chunk_id(source_file, text, occurrences)
+            if current is not None:
+                yield current[0], current[1], previous_id, chunk_id
+                previous_id = current[0]
+            current = (chunk_id, text)
+            progress.chunks_read += 1
+        if current is not None:
+            yield current[0], current[1], previous_id, None
+
+    async def iter_chunks(
+        self,
+        source: ByteSource,
+        chunk_size: int = settings.INGEST_CHUNK_SIZE,
+        overlap: int = settings.INGEST_CHUNK_OVERLAP,
+        progress: Optional[IngestionProgress] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Streaming equivalent of `_chunk_text`: decodes UTF-8 incrementally and
+        yields the same overlapping chunks while holding only about one read
+        block plus one chunk of text.
+        """
+        step = chunk_size - overlap
+        if step <= 0:
+            raise ValueError("overlap must be smaller than chunk_size")
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        buffer = ""
+        # Start of the next chunk in `buffer`; the consumed prefix is dropped once per block
+        offset = 0
+        async for block in _read_blocks(source, settings.INGEST_READ_BLOCK_BYTES):
+            if progress is not None:
+                progress.bytes_read += len(block)
+            buffer = buffer[offset:] + (decoder.decode(block) if isinstance(block, bytes) else block)
+            offset = 0
+            while len(buffer) - offset >= chunk_size:
+                yield buffer[offset:offset + chunk_size]
+                offset += step
+        buffer = buffer[offset:] + decoder.decode(b"", final=True)
+        for offset in range(0, len(buffer), step):
+            yield buffer[offset:offset + chunk_size]
+
+    async def _extract_all_metadata(self, texts: List[str], metadata_schema: Optional[Dict[str, Any]], system_prompt: str, semaphore: asyncio.Semaphore) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """
+        Metadata for every chunk of `texts`, in order, plus the summed token usage.
+        With batching enabled, chunks are packed into as few requests as the
+        token budget allows; otherwise one request is made per chunk.
+        """
+        if not metadata_schema or not texts:
+            return [{} for _ in texts], {}
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+        usage = {"input_tokens": 0, "output_tokens": 0}
+
+        async def extract(indices: List[int]):
+            if len(indices) == 1:
+                data, tokens = await self._extract_metadata(texts[indices[0]], metadata_schema, system_prompt, semaphore)
+                results[indices[0]] = data
+                self._add_tokens(usage, tokens)
+                return
+            extracted, tokens = await self._extract_metadata_batch([texts[i] for i in indices], metadata_schema, system_prompt, semaphore)
+            self._add_tokens(usage, tokens)
+            missing = []
+            for position, i in enumerate(indices):
+                if position in extracted:
+                    results[i] = extracted[position]
+                else:
+                    missing.append(i)
+            if missing:
+                # Malformed or incomplete answer: retry what's missing in smaller batches
+                logger.info("Metadata batch of %d returned %d/%d results, retrying the rest in halves", len(indices), len(indices) - len(missing), len(indices))
+                half = (len(missing) + 1) // 2
+                await asyncio.gather(*[extract(part) for part in (missing[:half], missing[half:]) if part])
+
+        if settings.INGEST_METADATA_BATCHING:
+            groups = self._metadata_batches(texts)
+        else:
+            groups = [[i] for i in range(len(texts))]
+        await asyncio.gather(*[extract(group) for group in groups])
+        return [data if data is not None else {} for data in results], usage
+
+    def _metadata_batches(self, texts: List[str]) -> List[List[int]]:
+        """
+        Groups consecutive chunks so each request carries at most
+        INGEST_METADATA_BATCH_TOKENS of chunk text and INGEST_METADATA_MAX_BATCH_SIZE chunks.
+        """
+        budget = settings.INGEST_METADATA_BATCH_TOKENS
+        max_size = max(1, settings.INGEST_METADATA_MAX_BATCH_SIZE)
+        groups: List[List[int]] = []
+        current: List[int] = []
+        used = 0
+        for i, text in enumerate(texts):
+            tokens = self.llm_service.count_tokens(text)
+            if current and (used + tokens > budget or len(current) >= max_size):
+                groups.append(current)
+                current, used = [], 0
+            current.append(i)
+            used += tokens
+        if current:
+            groups.append(current)
+        return groups
+
+    async def _extract_metadata_batch(self, texts: List[str], metadata_schema: Dict[str, Any], system_prompt: str, semaphore: asyncio.Semaphore) -> Tuple[Dict[int, Dict[str, Any]], Dict[str, int]]:
+        """
+        One request for several chunks using an array-wrapped schema.
+        Returns {position in `texts`: metadata} for the well-formed results only.
+        """
+        schema = {
+            "type": "object",
+            "properties": {
+                "results": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "chunk_index": {"type": "integer"},
+                            "metadata": metadata_schema
+                        },
+                        "required": ["chunk_index", "metadata"]
+                    }
+                }
+            },
+            "required": ["results"]
+        }
+        numbered = "\n\n".join(f"[{i}]\n{text}" for i, text in enumerate(texts))
+        user_prompt = (
+            f"Extract metadata from each of the following {len(texts)} text chunks based on the provided schema. "
+            f"Return exactly one result per chunk, with `chunk_index` set to the chunk's number.\n\n{numbered}"
+        )
+        async with semaphore:
+            try:
+                response, tokens = await self.llm_service.get_structured_response(
                     user_prompt=user_prompt,
-                    schema=metadata_schema,
-                    system_prompt=system_prompt
+                    schema=schema,
+                    system_prompt=system_prompt,
+                    priority=Priority.BULK
                 )
-                return result,tokens
-            return {},{}
+            except ValueError as e:
+                # Truncated or invalid JSON
+                logger.warning("Malformed metadata batch of %d chunks: %s", len(texts), e)
+                return {}, {}
 
-        metadata_results = await asyncio.gather(*[extract_for_chunk(chunk) for chunk in chunks])
-        
-        processed_chunks = []
-        
-        # 3. Assemble ProcessedChunks
-        for i, (chunk_text, embedding, extracted_metadata,tokens) in enumerate(zip(chunks, embeddings, metadata_results)):
-            chunk_id = str(uuid.uuid4())
-            
-            # Create metadata object with links
-            metadata = ChunkMetadata(
-                next_chunk_id=None, # To be filled
-                previous_chunk_id=processed_chunks[-1].chunk_id if i > 0 else None,
-                data=extracted_metadata
-            )
-            
-            processed_chunk = ProcessedChunk(
-                chunk_id=chunk_id,
-                text=chunk_text,
-                metadata=metadata,
-                embedding=embedding,
-                source_file=source_file,
-                date_added=datetime.now().isoformat()
+        extracted: Dict[int, Dict[str, Any]] = {}
+        items = response.get("results") if isinstance(response, dict) else None
+        for item in items if isinstance(items, list) else []:
+            if not isinstance(item, dict):
+                continue
+            index, metadata = item.get("chunk_index"), item.get("metadata")
+            if isinstance(index, int) and 0 <= index < len(texts) and isinstance(metadata, dict) and index not in extracted:
+                extracted[index] = metadata
+        return extracted, tokens
+
+    @staticmethod
+    def _add_tokens(total: Dict[str, int], tokens: Dict[str, int]):
+        total["input_tokens"] += tokens.get("input_tokens", 0)
+        total["output_tokens"] += tokens.get("output_tokens", 0)
+
+    async def _extract_metadata(self, chunk_text: str, metadata_schema: Optional[Dict[str, Any]], system_prompt: str, semaphore: asyncio.Semaphore) -> Tuple[Dict[str, Any], Dict[str, int]]:
+        if not metadata_schema:
+            return {}, {}
+        user_prompt = f"Extract metadata from the following text based on the provided schema:\n\n{chunk_text}"
+        async with semaphore:
+            return await self.llm_service.get_structured_response(
+                user_prompt=user_prompt,
+                schema=metadata_schema,
+                system_prompt=system_prompt,
+                priority=Priority.BULK
             )
-            processed_chunks.append(processed_chunk)
 
-        # Link next_chunk_ids
-        for i in range(len(processed_chunks) - 1):
-            processed_chunks[i].metadata.next_chunk_id = processed_chunks[i+1].chunk_id
-            
-        return processed_chunks
+    @staticmethod
+    def _next_chunk_id(source_file: str, text: str, occurrences: Dict[str, int]) -> str:
+        """Content-addressed id; repeated identical chunks are told apart by their occurrence number."""
+        base = make_chunk_id(source_file, text)
+        occurrence = occurrences.get(base, 0)
+        occurrences[base] = occurrence + 1
+        return base if occurrence == 0 else make_chunk_id(source_file, text, occurrence)
+
+    @staticmethod
+    async def _report(on_progress: Optional[Callable[[IngestionProgress], Any]], progress: IngestionProgress):
+        if on_progress is None:
+            return
+        result = on_progress(progress.model_copy())
+        if inspect.isawaitable(result):
+            await result
 
-    def _chunk_text(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+    def _chunk_text(self, text: str, chunk_size: int = settings.INGEST_CHUNK_SIZE, overlap: int = settings.INGEST_CHUNK_OVERLAP) -> List[str]:
         """
         Simple text chunking with overlap.
         """
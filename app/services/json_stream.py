@@ -0,0 +1,79 @@
+"""
+Incremental JSON Field Streaming
+
+This file extracts the value of one top-level string field from a JSON document
+that arrives in arbitrary pieces (e.g. a streamed structured LLM response), so
+the field's text can be forwarded to the client before the document is complete.
+"""
+import json
+import re
+
+
+class JSONStringFieldStreamer:
+    """
+    Feed raw JSON deltas in order; each call returns the newly decoded text of
+    `field_name`'s string value (possibly empty). Escape sequences split across
+    deltas are held back until complete.
+    """
+
+    def __init__(self, field_name: str):
+        self._key_pattern = re.compile(r'"' + re.escape(field_name) + r'"\s*:\s*"')
+        self._buffer = ""
+        self._pos = 0
+        self._in_value = False
+        self.done = False
+
+    def feed(self, delta: str) -> str:
+        if self.done or not delta:
+            return ""
+        self._buffer += delta
+
+        if not self._in_value:
+            match = self._key_pattern.search(self._buffer)
+            if match is None:
+                return ""
+            self._in_value = True
+            self._pos = match.end()
+
+        out = []
+        buf = self._buffer
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if ch == '"':
+                self.done = True
+                i += 1
+                break
+            if ch != "\\":
+                # Copy the run of plain characters at once
+                j = i
+                while j < len(buf) and buf[j] not in '"\\':
+                    j += 1
+                out.append(buf[i:j])
+                i = j
+                continue
+
+            # Escape sequence; wait for the rest if it is incomplete
+            if i + 1 >= len(buf):
+                break
+            if buf[i + 1] != "u":
+                out.append(json.loads('"' + buf[i:i + 2] + '"'))
+                i += 2
+                continue
+            if i + 6 > len(buf):
+                break
+            code = int(buf[i + 2:i + 6], 16)
+            if 0xD800 <= code <= 0xDBFF:
+                # High surrogate: needs its low half (\uXXXX) to decode
+                if i + 12 > len(buf):
+                    break
+                out.append(json.loads('"' + buf[i:i + 12] + '"'))
+                i += 12
+            else:
+                out.append(chr(code))
+                i += 6
+
+        # Drop consumed input so the buffer stays small
+        self._buffer = buf[i:]
+        self._pos = 0
+        return "".join(out)
@@ -0,0 +1,383 @@
+"""
+Lexical Index
+
+This service keeps an in-process BM25 inverted index over the text of
+knowledge-base chunks, for the queries embeddings handle poorly: SKUs, codes,
+names and file names. VectorStore updates it on every chunk upsert and delete,
+and uses it for hybrid (lexical + vector) retrieval and for an exact-match fast
+path that answers identifier queries without querying the vector index.
+
+Posting lists are compact arrays (uint32 document numbers, uint16 term
+frequencies) instead of Python lists. Deleted documents are tombstoned and
+dropped when the index is compacted. On disk, the index is a snapshot with
+delta + varint encoded postings plus an append-only log of the changes made
+since, so restarts reload it instead of re-reading the corpus.
+"""
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+from array import array
+from collections import Counter
+import json
+import math
+import os
+import re
+import threading
+import numpy as np
+from app.core.config import settings
+from app.core.logging import logger
+
+# Words and identifiers: runs of letters/digits, optionally joined by - _ . / : #
+_TOKEN_RE = re.compile(r"[^\W_]+(?:[-_./:#][^\W_]+)*")
+_WORD_RE = re.compile(r"[^\W_]+")
+# Identifiers contain a digit or a joiner ("SKU-1234", "q3_report.pdf"); plain words don't
+_IDENTIFIER_RE = re.compile(r"[\d\-_./:#]")
+_MAX_TF = 0xFFFF
+
+_SNAPSHOT_VERSION = 1
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased words and identifiers. Compound identifiers are indexed whole
+    and by their parts, so "SKU-1234" matches both "sku-1234" and "1234".
+    """
+    text = text.lower()
+    # Plain words and the parts of compounds, then the compounds themselves
+    words = _WORD_RE.findall(text)
+    return words + [token for token in _TOKEN_RE.findall(text) if not token.isalnum()]
+
+
+def identifier_term(query: str) -> Optional[str]:
+    """The identifier a query consists of (e.g. "SKU-1234", "report_2024.pdf"), else None."""
+    tokens = _TOKEN_RE.findall(query.lower())
+    if len(tokens) != 1 or query.strip().strip("\"'`?!.,;").lower() != tokens[0]:
+        return None
+    return tokens[0] if _IDENTIFIER_RE.search(tokens[0]) else None
+
+
+def _varint_encode(values: np.ndarray) -> bytes:
+    """LEB128 varints of non-negative integers (< 2**35), vectorized."""
+    values = np.asarray(values, dtype=np.uint64)
+    if not len(values):
+        return b""
+    lengths = np.ones(len(values), dtype=np.int64)
+    for shift in (7, 14, 21, 28):
+        lengths += values >= (1 << shift)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    out = np.zeros(int(ends[-1]), dtype=np.uint8)
+    for j in range(int(lengths.max())):
+        mask = lengths > j
+        byte = (values[mask] >> np.uint64(7 * j)) & np.uint64(0x7F)
+        more = (lengths[mask] > j + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[mask] + j] = (byte | more).astype(np.uint8)
+    return out.tobytes()
+
+
+def _varint_decode(data: bytes) -> np.ndarray:
+    buf = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(buf < 0x80)
+    if not len(ends):
+        return np.zeros(0, dtype=np.uint64)
+    starts = np.zeros_like(ends)
+    starts[1:] = ends[:-1] + 1
+    lengths = ends - starts + 1
+    values = np.zeros(len(ends), dtype=np.uint64)
+    for j in range(int(lengths.max())):
+        mask = lengths > j
+        values[mask] |= (buf[starts[mask] + j].astype(np.uint64) & np.uint64(0x7F)) << np.uint64(7 * j)
+    return values
+
+
+class LexicalIndex:
+    # Write a new snapshot once the change log holds this many records
+    _SNAPSHOT_SLACK = 50000
+    # Compact postings once this share of the documents are tombstones
+    _DEAD_RATIO = 0.25
+
+    def __init__(self, path: Optional[str] = settings.LEXICAL_INDEX_PATH, k1: float = 1.2, b: float = 0.75):
+        # path=None keeps the index in memory only (useful for tests)
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        # Document number -> chunk id (None once deleted), and back
+        self._ids: List[Optional[str]] = []
+        self._numbers: Dict[str, int] = {}
+        self._lengths = array("I")
+        self._alive = bytearray()
+        # Term -> (document numbers, term frequencies), in document order
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._live = 0
+        self._dead = 0
+        self._total_length = 0
+        self._log = None
+        self._log_records = 0
+
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            self._load()
+
+    def __len__(self) -> int:
+        return self._live
+
+    # -- Updates --------------------------------------------------------------
+
+    def add(self, documents: Iterable[Tuple[str, str]]):
+        """Indexes (chunk_id, text) pairs; an id indexed before is replaced."""
+        records = []
+        with self._lock:
+            for vid, text in documents:
+                counts = Counter(tokenize(text))
+                self._add(vid, counts)
+                records.append({"op": "add", "id": vid, "terms": counts})
+            self._append_log(records)
+
+    def delete(self, ids: Iterable[str]):
+        with self._lock:
+            removed = [vid for vid in ids if self._remove(vid)]
+            self._append_log([{"op": "delete", "id": vid} for vid in removed])
+            if self._dead > max(1000, self._DEAD_RATIO * len(self._ids)):
+                self._compact()
+
+    def _add(self, vid: str, counts: Dict[str, int]):
+        self._remove(vid)
+        number = len(self._ids)
+        length = sum(counts.values())
+        self._ids.append(vid)
+        self._numbers[vid] = number
+        self._lengths.append(length)
+        self._alive.append(1)
+        self._live += 1
+        self._total_length += length
+        for term, tf in counts.items():
+            posting = self._postings.get(term)
+            if posting is None:
+                posting = self._postings[term] = (array("I"), array("H"))
+            posting[0].append(number)
+            posting[1].append(min(tf, _MAX_TF))
+
+    def _remove(self, vid: str) -> bool:
+        number = self._numbers.pop(vid, None)
+        if number is None:
+            return False
+        self._ids[number] = None
+        self._alive[number] = 0
+        self._live -= 1
+        self._dead += 1
+        self._total_length -= self._lengths[number]
+        return True
+
+    def _compact(self):
+        """Renumbers the live documents and drops tombstones from the postings."""
+        alive = np.frombuffer(self._alive, dtype=np.bool_).copy()
+        renumber = np.cumsum(alive, dtype=np.int64) - 1
+        postings: Dict[str, Tuple[array, array]] = {}
+        for term, (docs, tfs) in self._postings.items():
+            doc_numbers = np.frombuffer(docs, dtype=np.uint32)
+            keep = alive[doc_numbers]
+            if not keep.any():
+                continue
+            new_docs, new_tfs = array("I"), array("H")
+            new_docs.frombytes(renumber[doc_numbers[keep]].astype(np.uint32).tobytes())
+            new_tfs.frombytes(np.frombuffer(tfs, dtype=np.uint16)[keep].tobytes())
+            postings[term] = (new_docs, new_tfs)
+        self._postings = postings
+        self._ids = [vid for vid in self._ids if vid is not None]
+        self._numbers = {vid: i for i, vid in enumerate(self._ids)}
+        lengths = array("I")
+        lengths.frombytes(np.frombuffer(self._lengths, dtype=np.uint32)[alive].tobytes())
+        self._lengths = lengths
+        self._alive = bytearray(b"\x01" * len(self._ids))
+        self._dead = 0
+
+    # -- Queries --------------------------------------------------------------
+
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        """Best (chunk_id, BM25 score) pairs for `query`, best first."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            docs, scores = self._score(terms)
+            return self._top(docs, scores, top_k)
+
+    def exact_match(self, query: str, top_k: int, max_docs: int = settings.LEXICAL_EXACT_MATCH_MAX_DOCS) -> Optional[List[Tuple[str, float]]]:
+        """
+        For a query that is a single identifier found in at most `max_docs`
+        chunks, the (chunk_id, score) pairs of those chunks; None otherwise
+        (not an identifier, unknown, or too common to be a lookup).
+        """
+        term = identifier_term(query)
+        if term is None:
+            return None
+        with self._lock:
+            docs, scores = self._score([term])
+            if not 0 < len(docs) <= max_docs:
+                return None
+            return self._top(docs, scores, top_k)
+
+    def _score(self, terms: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """BM25 of every live document containing one of `terms` (called with the lock held)."""
+        if not self._live:
+            return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.float64)
+        # Views over the arrays only live inside this call, so updates can resize them
+        alive = np.frombuffer(self._alive, dtype=np.bool_)
+        lengths = np.frombuffer(self._lengths, dtype=np.uint32)
+        avgdl = self._total_length / self._live or 1.0
+        doc_parts, score_parts = [], []
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            docs = np.frombuffer(posting[0], dtype=np.uint32)
+            keep = alive[docs]
+            docs = docs[keep]
+            if not len(docs):
+                continue
+            tfs = np.frombuffer(posting[1], dtype=np.uint16)[keep].astype(np.float64)
+            df = len(docs)
+            idf = math.log(1.0 + (self._live - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * lengths[docs] / avgdl)
+            doc_parts.append(docs)
+            score_parts.append(idf * tfs * (self.k1 + 1.0) / (tfs + norm))
+        if not doc_parts:
+            return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.float64)
+        docs = np.concatenate(doc_parts)
+        weights = np.concatenate(score_parts)
+        if len(docs) * 8 < len(self._ids):
+            # Few postings: sort them instead of scanning a dense accumulator
+            unique, inverse = np.unique(docs, return_inverse=True)
+            return unique, np.bincount(inverse, weights=weights)
+        scores = np.bincount(docs, weights=weights, minlength=len(self._ids))
+        unique = np.flatnonzero(scores)
+        return unique, scores[unique]
+
+    def _top(self, docs: np.ndarray, scores: np.ndarray, top_k: int) -> List[Tuple[str, float]]:
+        k = min(top_k, len(docs))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self._ids[docs[i]], float(scores[i])) for i in top]
+
+    # -- Persistence ----------------------------------------------------------
+
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.path, "snapshot.bin")
+
+    def _log_path(self) -> str:
+        return os.path.join(self.path, "changes.jsonl")
+
+    def _load(self):
+        if os.path.exists(self._snapshot_path()):
+            self._read_snapshot()
+        if os.path.exists(self._log_path()):
+            with open(self._log_path()) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    self._log_records += 1
+                    if record["op"] == "add":
+                        self._add(record["id"], record["terms"])
+                    else:
+                        self._remove(record["id"])
+        if self._ids:
+            logger.info("Loaded lexical index %s (%d documents, %d terms)", self.path, self._live, len(self._postings))
+        self._log = open(self._log_path(), "a")
+
+    def _read_snapshot(self):
+        with open(self._snapshot_path(), "rb") as f:
+            header = json.loads(f.readline())
+            sections = [f.read(size) for size in header["sections"]]
+        if header.get("version") != _SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported lexical index snapshot version: {header.get('version')}")
+        lengths, deltas, tfs = (_varint_decode(section) for section in sections)
+
+        self._ids = header["ids"]
+        self._numbers = {vid: i for i, vid in enumerate(self._ids)}
+        self._lengths = array("I")
+        self._lengths.frombytes(lengths.astype(np.uint32).tobytes())
+        self._alive = bytearray(b"\x01" * len(self._ids))
+        self._live = len(self._ids)
+        self._total_length = int(lengths.sum())
+
+        # Document numbers are delta-encoded per term: undo with one running sum,
+        # minus the sum reached before each term's first posting
+        counts = np.asarray(header["counts"], dtype=np.int64)
+        ends = np.cumsum(counts)
+        starts = ends - counts
+        running = np.cumsum(deltas)
+        bases = np.where(starts > 0, running[np.maximum(starts - 1, 0)], 0) if len(counts) else np.zeros(0, dtype=np.uint64)
+        docs = memoryview((running - np.repeat(bases, counts)).astype(np.uint32).tobytes())
+        freqs = memoryview(tfs.astype(np.uint16).tobytes())
+        for term, start, end in zip(header["terms"], starts.tolist(), ends.tolist()):
+            term_docs, term_freqs = array("I"), array("H")
+            term_docs.frombytes(docs[start * 4:end * 4])
+            term_freqs.frombytes(freqs[start * 2:end * 2])
+            self._postings[term] = (term_docs, term_freqs)
+
+    def _write_snapshot(self):
+        """Writes all postings to a new snapshot and starts an empty change log."""
+        if self._dead:
+            self._compact()
+        terms = list(self._postings)
+        counts = np.array([len(self._postings[term][0]) for term in terms], dtype=np.int64)
+        docs = np.frombuffer(b"".join(self._postings[term][0].tobytes() for term in terms), dtype=np.uint32).astype(np.int64)
+        tfs = np.frombuffer(b"".join(self._postings[term][1].tobytes() for term in terms), dtype=np.uint16)
+        # Deltas within each term's postings; each term starts from its first document number
+        deltas = np.diff(docs, prepend=0)
+        starts = np.cumsum(counts) - counts
+        deltas[starts[counts > 0]] = docs[starts[counts > 0]]
+        sections = [
+            _varint_encode(np.frombuffer(self._lengths.tobytes(), dtype=np.uint32)),
+            _varint_encode(deltas),
+            _varint_encode(tfs),
+        ]
+        header = {
+            "version": _SNAPSHOT_VERSION,
+            "ids": self._ids,
+            "terms": terms,
+            "counts": counts.tolist(),
+            "sections": [len(section) for section in sections],
+        }
+        tmp = self._snapshot_path() + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(json.dumps(header).encode("utf-8") + b"\n")
+            for section in sections:
+                f.write(section)
+        os.replace(tmp, self._snapshot_path())
+
+        # Replaying a log that outlived a crash here is harmless (adds replace, deletes repeat)
+        if self._log is not None:
+            self._log.close()
+        self._log = open(self._log_path(), "w")
+        self._log_records = 0
+
+    def _append_log(self, records: List[Dict[str, Any]]):
+        if self._log is None or not records:
+            return
+        for record in records:
+            self._log.write(json.dumps(record) + "\n")
+        self._log.flush()
+        self._log_records += len(records)
+        if self._log_records > self._SNAPSHOT_SLACK:
+            self._write_snapshot()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            postings = sum(len(docs) for docs, _ in self._postings.values())
+            return {
+                "documents": self._live,
+                "terms": len(self._postings),
+                "postings": postings,
+                # 4-byte document number + 2-byte frequency per posting
+                "posting_bytes": postings * 6,
+                "tombstones": self._dead,
+            }
+
+    def close(self):
+        with self._lock:
+            if self.path is not None and self._log_records:
+                self._write_snapshot()
+            if self._log is not None:
+                self._log.close()
+                self._log = None
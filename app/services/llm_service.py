@@ -4,75 +4,178 @@ LLM Service
 This service handles communication with Large Language Model providers (e.g., OpenAI).
 It is responsible for sending prompts to the LLM and returning the generated text,
 abstracting the specific API details. It uses tiktoken for accurate token counting.
+Every call goes through the shared LLMScheduler (rate limits, adaptive
+concurrency, retries and interactive-over-bulk priority).
 """
 import tiktoken
+import asyncio
 from openai import AsyncOpenAI
 import json
-from typing import Dict, Any, Tuple, AsyncGenerator
+from typing import Dict, Any, Tuple, AsyncGenerator, Optional
 from app.core.config import settings
+from app.services.rate_limiter import LLMScheduler, Priority, get_llm_scheduler
+
+# Per-message framing tokens added by the chat format
+_MESSAGE_OVERHEAD_TOKENS = 4
 
 class LLMService:
-    def __init__(self, model: str = "gpt-4o-mini"):
+    def __init__(self, model: str = "gpt-4o-mini", scheduler: Optional[LLMScheduler] = None):
         self.model = model
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        # Retries are done by the scheduler, which also honours Retry-After;
+        # OPENAI_BASE_URL points the client at a proxy or a local stub server
+        self.client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL or None,
+            max_retries=0
+        )
+        self.scheduler = scheduler or get_llm_scheduler()
         try:
             self.encoding = tiktoken.encoding_for_model(model)
         except KeyError:
             # Fallback for unknown models
             self.encoding = tiktoken.get_encoding("cl100k_base")
 
+    async def close(self):
+        """Closes the underlying HTTP client."""
+        await self.client.close()
+
     def count_tokens(self, text: str) -> int:
         """Returns the number of tokens in a text string."""
         return len(self.encoding.encode(text))
 
-    async def generate_response(self, prompt: str,system_prompt: str ) -> Tuple[str, dict]:
+    def estimate_tokens(self, system_prompt: str, user_prompt: str, schema: Optional[Dict[str, Any]] = None) -> int:
+        """Estimated total cost of a call (prompt, framing and expected output) used for rate limiting."""
+        prompt_tokens = self.count_tokens(system_prompt) + self.count_tokens(user_prompt) + 2 * _MESSAGE_OVERHEAD_TOKENS
+        if schema is not None:
+            prompt_tokens += self.count_tokens(json.dumps(schema))
+        return prompt_tokens + settings.LLM_EXPECTED_OUTPUT_TOKENS
+
+    async def generate_response(self, prompt: str,system_prompt: str, priority: Priority = Priority.INTERACTIVE) -> Tuple[str, dict]:
         """
         Generates a response from the LLM.
         Returns a tuple of (generated_text, token_count).
         """
-        response = await self.client.chat.completions.create(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ]
+        estimated = self.estimate_tokens(system_prompt, prompt)
+        response = await self.scheduler.run(
+            lambda: self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt}
+                ]
+            ),
+            estimated,
+            priority
         )
         generated_text = response.choices[0].message.content
         
-        # Accurate token counting
-        input_tokens = self.count_tokens(prompt)
-        output_tokens = self.count_tokens(generated_text)
-        total_tokens = input_tokens + output_tokens
-        tokens={
-            "input_tokens":input_tokens,
-            "output_tokens":output_tokens,
-            "total_tokens":total_tokens
-        }
+        # Token usage as billed by the API (covers system prompt and message framing)
+        tokens = self._usage(response, system_prompt + prompt, generated_text)
+        self.scheduler.reconcile(estimated, tokens["total_tokens"])
         return generated_text, tokens
 
-    async def get_structured_response(self, user_prompt: str, schema: Dict[str, Any], system_prompt: str) -> Dict[str, Any]:
+    async def get_structured_response(self, user_prompt: str, schema: Dict[str, Any], system_prompt: str, priority: Priority = Priority.INTERACTIVE) -> Tuple[Dict[str, Any], Dict[str, int]]:
         """
         Generates a structured JSON response based on a provided schema and prompts.
+        Bulk callers (ingestion) pass `priority=Priority.BULK`.
+        """
+        estimated = self.estimate_tokens(system_prompt, user_prompt, schema)
+        response = await self.scheduler.run(
+            lambda: self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                response_format={
+                    "type": "json_schema",
+                    "json_schema": {
+                        "name": "structured_response",
+                        "schema": schema
+                    }
+                }
+            ),
+            estimated,
+            priority
+        )
+        content = response.choices[0].message.content
+        tokens = self._usage(response, system_prompt + user_prompt + json.dumps(schema), content)
+        self.scheduler.reconcile(estimated, tokens["total_tokens"])
+        return json.loads(content), tokens
+
+    def _usage(self, response, prompt_text: str, completion_text: str) -> Dict[str, int]:
         """
-        response = await self.client.chat.completions.create(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            response_format={
+        Token usage from the API response. Falls back to local tiktoken counts
+        for providers that don't report usage.
+        """
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            return {
+                "input_tokens": usage.prompt_tokens,
+                "output_tokens": usage.completion_tokens,
+                "total_tokens": usage.total_tokens
+            }
+        input_tokens = self.count_tokens(prompt_text)
+        output_tokens = self.count_tokens(completion_text or "")
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens
+        }
+
+    async def generate_stream(self, prompt: str, system_prompt: str, schema: Optional[Dict[str, Any]] = None, usage: Optional[Dict[str, int]] = None, priority: Priority = Priority.INTERACTIVE) -> AsyncGenerator[str, None]:
+        """
+        Streams the completion text as it is generated.
+        If `schema` is given the model is constrained to that JSON schema (the raw JSON is streamed).
+        If `usage` is given it is filled with the token usage reported at the end of the stream.
+        The stream holds a scheduler slot until it ends; it is only retried if
+        it fails before the first chunk arrives.
+        """
+        kwargs: Dict[str, Any] = {}
+        if schema is not None:
+            kwargs["response_format"] = {
                 "type": "json_schema",
                 "json_schema": {
                     "name": "structured_response",
                     "schema": schema
                 }
             }
-        )
-        input_tokens=self.count_tokens(user_prompt+system_prompt+schema)
-        output_tokens=self.count_tokens(response.choices[0].message.content)
-        tokens={
-            "input_tokens":input_tokens,
-            "output_tokens":output_tokens,
-            "total_tokens":input_tokens+output_tokens
-        }
-        return json.loads(response.choices[0].message.content),tokens
+        estimated = self.estimate_tokens(system_prompt, prompt, schema)
+        stream_usage: Dict[str, int] = {}
+        attempt = 0
+        started = False
+        while True:
+            try:
+                # Stream duration depends on answer length, so it doesn't drive latency-based concurrency
+                async with self.scheduler.slot(estimated, priority, adapt_to_latency=False):
+                    stream = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": prompt}
+                        ],
+                        stream=True,
+                        stream_options={"include_usage": True},
+                        **kwargs
+                    )
+                    async for chunk in stream:
+                        # The final chunk carries usage and no choices
+                        if chunk.usage is not None:
+                            stream_usage["input_tokens"] = chunk.usage.prompt_tokens
+                            stream_usage["output_tokens"] = chunk.usage.completion_tokens
+                            stream_usage["total_tokens"] = chunk.usage.total_tokens
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            started = True
+                            yield chunk.choices[0].delta.content
+                break
+            except Exception as e:
+                delay = None if started else self.scheduler.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+
+        if stream_usage:
+            self.scheduler.reconcile(estimated, stream_usage["total_tokens"])
+            if usage is not None:
+                usage.update(stream_usage)
@@ -5,22 +5,31 @@ This service manages long-term memory for chat sessions.
 It stores and retrieves conversation history, allowing the chatbot to maintain
 context across multiple turns of conversation.
 """
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Sequence, Tuple
 from datetime import datetime
 import uuid
-from pinecone import Pinecone
-from sentence_transformers import SentenceTransformer
+import numpy as np
 from app.core.config import settings
+from app.core.concurrency import BoundedPool, get_vector_io_pool
+from app.services.embedding_service import EmbeddingEngine, get_embedding_engine
+from app.services.vector_index import VectorIndex, create_vector_index
+from app.services.docstore import DocStore, index_metadata
+
+# Memories live in the index's default namespace
+MEMORY_NAMESPACE = ""
 
 class MemoryService:
-    def __init__(self):
-        # Initialize Pinecone
-        self.pc = Pinecone(api_key=settings.PINECONE_API_KEY)
-        self.index = self.pc.Index(settings.PINECONE_INDEX_NAME)
+    def __init__(self, embedding_engine: Optional[EmbeddingEngine] = None, index: Optional[VectorIndex] = None, io_pool: Optional[BoundedPool] = None, docstore: Optional[DocStore] = None):
+        # Vector index backend (reuse a shared index handle when one is given)
+        self.index = index or create_vector_index()
+        # Optional local docstore holding memory texts (the index then returns ids only)
+        self.docstore = docstore
         
-        # Initialize embedding model
+        # Shared embedding engine
         # Using the same model as ingestion for consistency
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.embedding_model = embedding_engine or get_embedding_engine()
+        # Blocking index calls of the async API run in this pool
+        self.io_pool = io_pool or get_vector_io_pool()
 
     def add_memory(self, text: str, user_id: str, session_id: str) -> Dict[str, Any]:
         """
@@ -29,47 +38,127 @@ class MemoryService:
         memory_id = str(uuid.uuid4())
         
         # Generate embedding
-        embedding = self.embedding_model.encode(text).tolist()
+        embedding = self.embedding_model.encode(text)
         
         # Create metadata
-        metadata = {
-            "text": text,
-            "user_id": user_id,
-            "session_id": session_id,
-            "date": datetime.now().isoformat(),
-            "type": "conversation_history"
-        }
+        metadata = self._memory_metadata(text, user_id, session_id)
         
         # Upsert to Pinecone
-        self.index.upsert(vectors=[(memory_id, embedding, metadata)])
+        self.index.upsert(vectors=self._stage_documents([(memory_id, embedding, metadata)]))
+        
+        return {
+            "id": memory_id,
+            "metadata": metadata
+        }
+
+    async def aadd_memory(self, text: str, user_id: str, session_id: str) -> Dict[str, Any]:
+        """
+        Async variant of add_memory; encode and upsert run off the event loop.
+        """
+        memory_id = str(uuid.uuid4())
+        embedding = await self.embedding_model.aencode(text)
+        metadata = self._memory_metadata(text, user_id, session_id)
+        
+        await self.io_pool.run(self._upsert, [(memory_id, embedding, metadata)])
         
         return {
             "id": memory_id,
             "metadata": metadata
         }
 
-    def search_memory(self, query: str, user_id: str, session_id: Optional[str] = None, top_k: int = 5) -> List[Dict[str, Any]]:
+    async def aadd_memories(self, memories: Sequence[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+        """
+        Adds several (text, user_id, session_id) memories with one batched encode
+        and one multi-vector upsert.
+        """
+        if not memories:
+            return []
+        embeddings = await self.embedding_model.aencode([text for text, _, _ in memories])
+        records = [
+            (str(uuid.uuid4()), embedding, self._memory_metadata(text, user_id, session_id))
+            for (text, user_id, session_id), embedding in zip(memories, embeddings)
+        ]
+
+        await self.io_pool.run(self._upsert, records)
+
+        return [{"id": memory_id, "metadata": metadata} for memory_id, _, metadata in records]
+
+    def search_memory(self, query: str, user_id: str, session_id: Optional[str] = None, top_k: int = 5, query_vector: Optional[Sequence[float]] = None) -> List[Dict[str, Any]]:
         """
         Retrieves relevant memories based on a query.
+        Pass `query_vector` to reuse an embedding already computed for this turn.
         """
-        # Generate query embedding
-        query_embedding = self.embedding_model.encode(query).tolist()
+        # Generate query embedding (cached per normalized query text)
+        if query_vector is None:
+            query_vector = self.embedding_model.embed_query(query)
+        query_embedding = np.asarray(query_vector, dtype=np.float32)
         
-        # Build filter
-        metadata_filter = {"user_id": user_id}
-        if session_id:
-            metadata_filter["session_id"] = session_id
-            
         # Search Pinecone
         results = self.index.query(
             vector=query_embedding,
             top_k=top_k,
-            include_metadata=True,
-            filter=metadata_filter
+            include_metadata=self.docstore is None,
+            filter=self._memory_filter(user_id, session_id)
         )
         
+        return self._format_matches(self._hydrate(results.matches))
+
+    async def asearch_memory(self, query: str, user_id: str, session_id: Optional[str] = None, top_k: int = 5, query_vector: Optional[Sequence[float]] = None) -> List[Dict[str, Any]]:
+        """
+        Async variant of search_memory; encode and query run off the event loop.
+        """
+        if query_vector is None:
+            query_vector = await self.embedding_model.aembed_query(query)
+        query_embedding = np.asarray(query_vector, dtype=np.float32)
+        
+        results = await self.io_pool.run(
+            self.index.query,
+            vector=query_embedding,
+            top_k=top_k,
+            include_metadata=self.docstore is None,
+            filter=self._memory_filter(user_id, session_id)
+        )
+        
+        matches = results.matches if self.docstore is None else await self.io_pool.run(self._hydrate, results.matches)
+        return self._format_matches(matches)
+
+    def _stage_documents(self, records: List[tuple]) -> List[tuple]:
+        """With a docstore, stores memory texts there and returns the records to send to the index."""
+        if self.docstore is None:
+            return records
+        self.docstore.put_many(MEMORY_NAMESPACE, records)
+        return [(memory_id, embedding, index_metadata(metadata)) for memory_id, embedding, metadata in records]
+
+    def _upsert(self, records: List[tuple]):
+        self.index.upsert(vectors=self._stage_documents(records))
+
+    def _hydrate(self, matches: list) -> list:
+        if self.docstore is None:
+            return matches
+        return self.docstore.hydrate(self.index, matches, MEMORY_NAMESPACE)
+
+    @staticmethod
+    def _memory_metadata(text: str, user_id: str, session_id: str) -> Dict[str, Any]:
+        return {
+            "text": text,
+            "user_id": user_id,
+            "session_id": session_id,
+            "date": datetime.now().isoformat(),
+            "type": "conversation_history"
+        }
+
+    @staticmethod
+    def _memory_filter(user_id: str, session_id: Optional[str]) -> Dict[str, Any]:
+        # Build filter
+        metadata_filter = {"user_id": user_id}
+        if session_id:
+            metadata_filter["session_id"] = session_id
+        return metadata_filter
+
+    @staticmethod
+    def _format_matches(matches) -> List[Dict[str, Any]]:
         memories = []
-        for match in results.matches:
+        for match in matches:
             memories.append({
                 "id": match.id,
                 "score": match.score,
@@ -0,0 +1,215 @@
+"""
+MMR Re-ranking
+
+This file implements Maximal Marginal Relevance (MMR) selection with NumPy.
+Instead of materializing the full candidate-candidate similarity matrix and
+re-scanning every selected item per candidate, it keeps a running
+max-similarity vector so each selection step costs one matrix-vector product.
+A batched entry point re-ranks the candidate sets of many queries at once,
+and a multi-query entry point runs one MMR over the pooled candidates of
+several queries with a minimum number of picks per query.
+Candidates may be compact (float16 / int8) embeddings from the index; they are
+dequantized once into a float32 matrix.
+"""
+from typing import List, Sequence, Tuple, Any, Optional
+import numpy as np
+from app.services.compact_embedding import as_float_matrix, as_float_vector
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def mmr(
+    query_embedding: Sequence[float],
+    candidate_vectors: Sequence[Any],
+    top_k: int,
+    lambda_param: float,
+    normalized: bool = False,
+    relevance_scores: Optional[Sequence[float]] = None,
+) -> Tuple[List[int], List[float]]:
+    """
+    Selects up to `top_k` candidate indices by MMR:
+        lambda * Sim(Q, D) - (1 - lambda) * max(Sim(D, Selected))
+
+    Returns (selected_indices, query_similarities) in selection order.
+    Set `normalized=True` when the vectors are already unit length (the shared
+    embedding engine guarantees this) to skip re-normalization.
+    `relevance_scores` (in [0, 1], e.g. fused hybrid scores) replace Sim(Q, D)
+    in the relevance term.
+    """
+    candidates = as_float_matrix(candidate_vectors)
+    if candidates.size == 0:
+        return [], []
+    query = as_float_vector(query_embedding)
+    if not normalized:
+        candidates = _normalize_rows(candidates)
+        query = _normalize_rows(query[None, :])[0]
+
+    n = candidates.shape[0]
+    k = min(top_k, n)
+    sim_query = candidates @ query
+
+    relevance = lambda_param * (sim_query if relevance_scores is None else np.asarray(relevance_scores, dtype=np.float32))
+    max_sim_selected = np.zeros(n, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    selected: List[int] = []
+
+    for step in range(k):
+        scores = relevance - (1 - lambda_param) * max_sim_selected
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+
+        sim_best = candidates @ candidates[best]
+        if step == 0:
+            max_sim_selected = sim_best
+        else:
+            np.maximum(max_sim_selected, sim_best, out=max_sim_selected)
+
+    return selected, [float(sim_query[i]) for i in selected]
+
+
+def batch_mmr(
+    query_embeddings: Sequence[Sequence[float]],
+    candidate_sets: Sequence[Sequence[Any]],
+    top_k: int,
+    lambda_param: float,
+    normalized: bool = False,
+    relevance_scores: Optional[Sequence[Optional[Sequence[float]]]] = None,
+) -> List[Tuple[List[int], List[float]]]:
+    """
+    Runs MMR for many queries in one call. Candidate sets may have different
+    sizes; they are padded into a single (queries, candidates, dim) tensor so
+    every selection step is one batched product for all queries.
+    `relevance_scores` optionally gives, per query, scores that replace the
+    query similarity in the relevance term (None keeps it for that query).
+    Returns one (selected_indices, query_similarities) pair per query.
+    """
+    m = len(candidate_sets)
+    if m == 0:
+        return []
+
+    sets = [as_float_matrix(c) for c in candidate_sets]
+    sizes = np.array([s.shape[0] if s.size else 0 for s in sets])
+    n_max = int(sizes.max())
+    if n_max == 0:
+        return [([], []) for _ in range(m)]
+
+    dim = next(s.shape[1] for s in sets if s.size)
+    candidates = np.zeros((m, n_max, dim), dtype=np.float32)
+    valid = np.zeros((m, n_max), dtype=bool)
+    for i, s in enumerate(sets):
+        if s.size:
+            candidates[i, :s.shape[0]] = s
+            valid[i, :s.shape[0]] = True
+
+    queries = np.stack([as_float_vector(q) for q in query_embeddings]).reshape(m, dim)
+    if not normalized:
+        candidates = _normalize_rows(candidates)
+        queries = _normalize_rows(queries)
+
+    sim_query = np.matmul(candidates, queries[:, :, None])[:, :, 0]
+    relevance_matrix = sim_query
+    if relevance_scores is not None and any(r is not None for r in relevance_scores):
+        relevance_matrix = sim_query.copy()
+        for i, scores in enumerate(relevance_scores):
+            if scores is not None:
+                relevance_matrix[i, :len(scores)] = scores
+    relevance = lambda_param * relevance_matrix
+    max_sim_selected = np.zeros((m, n_max), dtype=np.float32)
+    available = valid.copy()
+    rows = np.arange(m)
+    k = min(top_k, n_max)
+    picks = np.full((m, k), -1, dtype=np.int64)
+
+    for step in range(k):
+        scores = relevance - (1 - lambda_param) * max_sim_selected
+        scores[~available] = -np.inf
+        best = np.argmax(scores, axis=1)
+        # Rows whose candidates are exhausted keep -1
+        has_pick = available[rows, best]
+        picks[:, step] = np.where(has_pick, best, -1)
+        available[rows, best] = False
+
+        sim_best = np.matmul(candidates, candidates[rows, best][:, :, None])[:, :, 0]
+        if step == 0:
+            max_sim_selected = sim_best
+        else:
+            np.maximum(max_sim_selected, sim_best, out=max_sim_selected)
+
+    results = []
+    for i in range(m):
+        idx = [int(j) for j in picks[i] if j >= 0]
+        results.append((idx, [float(sim_query[i, j]) for j in idx]))
+    return results
+
+
+def multi_query_mmr(
+    query_embeddings: Sequence[Sequence[float]],
+    candidate_vectors: Sequence[Any],
+    membership: np.ndarray,
+    top_k: int,
+    lambda_param: float,
+    min_per_query: int = 1,
+    normalized: bool = False,
+    relevance_scores: Optional[np.ndarray] = None,
+) -> Tuple[List[int], List[float]]:
+    """
+    One MMR pass over the pooled candidates of several queries.
+
+    `membership[d, q]` tells whether candidate d was retrieved for query q.
+    A candidate's relevance is its best similarity to any query (or the best
+    of `relevance_scores[d, q]` when given), so a chunk that serves two
+    queries is picked once and redundant ones are penalized across queries.
+    Every query gets at least `min_per_query` of its own candidates (fewer
+    when it has fewer): once the remaining picks are only enough for the
+    missing quotas, selection is restricted to those queries' candidates.
+
+    Returns (selected_indices, best_query_similarities) in selection order.
+    """
+    candidates = as_float_matrix(candidate_vectors)
+    if candidates.size == 0:
+        return [], []
+    queries = np.stack([as_float_vector(q) for q in query_embeddings])
+    if not normalized:
+        candidates = _normalize_rows(candidates)
+        queries = _normalize_rows(queries)
+
+    n = candidates.shape[0]
+    membership = np.asarray(membership, dtype=bool)
+    sim_query = candidates @ queries.T
+    relevance = sim_query if relevance_scores is None else np.asarray(relevance_scores, dtype=np.float32)
+    best_relevance = lambda_param * relevance.max(axis=1)
+
+    quotas = np.minimum(min_per_query, membership.sum(axis=0))
+    max_sim_selected = np.zeros(n, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    selected: List[int] = []
+
+    for step in range(min(top_k, n)):
+        missing = quotas > 0
+        if missing.any() and quotas.sum() >= min(top_k, n) - step:
+            # Only quota picks left: best candidate for a query still short of its quota
+            scores = lambda_param * np.where(membership[:, missing], relevance[:, missing], -np.inf).max(axis=1)
+        else:
+            scores = best_relevance.copy()
+        scores -= (1 - lambda_param) * max_sim_selected
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        if not np.isfinite(scores[best]):
+            break
+        selected.append(best)
+        available[best] = False
+        quotas = np.maximum(quotas - membership[best], 0)
+
+        sim_best = candidates @ candidates[best]
+        if step == 0:
+            max_sim_selected = sim_best
+        else:
+            np.maximum(max_sim_selected, sim_best, out=max_sim_selected)
+
+    return selected, [float(sim_query[i].max()) for i in selected]
@@ -0,0 +1,76 @@
+"""
+Plan Cache
+
+This file caches the QueryPlan that detailed mode asks the LLM for before any
+retrieval starts. Plans depend only on the question and the request metadata,
+so they are looked up by query-embedding similarity within a scope made of the
+metadata dict (see SemanticCache for the TTL and LRU eviction). A lookup below
+the similarity threshold falls back to live planning.
+
+Each entry remembers how long its live planning call took and the tokens it
+used, so the cache can report the planning latency and tokens its hits saved.
+"""
+from typing import Any, Dict, Hashable, Optional
+from dataclasses import dataclass
+import json
+from app.core.config import settings
+from app.schemas.rag import QueryPlan
+from app.services.semantic_cache import SemanticCache
+
+
+@dataclass
+class CachedPlan:
+    plan: QueryPlan
+    # Latency and tokens of the live planning call that produced the plan
+    planning_ms: float
+    tokens: int
+
+
+class PlanCache(SemanticCache[CachedPlan]):
+    def __init__(
+        self,
+        threshold: float = settings.PLAN_CACHE_SIMILARITY_THRESHOLD,
+        max_entries: int = settings.PLAN_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = settings.PLAN_CACHE_TTL_SECONDS,
+    ):
+        super().__init__(threshold=threshold, max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.live_plans = 0
+        self.live_planning_ms = 0.0
+        self.planning_ms_saved = 0.0
+        self.tokens_saved = 0
+
+    @staticmethod
+    def scope(metadata: Optional[Dict[str, Any]]) -> Hashable:
+        """Plans are only shared between requests with the same metadata."""
+        if metadata is None:
+            return None
+        return json.dumps(metadata, sort_keys=True, default=str)
+
+    def lookup_plan(self, metadata: Optional[Dict[str, Any]], vector) -> Optional[QueryPlan]:
+        """Returns a cached plan for a similar question with the same metadata, or None."""
+        found = self.lookup(self.scope(metadata), vector)
+        if found is None:
+            return None
+        cached, _similarity = found
+        with self._lock:
+            self.planning_ms_saved += cached.planning_ms
+            self.tokens_saved += cached.tokens
+        return cached.plan
+
+    def store_plan(self, metadata: Optional[Dict[str, Any]], vector, plan: QueryPlan, planning_ms: float, tokens: int):
+        """Stores a live plan and records its planning latency."""
+        with self._lock:
+            self.live_plans += 1
+            self.live_planning_ms += planning_ms
+        self.store(self.scope(metadata), vector, CachedPlan(plan=plan, planning_ms=planning_ms, tokens=tokens))
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        with self._lock:
+            stats.update({
+                "live_plans": self.live_plans,
+                "avg_planning_ms": self.live_planning_ms / self.live_plans if self.live_plans else 0.0,
+                "planning_ms_saved": self.planning_ms_saved,
+                "tokens_saved": self.tokens_saved,
+            })
+        return stats
@@ -6,84 +6,182 @@ It coordinates interactions between the Vector Store (to find relevant context),
 Memory Service (for history), Pandas Service (for structured data), and
 the LLM Service (to generate answers based on that context).
 """
-from typing import List, Dict, Any, Optional, AsyncGenerator
+from typing import List, Dict, Any, Optional, AsyncGenerator, Hashable, Tuple
+from dataclasses import dataclass, field
 import asyncio
+import hashlib
 import json
+import time
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.metrics import stream_metrics
 from app.services.memory_service import MemoryService
 from app.services.vector_store import VectorStore
 from app.services.llm_service import LLMService
+from app.services.semantic_cache import SemanticCache
+from app.services.plan_cache import PlanCache
+from app.services.write_behind import WriteBehindQueue
+from app.services.json_stream import JSONStringFieldStreamer
+from app.services.context_packer import ContextPacker
+from app.services.context_expansion import NeighborExpander
 from app.schemas.rag import RAGResponse, QueryPlan
 
+# Cached (response, source chunks) pairs
+AnswerCache = SemanticCache[Tuple[RAGResponse, List[Dict]]]
+
+
+@dataclass
+class _PreparedContext:
+    """Retrieved context for one turn, shared by the structured and streaming answer paths."""
+    memories: List[Dict] = field(default_factory=list)
+    knowledge_chunks: List[Dict] = field(default_factory=list)
+    usage: Dict[str, int] = field(default_factory=lambda: {"input_tokens": 0, "output_tokens": 0})
+    scope: Optional[Hashable] = None
+    query_vector: Any = None
+    cached: Optional[tuple] = None
+
+
 class RAGService:
-    def __init__(self):
-        self.memory_service = MemoryService()
-        self.vector_store = VectorStore()
-        self.llm_service = LLMService()
+    def __init__(
+        self,
+        memory_service: Optional[MemoryService] = None,
+        vector_store: Optional[VectorStore] = None,
+        llm_service: Optional[LLMService] = None,
+        answer_cache: Optional[AnswerCache] = None,
+        context_packer: Optional[ContextPacker] = None,
+        write_behind: Optional[WriteBehindQueue] = None,
+        neighbor_expander: Optional[NeighborExpander] = None,
+        plan_cache: Optional[PlanCache] = None,
+    ):
+        # Services are normally injected by the app-lifetime ServiceContainer
+        self.memory_service = memory_service or MemoryService()
+        self.vector_store = vector_store or VectorStore()
+        self.llm_service = llm_service or LLMService()
+
+        # Keeps the prompt within CONTEXT_TOKEN_BUDGET, counting with the LLM's own encoding
+        self.context_packer = context_packer or ContextPacker(self.llm_service.encoding)
+
+        # Optionally widens retrieved chunks with their previous/next chunks
+        self.neighbor_expander = neighbor_expander
+        if neighbor_expander is None and settings.CONTEXT_NEIGHBOR_EXPANSION:
+            self.neighbor_expander = NeighborExpander(self.vector_store, self.context_packer.count)
+
+        # New memories go through the write-behind queue when one is given, instead of
+        # being embedded and upserted before the answer is returned
+        self.write_behind = write_behind
+
+        # Optional semantic answer cache, dropped whenever the knowledge base changes
+        self.answer_cache = answer_cache
+        if answer_cache is not None:
+            self.vector_store.add_change_listener(lambda _version: answer_cache.clear())
+
+        # Optional cache of detailed-mode query plans; plans don't depend on the
+        # knowledge base, so it is not cleared when the knowledge base changes
+        self.plan_cache = plan_cache
 
     async def generate_quick_answer(self, query: str, user_id: str, session_id: str, recent_history: List[Dict]) -> tuple[RAGResponse, List[Dict], Dict[str, int]]:
         """
         Generates a structured answer to the user query using RAG.
         Returns: (RAGResponse, source_chunks, token_usage)
         """
-        # 1. Parallel Context Retrieval
-        memory_task = self.memory_service.search_memory(query, user_id=user_id, session_id=session_id)
-        vector_task = self.vector_store.mmr_search(query, top_k=5)
-        
-        memories, knowledge_chunks = await asyncio.gather(memory_task, vector_task)
-        
-        # 2. Format Context
-        system_prompt, user_prompt = self._construct_prompts(query, memories, knowledge_chunks, recent_history)
-        
-        # 3. LLM Call for Structured Output
-        # We need a schema for the LLM to follow. We can reuse the Pydantic model's JSON schema.
-        response_schema = RAGResponse.model_json_schema()
-        
-        llm_response_dict, usage = await self.llm_service.get_structured_response(
-            user_prompt=user_prompt,
-            system_prompt=system_prompt,
-            schema=response_schema
-        )
-        
-        # 4. Parse Response
-        rag_response = RAGResponse(**llm_response_dict)
-        
-        # 5. Update Memory (if needed)
-        if rag_response.memory_to_save:
-            # Fire and forget (or await if strict consistency needed)
-            # await self.memory_service.add_memory(rag_response.memory_to_save, user_id, session_id)
-             self.memory_service.add_memory(rag_response.memory_to_save, user_id, session_id)
-
-        return rag_response, knowledge_chunks, usage
+        context = await self._prepare_quick(query, user_id, session_id, recent_history)
+        if context.cached is not None:
+            return context.cached
+        return await self._answer(query, user_id, session_id, recent_history, context)
 
-    async def generate_answer_stream(self, query: str, user_id: str, session_id: str, recent_history: List[Dict]) -> AsyncGenerator[str, None]:
-        """
-        Generates a streaming answer. 
-        Note: True structured streaming is complex. This implementation streams the text content
-        and appends metadata as a JSON string at the end.
-        """
-        # 1. Parallel Context Retrieval
-        memory_task = self.memory_service.search_memory(query, user_id=user_id, session_id=session_id)
-        vector_task = self.vector_store.mmr_search(query, top_k=5)
-        
-        memories, knowledge_chunks = await asyncio.gather(memory_task, vector_task)
-        
-        # 2. Format Context
-        system_prompt, user_prompt = self._construct_prompts(query, memories, knowledge_chunks, recent_history)
-        
-        # 3. Stream Response
-        # For streaming, we might not enforce JSON schema strictly on the whole stream if we want immediate text.
-        # However, to maintain the "structured" requirement, we can ask the LLM to stream the answer first.
-        # Simplified approach: Stream the raw text answer.
-        # Future improvement: Use function calling stream or specialized parsing.
-        
-        async for chunk in self.llm_service.generate_stream(user_prompt, system_prompt):
-            if chunk:
-                yield chunk
     async def generate_detailed_answer(self, query: str, user_id: str, session_id: str, recent_history: List[Dict], metadata: Optional[Dict[str, Any]] = None) -> tuple[RAGResponse, List[Dict], Dict[str, int]]:
         """
         Generates a detailed answer using query expansion and parallel retrieval.
         Returns: (RAGResponse, source_chunks, token_usage)
         """
+        context = await self._prepare_detailed(query, user_id, session_id, recent_history, metadata)
+        if context.cached is not None:
+            return context.cached
+        return await self._answer(query, user_id, session_id, recent_history, context)
+
+    async def generate_answer_stream(self, query: str, user_id: str, session_id: str, recent_history: List[Dict], mode: str = "simple", metadata: Optional[Dict[str, Any]] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Generates a streaming answer as a sequence of events:
+        - {"event": "token", "data": {"text": ...}} for each piece of the answer as it arrives
+        - {"event": "done", "data": {...}} once, with the full answer, cited chunk ids,
+          memory_to_save, token usage and timings.
+        The LLM still produces the structured RAGResponse JSON; the `answer` field is
+        decoded incrementally from the stream so text reaches the client immediately.
+        """
+        started = time.perf_counter()
+        first_token_at: Optional[float] = None
+
+        if mode == "detailed":
+            context = await self._prepare_detailed(query, user_id, session_id, recent_history, metadata)
+        else:
+            context = await self._prepare_quick(query, user_id, session_id, recent_history)
+
+        if context.cached is not None:
+            rag_response, knowledge_chunks, usage = context.cached
+            first_token_at = time.perf_counter()
+            yield {"event": "token", "data": {"text": rag_response.answer}}
+        else:
+            system_prompt, user_prompt, knowledge_chunks = self._construct_prompts(query, context.memories, context.knowledge_chunks, recent_history)
+
+            answer_streamer = JSONStringFieldStreamer("answer")
+            raw_parts: List[str] = []
+            stream_usage: Dict[str, int] = {}
+            async for delta in self.llm_service.generate_stream(
+                user_prompt,
+                system_prompt,
+                schema=RAGResponse.model_json_schema(),
+                usage=stream_usage
+            ):
+                raw_parts.append(delta)
+                text = answer_streamer.feed(delta)
+                if text:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    yield {"event": "token", "data": {"text": text}}
+
+            rag_response = RAGResponse(**json.loads("".join(raw_parts)))
+            usage = self._add_usage(context.usage, stream_usage)
+            await self._after_answer(rag_response, knowledge_chunks, user_id, session_id, context)
+
+        finished = time.perf_counter()
+        ttft_ms = ((first_token_at or finished) - started) * 1000.0
+        duration_ms = (finished - started) * 1000.0
+        stream_metrics.record(ttft_ms, duration_ms)
+        logger.info("Chat stream for session %s: ttft=%.0f ms duration=%.0f ms", session_id, ttft_ms, duration_ms)
+
+        cited = [knowledge_chunks[i]["id"] for i in rag_response.chunk_indices if 0 <= i < len(knowledge_chunks)]
+        yield {
+            "event": "done",
+            "data": {
+                "answer": rag_response.answer,
+                "chunk_ids": cited,
+                "chunks_used": knowledge_chunks,
+                "memory_to_save": rag_response.memory_to_save,
+                "usage": usage,
+                "cached": bool(usage.get("cache_hit")),
+                "ttft_ms": ttft_ms,
+                "duration_ms": duration_ms,
+            },
+        }
+
+    async def _prepare_quick(self, query: str, user_id: str, session_id: str, recent_history: List[Dict]) -> _PreparedContext:
+        # 1. Parallel Context Retrieval (the query is embedded once and shared)
+        query_vector = await self.vector_store.embedding_model.aembed_query(query)
+        memory_task = asyncio.ensure_future(self.memory_service.asearch_memory(query, user_id=user_id, session_id=session_id, query_vector=query_vector))
+        vector_task = asyncio.ensure_future(self.vector_store.ammr_search(query, top_k=5, query_vector=query_vector))
+
+        # Semantic cache: once we know whether user memory is involved, a hit skips the LLM
+        memories = await memory_task
+        scope = self._answer_scope("quick", user_id, memories, recent_history, query)
+        cached = self._lookup_answer(scope, query_vector)
+        if cached is not None:
+            vector_task.cancel()
+            return _PreparedContext(cached=cached)
+        knowledge_chunks = await self._expand_neighbors(await vector_task)
+
+        return _PreparedContext(memories=memories, knowledge_chunks=knowledge_chunks, scope=scope, query_vector=query_vector)
+
+    async def _prepare_detailed(self, query: str, user_id: str, session_id: str, recent_history: List[Dict], metadata: Optional[Dict[str, Any]]) -> _PreparedContext:
         total_tokens = {"input_tokens": 0, "output_tokens": 0}
 
         # 1. Generate Query Plan
@@ -96,86 +194,187 @@ class RAGService:
             plan_user_prompt = f"User Query: {query}\n\nGenerate 5 sub-queries and 1 memory query.\n\nMetadata: {metadata}"
         else:
             plan_user_prompt = f"User Query: {query}\n\nGenerate 5 sub-queries and 1 memory query."
-        
-        plan_schema = RAGResponse.model_json_schema() # Placeholder, we need QueryPlan schema
-        from app.schemas.rag import QueryPlan # Local import to avoid circular dependency if any
+
         plan_schema = QueryPlan.model_json_schema()
 
-        plan_dict, plan_usage = await self.llm_service.get_structured_response(
-            user_prompt=plan_user_prompt,
-            system_prompt=plan_system_prompt,
-            schema=plan_schema
-        )
-        total_tokens["input_tokens"] += plan_usage["input_tokens"]
-        total_tokens["output_tokens"] += plan_usage["output_tokens"]
-        
-        query_plan = QueryPlan(**plan_dict)
-        
+        # A plan cached for a similar question with the same metadata skips the planning call
+        query_vector = None
+        cached_plan = None
+        if self.plan_cache is not None:
+            query_vector = await self.vector_store.embedding_model.aembed_query(query)
+            cached_plan = self.plan_cache.lookup_plan(metadata, query_vector)
+
+        plan_task = None
+        plan_started = time.perf_counter()
+        if cached_plan is None:
+            plan_task = asyncio.ensure_future(self.llm_service.get_structured_response(
+                user_prompt=plan_user_prompt,
+                system_prompt=plan_system_prompt,
+                schema=plan_schema
+            ))
+
+        # Semantic cache lookup runs alongside planning; a hit cancels the planning call
+        scope = None
+        if self.answer_cache is not None:
+            if query_vector is None:
+                query_vector = await self.vector_store.embedding_model.aembed_query(query)
+            probe_memories = await self.memory_service.asearch_memory(query, user_id=user_id, session_id=session_id, query_vector=query_vector)
+            scope = self._answer_scope("detailed", user_id, probe_memories, recent_history, query, metadata)
+            cached = self._lookup_answer(scope, query_vector)
+            if cached is not None:
+                if plan_task is not None:
+                    plan_task.cancel()
+                return _PreparedContext(cached=cached)
+
+        if cached_plan is not None:
+            query_plan = cached_plan
+        else:
+            plan_dict, plan_usage = await plan_task
+            planning_ms = (time.perf_counter() - plan_started) * 1000.0
+            total_tokens["input_tokens"] += plan_usage["input_tokens"]
+            total_tokens["output_tokens"] += plan_usage["output_tokens"]
+
+            query_plan = QueryPlan(**plan_dict)
+            if self.plan_cache is not None:
+                self.plan_cache.store_plan(
+                    metadata, query_vector, query_plan, planning_ms,
+                    plan_usage["input_tokens"] + plan_usage["output_tokens"]
+                )
+
         # 2. Parallel Execution
         # Memory Search
-        memory_task = self.memory_service.search_memory(query_plan.memory_query, user_id=user_id, session_id=session_id)
-        
-        # Vector Searches (5 sub-queries)
-        vector_tasks = []
-        for sub_q in query_plan.sub_queries:
-            vector_tasks.append(self.vector_store.mmr_search(
-                query=sub_q.query, 
-                top_k=2, 
-                filter=sub_q.filter if sub_q.filter else None
-            ))
-            
-        results = await asyncio.gather(memory_task, *vector_tasks)
-        
-        memories = results[0]
-        vector_results_lists = results[1:]
-        
-        # 3. Aggregate & Deduplicate Knowledge Chunks
-        unique_chunks = {}
-        for res_list in vector_results_lists:
-            for chunk in res_list:
-                if chunk['id'] not in unique_chunks:
-                    unique_chunks[chunk['id']] = chunk
-        
-        knowledge_chunks = list(unique_chunks.values())
-        
-        # 4. Format Context & Generate Final Answer
-        system_prompt, user_prompt = self._construct_prompts(query, memories, knowledge_chunks, recent_history)
-        
+        memory_task = self.memory_service.asearch_memory(query_plan.memory_query, user_id=user_id, session_id=session_id)
+
+        # Vector Searches (5 sub-queries, encoded and searched together, then one
+        # MMR pass over the pooled candidates with at least one chunk per sub-query)
+        vector_task = self.vector_store.amulti_query_search(
+            [{"query": sub_q.query, "filter": sub_q.filter if sub_q.filter else None} for sub_q in query_plan.sub_queries],
+            top_k=2 * len(query_plan.sub_queries),
+            min_per_query=1
+        )
+
+        memories, knowledge_chunks = await asyncio.gather(memory_task, vector_task)
+        knowledge_chunks = await self._expand_neighbors(knowledge_chunks)
+
+        return _PreparedContext(
+            memories=memories,
+            knowledge_chunks=knowledge_chunks,
+            usage=total_tokens,
+            scope=scope,
+            query_vector=query_vector
+        )
+
+    async def _expand_neighbors(self, knowledge_chunks: List[Dict]) -> List[Dict]:
+        if self.neighbor_expander is None:
+            return knowledge_chunks
+        return await self.neighbor_expander.aexpand(knowledge_chunks)
+
+    async def _answer(self, query: str, user_id: str, session_id: str, recent_history: List[Dict], context: _PreparedContext) -> tuple[RAGResponse, List[Dict], Dict[str, int]]:
+        # Format Context (chunk indices refer to the chunks that fit the token budget)
+        system_prompt, user_prompt, knowledge_chunks = self._construct_prompts(query, context.memories, context.knowledge_chunks, recent_history)
+
+        # LLM Call for Structured Output
+        # We need a schema for the LLM to follow. We can reuse the Pydantic model's JSON schema.
         response_schema = RAGResponse.model_json_schema()
+
         llm_response_dict, answer_usage = await self.llm_service.get_structured_response(
             user_prompt=user_prompt,
             system_prompt=system_prompt,
             schema=response_schema
         )
-        total_tokens["input_tokens"] += answer_usage["input_tokens"]
-        total_tokens["output_tokens"] += answer_usage["output_tokens"]
-        
+
+        # Parse Response
         rag_response = RAGResponse(**llm_response_dict)
-        
-        # 5. Update Memory
+        await self._after_answer(rag_response, knowledge_chunks, user_id, session_id, context)
+
+        return rag_response, knowledge_chunks, self._add_usage(context.usage, answer_usage)
+
+    async def _after_answer(self, rag_response: RAGResponse, knowledge_chunks: List[Dict], user_id: str, session_id: str, context: _PreparedContext):
+        # Update Memory (if needed)
         if rag_response.memory_to_save:
-             self.memory_service.add_memory(rag_response.memory_to_save, user_id, session_id)
+            if self.write_behind is not None:
+                await self.write_behind.add_memory(rag_response.memory_to_save, user_id, session_id)
+            else:
+                await self.memory_service.aadd_memory(rag_response.memory_to_save, user_id, session_id)
+
+        if context.scope is not None:
+            self._store_answer(context.scope, context.query_vector, rag_response, knowledge_chunks)
 
-        return rag_response, knowledge_chunks, total_tokens
-    def _construct_prompts(self, query: str, memories: List[Dict], knowledge_chunks: List[Dict], recent_history: List[Dict]) -> tuple[str, str]:
+    @staticmethod
+    def _add_usage(total: Dict[str, int], usage: Dict[str, int]) -> Dict[str, int]:
+        input_tokens = total.get("input_tokens", 0) + usage.get("input_tokens", 0)
+        output_tokens = total.get("output_tokens", 0) + usage.get("output_tokens", 0)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens
+        }
+
+    def _answer_scope(self, mode: str, user_id: str, memories: List[Dict], recent_history: List[Dict], query: str, metadata: Optional[Dict[str, Any]] = None) -> Hashable:
         """
-        Constructs system and user prompts with context.
+        Cache scope for an answer. Answers are only shared between requests against the
+        same knowledge-base version, mode and metadata, with the same preceding
+        conversation, and - when user memory was retrieved - only for the same user
+        and memories.
         """
+        memory_scope = (user_id, tuple(sorted(m["id"] for m in memories))) if memories else None
+
+        history = list(recent_history[-3:])
+        if history and history[-1].get("role") == "user" and history[-1].get("content") == query:
+            history = history[:-1]
+        history_digest = hashlib.sha1(
+            json.dumps([(m.get("role"), m.get("content")) for m in history]).encode("utf-8")
+        ).hexdigest() if history else None
+
+        metadata_key = json.dumps(metadata, sort_keys=True, default=str) if metadata else None
+        return (self.vector_store.kb_version, mode, memory_scope, history_digest, metadata_key)
+
+    def _lookup_answer(self, scope: Hashable, query_vector) -> Optional[tuple[RAGResponse, List[Dict], Dict[str, int]]]:
+        if self.answer_cache is None:
+            return None
+        hit = self.answer_cache.lookup(scope, query_vector)
+        if hit is None:
+            return None
+        (rag_response, knowledge_chunks), _similarity = hit
+        usage = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0, "cache_hit": 1}
+        return rag_response.model_copy(deep=True), list(knowledge_chunks), usage
+
+    def _store_answer(self, scope: Hashable, query_vector, rag_response: RAGResponse, knowledge_chunks: List[Dict]):
+        # Answers that extracted a personal memory are specific to this user's message
+        if self.answer_cache is None or rag_response.memory_to_save:
+            return
+        self.answer_cache.store(scope, query_vector, (rag_response.model_copy(deep=True), list(knowledge_chunks)))
+
+    def _construct_prompts(self, query: str, memories: List[Dict], knowledge_chunks: List[Dict], recent_history: List[Dict]) -> tuple[str, str, List[Dict]]:
+        """
+        Constructs system and user prompts with context, packed into the context token budget.
+        Returns (system_prompt, user_prompt, knowledge_chunks_used).
+        """
+        # Everything but the retrieved context is always sent
+        fixed_system, fixed_user = self._format_prompts(query, [], [], [])
+        packed = self.context_packer.pack(fixed_system + fixed_user, memories, knowledge_chunks, recent_history)
+        if packed.dropped or packed.trimmed:
+            logger.info("Context packing: %d items dropped, %d trimmed (%d tokens)", packed.dropped, packed.trimmed, packed.tokens)
+
+        system_prompt, user_prompt = self._format_prompts(query, packed.memories, packed.knowledge_chunks, packed.history)
+        return system_prompt, user_prompt, packed.knowledge_chunks
+
+    def _format_prompts(self, query: str, memories: List[Dict], knowledge_chunks: List[Dict], history: List[Dict]) -> tuple[str, str]:
         # Format Memory
         memory_context = "\n".join([f"- {m['text']} (Date: {m['metadata'].get('date', 'N/A')})" for m in memories])
-        
+
         # Format Knowledge Chunks with Indices
         knowledge_context = ""
         for i, chunk in enumerate(knowledge_chunks):
             knowledge_context += f"[{i}] {chunk['text']}\n"
-            
-        # Format History (Last 3 turns)
+
+        # Format History (last turns, already limited by the packer)
         history_context = ""
-        for msg in recent_history[-3:]:
+        for msg in history:
             role = msg.get("role", "unknown")
             content = msg.get("content", "")
             history_context += f"{role}: {content}\n"
-            
+
         system_prompt = """You are a helpful AI assistant for the Future Club chatbot.
         Use the provided context to answer the user's question.
         
@@ -186,7 +385,7 @@ class RAGService:
         When using information from the 'Knowledge Base', you MUST cite the chunk index (e.g., [0], [1]) in your `chunk_indices` field.
         If the user provides new important personal information (e.g., "I like red"), extract it into `memory_to_save`.
         """
-        
+
         user_prompt = f"""
         # User Memory
         {memory_context}
@@ -200,5 +399,5 @@ class RAGService:
         # User Query
         {query}
         """
-        
+
         return system_prompt, user_prompt
@@ -0,0 +1,296 @@
+"""
+LLM Rate Limiter
+
+This service schedules every LLM API call of the process through one shared
+client-side scheduler, so bursts of bulk work (ingestion metadata extraction)
+cannot starve interactive chat traffic or run into provider rate limits.
+
+- Token buckets cap requests/minute and tokens/minute; a call's token cost is
+  estimated from its prompt before it is sent and corrected with the usage the
+  API reports afterwards.
+- Concurrency is adapted AIMD-style: halved on a 429, reduced when latency
+  exceeds the target, and grown slowly while calls succeed.
+- 429s and transient errors are retried with jittered exponential backoff,
+  honouring `Retry-After` (which also pauses all dispatch until it expires).
+- Waiting calls are served by priority; bulk calls may only use part of the
+  concurrency so interactive calls always find a free slot quickly.
+"""
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+from contextlib import asynccontextmanager
+from enum import IntEnum
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from app.core.config import settings
+from app.core.logging import logger
+
+T = TypeVar("T")
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0 # chat answers and query planning
+    BULK = 1 # ingestion and other background work
+
+
+class TokenBucket:
+    """Refills continuously at `per_minute / 60` per second up to `per_minute`. Disabled when `per_minute <= 0`."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` (clipped to the capacity) is available."""
+        if not self.enabled:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float, now: float):
+        if self.enabled:
+            self._refill(now)
+            self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float):
+        """Charges (positive) or refunds (negative) a correction; the bucket may go into debt."""
+        if self.enabled:
+            self.tokens = max(-self.capacity, min(self.capacity, self.tokens - delta))
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        requests_per_minute: int = settings.LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = settings.LLM_TOKENS_PER_MINUTE,
+        max_concurrency: int = settings.LLM_MAX_CONCURRENCY,
+        min_concurrency: int = settings.LLM_MIN_CONCURRENCY,
+        target_latency_s: float = settings.LLM_TARGET_LATENCY_S,
+        bulk_max_share: float = settings.LLM_BULK_MAX_SHARE,
+        max_retries: int = settings.LLM_MAX_RETRIES,
+        backoff_base_s: float = settings.LLM_BACKOFF_BASE_S,
+        backoff_max_s: float = settings.LLM_BACKOFF_MAX_S,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.target_latency = target_latency_s
+        self.bulk_max_share = min(1.0, max(0.0, bulk_max_share))
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = max(0.0, backoff_base_s)
+        self.backoff_max = max(self.backoff_base, backoff_max_s)
+
+        self._limit = float(self.max_concurrency)
+        self._inflight = 0
+        self._paused_until = 0.0
+        # (priority, sequence, estimated tokens, future) - the sequence keeps FIFO order within a priority
+        self._waiters: List[Tuple[int, int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        # Stats
+        self._calls = {p: 0 for p in Priority}
+        self._total_wait = {p: 0.0 for p in Priority}
+        self._rate_limited = 0
+        self._retries = 0
+        self._errors = 0
+
+    @property
+    def concurrency_limit(self) -> int:
+        return max(self.min_concurrency, int(self._limit))
+
+    async def run(self, call: Callable[[], Awaitable[T]], estimated_tokens: int, priority: Priority = Priority.INTERACTIVE) -> T:
+        """Runs `call` under the limits, retrying 429s and transient errors."""
+        attempt = 0
+        while True:
+            try:
+                async with self.slot(estimated_tokens, priority):
+                    return await call()
+            except Exception as e:
+                delay = self.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                logger.warning("LLM call failed (%s), retry %d in %.2fs", type(e).__name__, attempt, delay)
+                await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int, priority: Priority = Priority.INTERACTIVE, adapt_to_latency: bool = True):
+        """
+        Holds one concurrency slot (and the estimated rate-limit budget) for the
+        duration of the block. Use directly for calls that can't simply be
+        re-run, such as streams; retries are then up to the caller.
+        """
+        await self._acquire(estimated_tokens, priority)
+        started = time.monotonic()
+        outcome = "ok"
+        try:
+            yield
+        except Exception as e:
+            outcome = "rate_limited" if _status_code(e) == 429 else "error"
+            raise
+        except BaseException:
+            outcome = "cancelled"
+            raise
+        finally:
+            self._release(outcome, time.monotonic() - started if adapt_to_latency else None)
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: int):
+        """Corrects the token bucket once the real usage of a call is known."""
+        self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying `error`, or None if it should not be retried."""
+        if attempt >= self.max_retries or not _is_retriable(error):
+            return None
+        self._retries += 1
+        backoff = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            # The provider told us when to come back; hold every call until then
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            return retry_after + random.uniform(0, backoff)
+        return random.uniform(backoff / 2, backoff)
+
+    def stats(self) -> Dict[str, Any]:
+        queued = {p.name.lower(): 0 for p in Priority}
+        for priority, _, _, future in self._waiters:
+            if not future.done():
+                queued[Priority(priority).name.lower()] += 1
+        return {
+            "inflight": self._inflight,
+            "concurrency_limit": self.concurrency_limit,
+            "queued": queued,
+            "calls": {p.name.lower(): n for p, n in self._calls.items()},
+            "avg_wait_ms": {
+                p.name.lower(): (self._total_wait[p] / self._calls[p] * 1000.0) if self._calls[p] else 0.0
+                for p in Priority
+            },
+            "rate_limited": self._rate_limited,
+            "retries": self._retries,
+            "errors": self._errors,
+            "paused_for_s": max(0.0, self._paused_until - time.monotonic()),
+        }
+
+    async def _acquire(self, estimated_tokens: int, priority: Priority):
+        future = asyncio.get_running_loop().create_future()
+        enqueued = time.monotonic()
+        heapq.heappush(self._waiters, (int(priority), next(self._seq), estimated_tokens, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just before the caller was cancelled; give the slot back
+                self._release("cancelled", None)
+            else:
+                self._dispatch()
+            raise
+        self._calls[priority] += 1
+        self._total_wait[priority] += time.monotonic() - enqueued
+
+    def _release(self, outcome: str, latency: Optional[float]):
+        self._inflight -= 1
+        if outcome == "rate_limited":
+            self._rate_limited += 1
+            self._limit = max(self.min_concurrency, self._limit / 2)
+        elif outcome == "error":
+            self._errors += 1
+        elif outcome == "ok" and latency is not None:
+            if self.target_latency > 0 and latency > self.target_latency:
+                self._limit = max(self.min_concurrency, self._limit * 0.9)
+            else:
+                self._limit = min(self.max_concurrency, self._limit + 1.0 / self._limit)
+        self._dispatch()
+
+    def _dispatch(self):
+        """Grants waiting calls, highest priority first, while every limit allows it."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        while self._waiters:
+            priority, _, estimated_tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if now < self._paused_until:
+                self._schedule(self._paused_until - now)
+                return
+            limit = self.concurrency_limit
+            if priority == Priority.BULK:
+                # Bulk work leaves the remaining slots to interactive calls
+                limit = max(1, int(limit * self.bulk_max_share))
+            if self._inflight >= limit:
+                return # a release will dispatch again
+            wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(estimated_tokens, now))
+            if wait > 0:
+                self._schedule(wait)
+                return
+            heapq.heappop(self._waiters)
+            self.requests.take(1, now)
+            self.tokens.take(estimated_tokens, now)
+            self._inflight += 1
+            future.set_result(None)
+
+    def _schedule(self, delay: float):
+        self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    return getattr(error, "status_code", None)
+
+
+def _is_retriable(error: Exception) -> bool:
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    # openai.APIConnectionError / APITimeoutError carry no status code
+    import openai
+    return isinstance(error, (openai.APIConnectionError, asyncio.TimeoutError))
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        # HTTP-date form; fall back to regular backoff
+        return None
+    return None
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Returns the process-wide LLMScheduler, creating it on first use."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler()
+    return _scheduler
@@ -0,0 +1,121 @@
+"""
+Semantic Cache
+
+This file provides a similarity-keyed cache: values are stored under a scope
+(any hashable key, e.g. knowledge-base version + memory context) together with
+the embedding of the text that produced them, and a lookup returns the most
+similar entry in the same scope if it clears a configurable threshold.
+Entries expire after a TTL and the cache is LRU-bounded in size.
+"""
+from typing import Any, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+from collections import OrderedDict
+from dataclasses import dataclass
+import itertools
+import threading
+import time
+import numpy as np
+
+T = TypeVar("T")
+
+
+@dataclass
+class _Entry(Generic[T]):
+    scope: Hashable
+    vector: np.ndarray
+    value: T
+    expires_at: float
+
+
+class SemanticCache(Generic[T]):
+    def __init__(self, threshold: float = 0.95, max_entries: int = 5000, ttl_seconds: float = 3600.0):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._entries: "OrderedDict[int, _Entry[T]]" = OrderedDict()
+        # scope -> (entry ids, stacked vectors or None when stale)
+        self._scopes: Dict[Hashable, Tuple[List[int], Optional[np.ndarray]]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, scope: Hashable, vector, threshold: Optional[float] = None) -> Optional[Tuple[T, float]]:
+        """Returns (value, similarity) of the closest live entry in `scope`, or None."""
+        threshold = self.threshold if threshold is None else threshold
+        query = self._unit(vector)
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(scope, now)
+            ids, matrix = self._scopes.get(scope, ([], None))
+            if not ids:
+                self.misses += 1
+                return None
+            if matrix is None:
+                matrix = np.stack([self._entries[i].vector for i in ids])
+                self._scopes[scope] = (ids, matrix)
+
+            sims = matrix @ query
+            best = int(np.argmax(sims))
+            similarity = float(sims[best])
+            if similarity < threshold:
+                self.misses += 1
+                return None
+
+            entry_id = ids[best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return self._entries[entry_id].value, similarity
+
+    def store(self, scope: Hashable, vector, value: T):
+        entry = _Entry(scope=scope, vector=self._unit(vector), value=value, expires_at=time.monotonic() + self.ttl_seconds)
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = entry
+            ids, _ = self._scopes.get(scope, ([], None))
+            ids.append(entry_id)
+            self._scopes[scope] = (ids, None)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "scopes": len(self._scopes),
+                "threshold": self.threshold,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(v)
+        return v / norm if norm > 0 else v
+
+    def _purge_expired(self, scope: Hashable, now: float):
+        ids, _ = self._scopes.get(scope, ([], None))
+        for entry_id in [i for i in ids if self._entries[i].expires_at < now]:
+            self._remove(entry_id)
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        ids, _ = self._scopes[entry.scope]
+        ids.remove(entry_id)
+        if ids:
+            self._scopes[entry.scope] = (ids, None)
+        else:
+            del self._scopes[entry.scope]
@@ -0,0 +1,945 @@
+"""
+Vector Index Backends
+
+This file defines the storage interface used by VectorStore and MemoryService
+(upsert, filtered query, fetch by id, delete, metadata update) and its implementations:
+
+- PineconeIndex: thin adapter over a Pinecone index.
+- LocalVectorIndex: exact in-process search over a memory-mapped matrix stored
+  as float32, float16 or int8 with per-vector scales (EMBEDDING_STORAGE_DTYPE).
+- LocalIVFIndex: approximate inverted-file (IVF) search for larger corpora.
+
+The local backends persist vectors to memory-mapped files and metadata to an
+append-only log, so restarts reopen the index instead of rebuilding it. They
+support the same `namespace` and Pinecone-style `filter` semantics as the
+existing code (equality, $eq/$ne/$in/$nin/$gt/$gte/$lt/$lte/$exists, $and/$or).
+"""
+from typing import List, Dict, Any, Optional, Sequence, Set, Tuple
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+import json
+import os
+import threading
+import numpy as np
+from app.core.config import settings
+from app.core.logging import logger
+from app.services.compact_embedding import CompactEmbedding, as_float_matrix, as_float_vector, as_list, dot, quantize, storage_dtype
+
+
+@dataclass
+class IndexMatch:
+    id: str
+    score: float = 0.0
+    # Lists from Pinecone, CompactEmbedding from the local backends
+    values: Optional[Any] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class QueryResult:
+    matches: List[IndexMatch] = field(default_factory=list)
+
+
+class VectorIndex(ABC):
+    """Backend interface; `vectors` are (id, values, metadata) tuples as with Pinecone."""
+
+    # True when query_many scans the index once for all vectors (instead of one query each)
+    batch_queries = False
+
+    @abstractmethod
+    def upsert(self, vectors: List[Tuple[str, Sequence[float], Dict[str, Any]]], namespace: str = "") -> None:
+        ...
+
+    @abstractmethod
+    def query(
+        self,
+        vector: Sequence[float],
+        top_k: int,
+        namespace: str = "",
+        filter: Optional[Dict[str, Any]] = None,
+        include_values: bool = False,
+        include_metadata: bool = True,
+    ) -> QueryResult:
+        ...
+
+    def query_many(
+        self,
+        vectors: Sequence[Sequence[float]],
+        top_k: int,
+        namespace: str = "",
+        filter: Optional[Dict[str, Any]] = None,
+        include_values: bool = False,
+        include_metadata: bool = True,
+    ) -> List[QueryResult]:
+        """`query` for several vectors sharing one filter; one result per vector."""
+        return [self.query(vector, top_k, namespace, filter, include_values, include_metadata) for vector in vectors]
+
+    @abstractmethod
+    def fetch(self, ids: List[str], namespace: str = "") -> Dict[str, IndexMatch]:
+        ...
+
+    @abstractmethod
+    def delete(self, ids: List[str], namespace: str = "") -> None:
+        ...
+
+    def update_metadata(self, id: str, set_metadata: Dict[str, Any], namespace: str = "") -> None:
+        """Merges `set_metadata` into a stored vector's metadata without re-sending its values."""
+        found = self.fetch([id], namespace=namespace).get(id)
+        if found is not None:
+            self.upsert([(id, found.values, {**found.metadata, **set_metadata})], namespace=namespace)
+
+    def describe_index_stats(self) -> Dict[str, Any]:
+        return {}
+
+    def close(self):
+        pass
+
+
+# -- Pinecone ---------------------------------------------------------------
+
+class PineconeIndex(VectorIndex):
+    def __init__(self, api_key: str = settings.PINECONE_API_KEY, index_name: str = settings.PINECONE_INDEX_NAME):
+        from pinecone import Pinecone
+        self.pc = Pinecone(api_key=api_key)
+        self.index = self.pc.Index(index_name)
+
+    def upsert(self, vectors, namespace: str = "") -> None:
+        # The client sends JSON, so compact / NumPy vectors become lists only here
+        vectors = [(vid, as_list(values), metadata) for vid, values, metadata in vectors]
+        self.index.upsert(vectors=vectors, namespace=namespace)
+
+    def query(self, vector, top_k, namespace="", filter=None, include_values=False, include_metadata=True) -> QueryResult:
+        results = self.index.query(
+            vector=as_list(vector),
+            top_k=top_k,
+            include_values=include_values,
+            include_metadata=include_metadata,
+            namespace=namespace,
+            filter=filter
+        )
+        return QueryResult(matches=[
+            IndexMatch(
+                id=match.id,
+                score=match.score,
+                values=match.values if include_values else None,
+                metadata=match.metadata or {}
+            )
+            for match in results.matches
+        ])
+
+    def fetch(self, ids, namespace="") -> Dict[str, IndexMatch]:
+        if not ids:
+            return {}
+        response = self.index.fetch(ids=list(ids), namespace=namespace)
+        return {
+            vid: IndexMatch(id=vid, values=vec.values, metadata=vec.metadata or {})
+            for vid, vec in response.vectors.items()
+        }
+
+    def delete(self, ids, namespace="") -> None:
+        if ids:
+            self.index.delete(ids=list(ids), namespace=namespace)
+
+    def update_metadata(self, id, set_metadata, namespace="") -> None:
+        self.index.update(id=id, set_metadata=set_metadata, namespace=namespace)
+
+    def describe_index_stats(self) -> Dict[str, Any]:
+        return self.index.describe_index_stats()
+
+
+# -- Filters ----------------------------------------------------------------
+
+def _compare(value: Any, op: str, operand: Any) -> bool:
+    values = value if isinstance(value, list) else [value]
+    if op == "$eq":
+        return operand in values
+    if op == "$ne":
+        return operand not in values
+    if op == "$in":
+        return any(v in operand for v in values)
+    if op == "$nin":
+        return not any(v in operand for v in values)
+    if op == "$exists":
+        return (value is not None) == bool(operand)
+    if value is None or isinstance(value, list):
+        return False
+    try:
+        if op == "$gt":
+            return value > operand
+        if op == "$gte":
+            return value >= operand
+        if op == "$lt":
+            return value < operand
+        if op == "$lte":
+            return value <= operand
+    except TypeError:
+        return False
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+
+def matches_filter(metadata: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+    """Evaluates a Pinecone-style metadata filter against one metadata dict."""
+    if not filter:
+        return True
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+        else:
+            value = metadata.get(key)
+            if isinstance(condition, dict):
+                for op, operand in condition.items():
+                    if op != "$exists" and value is None:
+                        if op in ("$ne", "$nin"):
+                            continue
+                        return False
+                    if not _compare(value, op, operand):
+                        return False
+            elif value is None or not _compare(value, "$eq", condition):
+                return False
+    return True
+
+
+def _equality_terms(filter: Dict[str, Any]) -> Tuple[Optional[List[Tuple[str, List[Any]]]], bool]:
+    """
+    Extracts (field, allowed_values) pairs from the top-level equality / $in
+    clauses of a filter, used to narrow candidate rows through the field index.
+    Returns (terms or None, exact) where `exact` means the terms express the
+    whole filter, so matching rows need no further verification.
+    """
+    terms = []
+    exact = True
+    for key, condition in filter.items():
+        if key.startswith("$"):
+            exact = False
+            continue
+        if isinstance(condition, dict):
+            if "$eq" in condition:
+                terms.append((key, [condition["$eq"]]))
+            elif "$in" in condition:
+                terms.append((key, list(condition["$in"])))
+            if set(condition) - {"$eq", "$in"} or len(condition) != 1:
+                exact = False
+        else:
+            terms.append((key, [condition]))
+    return (terms or None), exact and bool(terms)
+
+
+# -- Local (in-process) -----------------------------------------------------
+
+class _MappedMatrix:
+    """A growable (rows, width) matrix backed by a memory-mapped file."""
+
+    def __init__(self, path: str, dtype, width: int, initial_rows: int = 1024):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.width = width
+        row_bytes = self.dtype.itemsize * width
+        if not os.path.exists(path) or os.path.getsize(path) < row_bytes:
+            with open(path, "wb") as f:
+                f.truncate(initial_rows * row_bytes)
+        self.capacity = os.path.getsize(path) // row_bytes
+        self.data = np.memmap(path, dtype=self.dtype, mode="r+", shape=(self.capacity, width))
+
+    def ensure_capacity(self, rows: int):
+        if rows <= self.capacity:
+            return
+        new_capacity = max(rows, self.capacity * 2)
+        self.data.flush()
+        del self.data
+        with open(self.path, "r+b") as f:
+            f.truncate(new_capacity * self.dtype.itemsize * self.width)
+        self.capacity = new_capacity
+        self.data = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(self.capacity, self.width))
+
+    def flush(self):
+        self.data.flush()
+
+
+class _Namespace:
+    """Vectors, ids and metadata of one namespace, plus a field index for equality filters."""
+
+    # Rewrite the metadata log once it holds this many more records than live rows
+    _COMPACT_SLACK = 50000
+
+    def __init__(self, path: Optional[str], dtype: str = settings.EMBEDDING_STORAGE_DTYPE):
+        self.path = path
+        self.lock = threading.RLock()
+        self.dim: Optional[int] = None
+        # Storage dtype of new namespaces; an existing one keeps the dtype in its header
+        self.dtype = storage_dtype(dtype)
+        self.vectors: Optional[_MappedMatrix] = None
+        self._memory_vectors: Optional[np.ndarray] = None
+        # Per-row scales of int8 codes (width-1 matrix), None for float storage
+        self.scale_store: Optional[_MappedMatrix] = None
+        self._memory_scales: Optional[np.ndarray] = None
+        self.ids: List[Optional[str]] = []
+        self.metadata: List[Optional[Dict[str, Any]]] = []
+        self.id_to_row: Dict[str, int] = {}
+        self.alive = np.zeros(0, dtype=bool)
+        self.field_index: Dict[str, Dict[Any, Set[int]]] = {}
+        self._log_records = 0
+        self._log = None
+
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            self._load()
+
+    # Persistence
+
+    def _header_path(self) -> str:
+        return os.path.join(self.path, "header.json")
+
+    def _log_path(self) -> str:
+        return os.path.join(self.path, "metadata.jsonl")
+
+    def _load(self):
+        if os.path.exists(self._header_path()):
+            with open(self._header_path()) as f:
+                header = json.load(f)
+            # Namespaces written before compact storage have no dtype: float32
+            self.dtype = storage_dtype(header.get("dtype", "float32"))
+            self._open_vectors(header["dim"])
+        if os.path.exists(self._log_path()):
+            with open(self._log_path()) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    self._log_records += 1
+                    if record["op"] == "upsert":
+                        self._set_row(record["row"], record["id"], record["metadata"])
+                    else:
+                        self._clear_row(self.id_to_row.get(record["id"]))
+            logger.info("Loaded local vector namespace %s (%d vectors)", self.path, len(self.id_to_row))
+        self._log = open(self._log_path(), "a")
+
+    _VECTOR_FILES = {"float32": "vectors.f32", "float16": "vectors.f16", "int8": "vectors.i8"}
+
+    def _open_vectors(self, dim: int):
+        self.dim = dim
+        quantized = self.dtype == np.int8
+        if self.path is None:
+            self._memory_vectors = np.zeros((1024, dim), dtype=self.dtype)
+            if quantized:
+                self._memory_scales = np.zeros((1024, 1), dtype=np.float32)
+        else:
+            self.vectors = _MappedMatrix(os.path.join(self.path, self._VECTOR_FILES[self.dtype.name]), self.dtype, dim)
+            if quantized:
+                self.scale_store = _MappedMatrix(os.path.join(self.path, "scales.f32"), np.float32, 1)
+            if not os.path.exists(self._header_path()):
+                with open(self._header_path(), "w") as f:
+                    json.dump({"dim": dim, "dtype": self.dtype.name}, f)
+
+    def _append_log(self, records: List[Dict[str, Any]]):
+        if self._log is None:
+            return
+        for record in records:
+            self._log.write(json.dumps(record) + "\n")
+        self._log.flush()
+        self._log_records += len(records)
+        if self._log_records > len(self.id_to_row) + self._COMPACT_SLACK:
+            self._compact_log()
+
+    def _compact_log(self):
+        tmp = self._log_path() + ".tmp"
+        with open(tmp, "w") as f:
+            for row, vid in enumerate(self.ids):
+                if vid is not None and self.alive[row]:
+                    f.write(json.dumps({"op": "upsert", "row": row, "id": vid, "metadata": self.metadata[row]}) + "\n")
+        self._log.close()
+        os.replace(tmp, self._log_path())
+        self._log = open(self._log_path(), "a")
+        self._log_records = len(self.id_to_row)
+
+    def flush(self):
+        if self.vectors is not None:
+            self.vectors.flush()
+        if self.scale_store is not None:
+            self.scale_store.flush()
+        if self._log is not None:
+            self._log.flush()
+
+    def close(self):
+        self.flush()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    # Rows
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Stored codes of all rows, in the storage dtype (see `scales`)."""
+        data = self.vectors.data if self.vectors is not None else self._memory_vectors
+        return data[:len(self.ids)]
+
+    @property
+    def scales(self) -> Optional[np.ndarray]:
+        """Per-row scales of int8 codes, or None for float storage."""
+        if self.scale_store is not None:
+            return self.scale_store.data[:len(self.ids), 0]
+        if self._memory_scales is not None:
+            return self._memory_scales[:len(self.ids), 0]
+        return None
+
+    def row_embedding(self, row: int) -> CompactEmbedding:
+        scales = self.scales
+        return CompactEmbedding(np.array(self.matrix[row]), None if scales is None else float(scales[row]))
+
+    def float_rows(self, rows: np.ndarray) -> np.ndarray:
+        """Dequantized float32 copies of `rows`."""
+        codes = np.asarray(self.matrix[rows], dtype=np.float32)
+        scales = self.scales
+        return codes if scales is None else codes * scales[rows][:, None]
+
+    def score(self, rows: Optional[np.ndarray], other: np.ndarray) -> np.ndarray:
+        """Dot products of `rows` (or all rows) with a query vector or (dim, k) matrix."""
+        scales = self.scales
+        if rows is None:
+            return dot(self.matrix, scales, other)
+        return dot(self.matrix[rows], None if scales is None else scales[rows], other)
+
+    @staticmethod
+    def _grow(array: np.ndarray, rows: int) -> np.ndarray:
+        grown = np.zeros((max(rows, array.shape[0] * 2),) + array.shape[1:], dtype=array.dtype)
+        grown[:array.shape[0]] = array
+        return grown
+
+    def _ensure_rows(self, rows: int):
+        if self.vectors is not None:
+            self.vectors.ensure_capacity(rows)
+            if self.scale_store is not None:
+                self.scale_store.ensure_capacity(rows)
+        elif rows > self._memory_vectors.shape[0]:
+            self._memory_vectors = self._grow(self._memory_vectors, rows)
+            if self._memory_scales is not None:
+                self._memory_scales = self._grow(self._memory_scales, rows)
+        if rows > len(self.alive):
+            alive = np.zeros(max(rows, len(self.alive) * 2, 1024), dtype=bool)
+            alive[:len(self.alive)] = self.alive
+            self.alive = alive
+        while len(self.ids) < rows:
+            self.ids.append(None)
+            self.metadata.append(None)
+
+    def _index_fields(self, row: int, metadata: Dict[str, Any], add: bool):
+        for key, value in metadata.items():
+            for v in (value if isinstance(value, list) else [value]):
+                try:
+                    bucket = self.field_index.setdefault(key, {}).setdefault(v, set())
+                except TypeError:
+                    continue
+                if add:
+                    bucket.add(row)
+                else:
+                    bucket.discard(row)
+
+    def _set_row(self, row: int, vid: str, metadata: Dict[str, Any]):
+        self._ensure_rows(row + 1)
+        if self.metadata[row] is not None:
+            self._index_fields(row, self.metadata[row], add=False)
+        self.ids[row] = vid
+        self.metadata[row] = metadata
+        self.id_to_row[vid] = row
+        self.alive[row] = True
+        self._index_fields(row, metadata, add=True)
+
+    def _clear_row(self, row: Optional[int]):
+        if row is None or not self.alive[row]:
+            return
+        self._index_fields(row, self.metadata[row], add=False)
+        self.id_to_row.pop(self.ids[row], None)
+        self.alive[row] = False
+
+    # Operations
+
+    def upsert(self, vectors: List[Tuple[str, Sequence[float], Dict[str, Any]]]):
+        if not vectors:
+            return
+        values = as_float_matrix([v[1] for v in vectors])
+        # Store unit vectors so the dot product is cosine similarity
+        norms = np.linalg.norm(values, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        values = values / norms
+
+        with self.lock:
+            if self.dim is None:
+                self._open_vectors(values.shape[1])
+            elif values.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension {values.shape[1]} does not match index dimension {self.dim}")
+
+            records = []
+            next_row = len(self.ids)
+            rows = []
+            assigned: Dict[str, int] = {}
+            for vid, _, metadata in vectors:
+                row = assigned.get(vid, self.id_to_row.get(vid))
+                if row is None:
+                    row = next_row
+                    next_row += 1
+                assigned[vid] = row
+                rows.append(row)
+            self._ensure_rows(next_row)
+            codes, scales = quantize(values, self.dtype)
+            data = self.vectors.data if self.vectors is not None else self._memory_vectors
+            data[rows] = codes
+            if scales is not None:
+                scale_data = self.scale_store.data if self.scale_store is not None else self._memory_scales
+                scale_data[rows, 0] = scales
+            for row, (vid, _, metadata) in zip(rows, vectors):
+                metadata = dict(metadata or {})
+                self._set_row(row, vid, metadata)
+                records.append({"op": "upsert", "row": row, "id": vid, "metadata": metadata})
+            self.flush_vectors()
+            self._append_log(records)
+            self.on_upsert(rows, values)
+
+    def flush_vectors(self):
+        if self.vectors is not None:
+            self.vectors.flush()
+        if self.scale_store is not None:
+            self.scale_store.flush()
+
+    def on_upsert(self, rows: List[int], values: np.ndarray):
+        """Hook for index structures layered on top of the raw rows."""
+
+    def delete(self, ids: List[str]):
+        with self.lock:
+            records = []
+            for vid in ids:
+                row = self.id_to_row.get(vid)
+                if row is not None:
+                    self._clear_row(row)
+                    records.append({"op": "delete", "id": vid})
+            self._append_log(records)
+
+    def update_metadata(self, vid: str, set_metadata: Dict[str, Any]):
+        with self.lock:
+            row = self.id_to_row.get(vid)
+            if row is None:
+                return
+            metadata = {**self.metadata[row], **set_metadata}
+            self._set_row(row, vid, metadata)
+            self._append_log([{"op": "upsert", "row": row, "id": vid, "metadata": metadata}])
+
+    def candidate_rows(self, filter: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        Rows passing `filter`, or None meaning "all live rows".
+        Equality clauses are resolved through the field index; the full filter
+        is then verified on the (usually small) remaining set.
+        """
+        if not filter:
+            return None
+        terms, exact = _equality_terms(filter)
+        if terms is not None:
+            rows: Optional[Set[int]] = None
+            for key, allowed in terms:
+                matched: Set[int] = set()
+                for value in allowed:
+                    try:
+                        matched |= self.field_index.get(key, {}).get(value, set())
+                    except TypeError:
+                        continue
+                rows = matched if rows is None else rows & matched
+                if not rows:
+                    return np.zeros(0, dtype=np.int64)
+            if exact:
+                # The field index only holds live rows, so the result is final
+                return np.fromiter(sorted(rows), dtype=np.int64, count=len(rows))
+            candidates = sorted(rows)
+        else:
+            candidates = np.flatnonzero(self.alive[:len(self.ids)]).tolist()
+        return np.asarray(
+            [r for r in candidates if self.alive[r] and matches_filter(self.metadata[r], filter)],
+            dtype=np.int64
+        )
+
+    def search_rows(self, query: np.ndarray, rows: Optional[np.ndarray], top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact top-k over `rows` (or all live rows). Returns (rows, scores)."""
+        return self.search_rows_many(query[None, :], rows, top_k)[0]
+
+    def search_rows_many(self, queries: np.ndarray, rows: Optional[np.ndarray], top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """`search_rows` for each row of `queries`, scoring the candidates in one pass."""
+        if rows is None:
+            scores = self.score(None, queries.T)
+            scores[~self.alive[:len(self.ids)]] = -np.inf
+            rows = np.arange(scores.shape[0])
+        else:
+            if len(rows) == 0:
+                return [(rows, np.zeros(0, dtype=np.float32)) for _ in range(len(queries))]
+            scores = self.score(rows, queries.T)
+        return [self._top_rows(rows, scores[:, j], top_k) for j in range(len(queries))]
+
+    @staticmethod
+    def _top_rows(rows: np.ndarray, scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(top_k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return rows[top], scores[top]
+
+
+class LocalVectorIndex(VectorIndex):
+    """Exact in-process search; each namespace lives in its own directory under `path`."""
+
+    namespace_class = _Namespace
+
+    def __init__(self, path: Optional[str] = settings.LOCAL_INDEX_PATH, dtype: str = settings.EMBEDDING_STORAGE_DTYPE):
+        # path=None keeps everything in RAM (useful for tests and CI)
+        self.path = path
+        # Storage dtype for new namespaces: float32, float16 or int8
+        self.dtype = dtype
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._lock = threading.Lock()
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            for name in os.listdir(path):
+                if os.path.isdir(os.path.join(path, name)):
+                    self._namespace(self._decode_namespace(name))
+
+    @staticmethod
+    def _encode_namespace(namespace: str) -> str:
+        return "__default__" if namespace == "" else namespace.replace(os.sep, "_")
+
+    @staticmethod
+    def _decode_namespace(name: str) -> str:
+        return "" if name == "__default__" else name
+
+    def _namespace(self, namespace: str) -> _Namespace:
+        ns = self._namespaces.get(namespace)
+        if ns is None:
+            with self._lock:
+                ns = self._namespaces.get(namespace)
+                if ns is None:
+                    ns_path = os.path.join(self.path, self._encode_namespace(namespace)) if self.path is not None else None
+                    ns = self.namespace_class(ns_path, dtype=self.dtype)
+                    self._namespaces[namespace] = ns
+        return ns
+
+    def upsert(self, vectors, namespace: str = "") -> None:
+        self._namespace(namespace).upsert(vectors)
+
+    batch_queries = True
+
+    def query(self, vector, top_k, namespace="", filter=None, include_values=False, include_metadata=True) -> QueryResult:
+        return self.query_many([vector], top_k, namespace, filter, include_values, include_metadata)[0]
+
+    def query_many(self, vectors, top_k, namespace="", filter=None, include_values=False, include_metadata=True) -> List[QueryResult]:
+        ns = self._namespace(namespace)
+        queries = as_float_matrix(vectors)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        queries = queries / norms
+
+        with ns.lock:
+            if ns.dim is None:
+                return [QueryResult() for _ in range(len(queries))]
+            return [
+                QueryResult(matches=[
+                    IndexMatch(
+                        id=ns.ids[row],
+                        score=float(score),
+                        values=ns.row_embedding(row) if include_values else None,
+                        metadata=dict(ns.metadata[row]) if include_metadata else {}
+                    )
+                    for row, score in zip(rows.tolist(), scores.tolist())
+                ])
+                for rows, scores in self._search_many(ns, queries, filter, top_k)
+            ]
+
+    def _search_many(self, ns: _Namespace, queries: np.ndarray, filter, top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        # The filter is resolved once and the candidates scored against all queries together
+        return ns.search_rows_many(queries, ns.candidate_rows(filter), top_k)
+
+    def fetch(self, ids, namespace="") -> Dict[str, IndexMatch]:
+        ns = self._namespace(namespace)
+        found = {}
+        with ns.lock:
+            for vid in ids:
+                row = ns.id_to_row.get(vid)
+                if row is not None:
+                    found[vid] = IndexMatch(id=vid, values=ns.row_embedding(row), metadata=dict(ns.metadata[row]))
+        return found
+
+    def delete(self, ids, namespace="") -> None:
+        self._namespace(namespace).delete(list(ids))
+
+    def update_metadata(self, id, set_metadata, namespace="") -> None:
+        self._namespace(namespace).update_metadata(id, dict(set_metadata))
+
+    def describe_index_stats(self) -> Dict[str, Any]:
+        return {
+            "namespaces": {
+                name: {"vector_count": len(ns.id_to_row)}
+                for name, ns in self._namespaces.items()
+            },
+            "dimension": next((ns.dim for ns in self._namespaces.values() if ns.dim), None),
+            "storage_dtype": {name: ns.dtype.name for name, ns in self._namespaces.items()},
+            "vector_bytes": sum(
+                ns.matrix.nbytes + (ns.scales.nbytes if ns.scales is not None else 0)
+                for ns in self._namespaces.values() if ns.dim
+            ),
+        }
+
+    def close(self):
+        for ns in self._namespaces.values():
+            ns.close()
+
+
+class _IVFNamespace(_Namespace):
+    """
+    Adds k-means coarse clustering on top of the exact row store.
+
+    List assignments of upserted rows are appended to a small binary log
+    (row, list pairs) instead of rewriting ivf.npz; the snapshot is rewritten
+    after (re)training, once the log grows past _ASSIGNMENT_LOG_LIMIT records
+    and on close. (Re)training runs in a background thread: the namespace lock
+    is only held to copy rows and to install the new lists, and searches keep
+    using the previous lists (or exact search) meanwhile.
+    """
+
+    _ASSIGNMENT_LOG_LIMIT = 100000
+    # Rows copied per lock acquisition when assigning all rows to new lists
+    _ASSIGN_BLOCK = 65536
+
+    def __init__(self, path: Optional[str], dtype: str = settings.EMBEDDING_STORAGE_DTYPE, min_train_size: int = settings.IVF_MIN_TRAIN_SIZE, background_training: bool = True):
+        self.min_train_size = min_train_size
+        self.background_training = background_training
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments: Optional[np.ndarray] = None
+        self.trained_on = 0
+        # Bumped by every training; the assignment log belongs to one generation
+        self.generation = 0
+        self._training_thread: Optional[threading.Thread] = None
+        # Rows upserted while a training is running, reassigned when it finishes (None: not training)
+        self._training_dirty: Optional[Set[int]] = None
+        self._assignment_log = None
+        self._assignment_log_records = 0
+        super().__init__(path, dtype=dtype)
+        if path is None:
+            return
+        if os.path.exists(self._ivf_path()):
+            with np.load(self._ivf_path()) as data:
+                self.centroids = data["centroids"]
+                self.assignments = data["assignments"]
+                self.trained_on = int(data["trained_on"])
+                self.generation = int(data["generation"]) if "generation" in data else 0
+            self._pad_assignments()
+            self._replay_assignment_log()
+        self._open_assignment_log()
+
+    # Persistence
+
+    def _ivf_path(self) -> str:
+        return os.path.join(self.path, "ivf.npz")
+
+    def _assignment_log_path(self, generation: int) -> str:
+        return os.path.join(self.path, f"ivf_assignments.{generation}.i32")
+
+    def _replay_assignment_log(self):
+        path = self._assignment_log_path(self.generation)
+        if not os.path.exists(path):
+            return
+        pairs = np.fromfile(path, dtype=np.int32)
+        # A torn final record (crash mid-write) is ignored
+        pairs = pairs[:len(pairs) // 2 * 2].reshape(-1, 2)
+        pairs = pairs[pairs[:, 0] < len(self.assignments)]
+        # Later records win, as in the log order
+        self.assignments[pairs[:, 0]] = pairs[:, 1]
+        self._assignment_log_records = len(pairs)
+
+    def _open_assignment_log(self):
+        # Logs of older generations refer to centroids that no longer exist
+        for name in os.listdir(self.path):
+            if name.startswith("ivf_assignments.") and name != os.path.basename(self._assignment_log_path(self.generation)):
+                os.remove(os.path.join(self.path, name))
+        self._assignment_log = open(self._assignment_log_path(self.generation), "ab")
+
+    def _log_assignments(self, rows: np.ndarray, labels: np.ndarray):
+        if self._assignment_log is None:
+            return
+        self._assignment_log.write(np.column_stack([rows, labels]).astype(np.int32).tobytes())
+        self._assignment_log.flush()
+        self._assignment_log_records += len(rows)
+        if self._assignment_log_records > self._ASSIGNMENT_LOG_LIMIT:
+            self._save_ivf()
+
+    def _save_ivf(self):
+        """Writes the full snapshot and starts an empty assignment log for its generation."""
+        if self.path is None or self.centroids is None:
+            return
+        tmp = self._ivf_path() + ".tmp.npz"
+        np.savez(tmp, centroids=self.centroids, assignments=self.assignments, trained_on=self.trained_on, generation=self.generation)
+        os.replace(tmp, self._ivf_path())
+        if self._assignment_log is not None:
+            self._assignment_log.close()
+        # Replaying the old log onto the new snapshot is harmless, so a crash here loses nothing
+        with open(self._assignment_log_path(self.generation), "wb"):
+            pass
+        self._open_assignment_log()
+        self._assignment_log_records = 0
+
+    def flush(self):
+        super().flush()
+        if self._assignment_log is not None:
+            self._assignment_log.flush()
+
+    def close(self):
+        self.wait_for_training()
+        with self.lock:
+            if self._assignment_log_records:
+                self._save_ivf()
+            if self._assignment_log is not None:
+                self._assignment_log.close()
+                self._assignment_log = None
+        super().close()
+
+    # Lists
+
+    def _pad_assignments(self):
+        n = len(self.ids)
+        if self.assignments is not None and len(self.assignments) < n:
+            # Rows written after the last save: assign them now
+            missing = np.arange(len(self.assignments), n)
+            extra = np.argmax(self.score(missing, self.centroids.T), axis=1).astype(np.int32)
+            self.assignments = np.concatenate([self.assignments, extra])
+
+    def _needs_training(self) -> bool:
+        # Train once the corpus is large enough, and again each time it has doubled
+        live = len(self.id_to_row)
+        return live >= self.min_train_size and (self.centroids is None or live >= 2 * self.trained_on)
+
+    def train(self, iterations: int = 10, seed: int = 0):
+        """
+        Clusters the live rows and assigns every row to its closest list.
+        Rows are copied under the namespace lock in blocks and clustered
+        outside it, so concurrent upserts and searches are not blocked.
+        """
+        with self.lock:
+            live = np.flatnonzero(self.alive[:len(self.ids)])
+            if len(live) < self.min_train_size:
+                return
+            nlist = max(1, int(np.sqrt(len(live))))
+            rng = np.random.default_rng(seed)
+            sample = live if len(live) <= 50 * nlist else rng.choice(live, 50 * nlist, replace=False)
+            data = self.float_rows(sample)
+            n = len(self.ids)
+            self._training_dirty = set()
+        try:
+            centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+            for _ in range(iterations):
+                labels = np.argmax(data @ centroids.T, axis=1)
+                for c in range(nlist):
+                    members = data[labels == c]
+                    if len(members):
+                        mean = members.mean(axis=0)
+                        norm = np.linalg.norm(mean)
+                        centroids[c] = mean / norm if norm > 0 else mean
+
+            assignments = np.empty(n, dtype=np.int32)
+            for start in range(0, n, self._ASSIGN_BLOCK):
+                block = np.arange(start, min(n, start + self._ASSIGN_BLOCK))
+                with self.lock:
+                    rows = self.float_rows(block)
+                assignments[block] = np.argmax(rows @ centroids.T, axis=1)
+
+            with self.lock:
+                self.centroids = centroids
+                self.assignments = assignments
+                # Rows added or overwritten since they were copied
+                self._pad_assignments()
+                dirty = np.array(sorted(r for r in self._training_dirty if r < n), dtype=np.int64)
+                if len(dirty):
+                    self.assignments[dirty] = np.argmax(self.score(dirty, centroids.T), axis=1)
+                self.trained_on = len(live)
+                self.generation += 1
+                self._save_ivf()
+        finally:
+            with self.lock:
+                self._training_dirty = None
+        logger.info("Trained IVF index %s: %d lists over %d vectors", self.path, nlist, len(live))
+
+    def _train_in_background(self):
+        try:
+            self.train()
+        except Exception as e:
+            logger.error("IVF training of %s failed: %s", self.path, e)
+        finally:
+            with self.lock:
+                self._training_thread = None
+
+    def wait_for_training(self):
+        thread = self._training_thread
+        if thread is not None:
+            thread.join()
+
+    def on_upsert(self, rows: List[int], values: np.ndarray):
+        # Called with the namespace lock held
+        if self.centroids is not None:
+            self._pad_assignments()
+            labels = np.argmax(values @ self.centroids.T, axis=1).astype(np.int32)
+            self.assignments[rows] = labels
+            self._log_assignments(np.asarray(rows), labels)
+        if self._training_dirty is not None:
+            self._training_dirty.update(rows)
+            return
+        if self._training_thread is None and self._needs_training():
+            if not self.background_training:
+                self.train()
+                return
+            self._training_thread = threading.Thread(target=self._train_in_background, name="ivf-train", daemon=True)
+            self._training_thread.start()
+
+    def probe_rows(self, query: np.ndarray, nprobe: int) -> Optional[np.ndarray]:
+        if self.centroids is None:
+            return None
+        nprobe = min(nprobe, len(self.centroids))
+        closest = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        n = len(self.ids)
+        in_lists = np.isin(self.assignments[:n], closest) & self.alive[:n]
+        return np.flatnonzero(in_lists)
+
+
+class LocalIVFIndex(LocalVectorIndex):
+    """
+    Approximate search for large namespaces: vectors are clustered with k-means and
+    only the `nprobe` closest lists are scanned. Namespaces smaller than
+    `IVF_MIN_TRAIN_SIZE` are searched exactly.
+    """
+
+    namespace_class = _IVFNamespace
+
+    def __init__(self, path: Optional[str] = settings.LOCAL_INDEX_PATH, nprobe: int = settings.IVF_NPROBE, dtype: str = settings.EMBEDDING_STORAGE_DTYPE):
+        self.nprobe = nprobe
+        super().__init__(path, dtype=dtype)
+
+    def _search_many(self, ns: _IVFNamespace, queries: np.ndarray, filter, top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        if ns.centroids is None:
+            return super()._search_many(ns, queries, filter, top_k)
+        # Each query probes its own lists
+        filtered = ns.candidate_rows(filter)
+        results = []
+        for query in queries:
+            probed = ns.probe_rows(query, self.nprobe)
+            rows = probed if filtered is None else np.intersect1d(filtered, probed, assume_unique=True)
+            results.append(ns.search_rows(query, rows, top_k))
+        return results
+
+
+def create_vector_index(backend: str = settings.VECTOR_BACKEND) -> VectorIndex:
+    """Builds the configured index backend ("pinecone", "local" or "local_ivf")."""
+    if backend == "pinecone":
+        return PineconeIndex()
+    if backend == "local":
+        return LocalVectorIndex()
+    if backend == "local_ivf":
+        return LocalIVFIndex()
+    raise ValueError(f"Unknown VECTOR_BACKEND: {backend}")
@@ -1,67 +1,301 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Sequence, Callable, Tuple, Union
+import asyncio
+import itertools
+import json
+import math
+from collections import defaultdict
 import numpy as np
-from pinecone import Pinecone
-from sentence_transformers import SentenceTransformer
 from app.core.config import settings
 from app.schemas.ingestion import ProcessedChunk
+from app.services.chunk_batch import ChunkBatch
+from app.core.concurrency import BoundedPool, get_vector_io_pool
+from app.services.embedding_service import EmbeddingEngine, get_embedding_engine
+from app.services.vector_index import VectorIndex, QueryResult, IndexMatch, create_vector_index, matches_filter
+from app.services.docstore import DocStore, index_metadata
+from app.services.lexical_index import LexicalIndex
+from app.services.compact_embedding import as_float_matrix
+from app.services.mmr import mmr, batch_mmr, multi_query_mmr
+
+# The lexical index covers the knowledge base only
+LEXICAL_NAMESPACE = "knowledge_base"
 
 class VectorStore:
-    def __init__(self):
-        # Initialize Pinecone
-        self.pc = Pinecone(api_key=settings.PINECONE_API_KEY)
-        self.index = self.pc.Index(settings.PINECONE_INDEX_NAME)
+    def __init__(
+        self,
+        embedding_engine: Optional[EmbeddingEngine] = None,
+        index: Optional[VectorIndex] = None,
+        io_pool: Optional[BoundedPool] = None,
+        write_pool: Optional[BoundedPool] = None,
+        docstore: Optional[DocStore] = None,
+        lexical_index: Optional[LexicalIndex] = None,
+        hybrid: bool = settings.HYBRID_SEARCH_ENABLED,
+        rrf_k: int = settings.HYBRID_RRF_K,
+    ):
+        # Vector index backend (reuse a shared index handle when one is given)
+        self.index = index or create_vector_index()
+        # Optional local docstore: chunk text and vectors are read from it, so
+        # index queries only return ids and scores
+        self.docstore = docstore
+        # Optional BM25 index over chunk text: identifier queries are answered from it,
+        # and with `hybrid` its candidates are fused with the vector ones before MMR
+        self.lexical_index = lexical_index
+        self.hybrid = hybrid
+        self.rrf_k = rrf_k
+        
+        # Shared embedding engine (Same model as ingestion for consistency)
+        self.embedding_model = embedding_engine or get_embedding_engine()
+        # Blocking index calls of the async API run in this pool
+        self.io_pool = io_pool or get_vector_io_pool()
+        # Writes of the async API (ingestion) run in this pool, so bulk upserts don't
+        # queue ahead of chat queries; defaults to the query pool
+        self.write_pool = write_pool or self.io_pool
         
-        # Initialize embedding model (Same as ingestion for consistency)
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        # Bumped on every corpus change so caches can key on (and drop) stale results
+        self.kb_version = 0
+        self._change_listeners: List[Callable[[int], None]] = []
+
+    def add_change_listener(self, callback: Callable[[int], None]):
+        """Registers a callback invoked with the new kb_version after the corpus changes."""
+        self._change_listeners.append(callback)
+
+    def _mark_changed(self):
+        self.kb_version += 1
+        for callback in self._change_listeners:
+            callback(self.kb_version)
 
-    def upsert_chunks(self, chunks: List[ProcessedChunk], namespace: str = "knowledge_base"):
+    def upsert_chunks(self, chunks: Union[ChunkBatch, List[ProcessedChunk]], namespace: str = "knowledge_base"):
         """
-        Upserts processed chunks into Pinecone.
+        Upserts processed chunks (a ChunkBatch or ProcessedChunk list) into Pinecone.
         """
-        vectors = []
-        for chunk in chunks:
-            # Flatten metadata for Pinecone compatibility (no nested dicts preferred, but check support)
-            # We'll store the 'data' dict as a JSON string or flattened fields if needed.
-            # For now, storing 'data' directly assuming Pinecone metadata support.
-            
-            metadata = {
-                "text": chunk.text,
-                "source_file": chunk.source_file,
-                "date_added": chunk.date_added,
-                "previous_chunk_id": chunk.metadata.previous_chunk_id or "",
-                "next_chunk_id": chunk.metadata.next_chunk_id or "",
-                "type": "document_chunk"
-            }
-            # Merge dynamic metadata
-            for k, v in chunk.metadata.data.items():
-                if isinstance(v, (str, int, float, bool)):
-                     metadata[k] = v
-                else:
-                    # Convert complex types to string
-                    metadata[k] = str(v)
-
-            vectors.append((chunk.chunk_id, chunk.embedding, metadata))
+        vectors = self._build_vectors(chunks)
+        staged = self._stage_documents(vectors, namespace)
         
         # Batch upsert (Pinecone recommends batches of 100)
-        batch_size = 100
-        for i in range(0, len(vectors), batch_size):
-            batch = vectors[i:i + batch_size]
+        for batch in self._batches(staged):
             self.index.upsert(vectors=batch, namespace=namespace)
+        self._index_text(vectors, namespace)
+        self._mark_changed()
 
-    def search(self, query: str, top_k: int = 5, namespace: str = "knowledge_base", filter: Optional[Dict] = None) -> List[Dict[str, Any]]:
+    async def aupsert_chunks(self, chunks: Union[ChunkBatch, List[ProcessedChunk]], namespace: str = "knowledge_base"):
+        """
+        Async variant of upsert_chunks; batches are sent concurrently through the write pool.
+        """
+        vectors = await self.write_pool.run(self._build_vectors, chunks)
+        staged = vectors
+        if self.docstore is not None:
+            staged = await self.write_pool.run(self._stage_documents, vectors, namespace)
+        await asyncio.gather(*[
+            self.write_pool.run(self.index.upsert, vectors=batch, namespace=namespace)
+            for batch in self._batches(staged)
+        ])
+        if self._lexical(namespace):
+            await self.write_pool.run(self._index_text, vectors, namespace)
+        self._mark_changed()
+
+    async def arelink_chunks(self, links: List[Tuple[str, Optional[str], Optional[str]]], namespace: str = "knowledge_base"):
+        """
+        Updates previous/next links of stored chunks given as (chunk_id, previous_chunk_id, next_chunk_id),
+        without re-sending their vectors.
+        """
+        if not links:
+            return
+        updates = [
+            (chunk_id, {"previous_chunk_id": previous_id or "", "next_chunk_id": next_id or ""})
+            for chunk_id, previous_id, next_id in links
+        ]
+        if self.docstore is not None:
+            await self.write_pool.run(self.docstore.update_metadata, namespace, updates)
+        await asyncio.gather(*[
+            self.write_pool.run(self.index.update_metadata, chunk_id, set_metadata, namespace=namespace)
+            for chunk_id, set_metadata in updates
+        ])
+        self._mark_changed()
+
+    async def adelete_chunks(self, ids: List[str], namespace: str = "knowledge_base"):
+        """Deletes chunks by id, in batches."""
+        if not ids:
+            return
+        await asyncio.gather(*[
+            self.write_pool.run(self.index.delete, batch, namespace=namespace)
+            for batch in self._batches(ids, batch_size=1000)
+        ])
+        if self.docstore is not None:
+            await self.write_pool.run(self.docstore.delete, namespace, list(ids))
+        if self._lexical(namespace):
+            await self.write_pool.run(self.lexical_index.delete, ids)
+        self._mark_changed()
+
+    def _lexical(self, namespace: str) -> bool:
+        return self.lexical_index is not None and namespace == LEXICAL_NAMESPACE
+
+    def _index_text(self, vectors: List[tuple], namespace: str):
+        """Adds upserted chunks to the lexical index (text plus source file name)."""
+        if not self._lexical(namespace):
+            return
+        self.lexical_index.add(
+            (vid, f"{metadata.get('text', '')} {metadata.get('source_file', '')}")
+            for vid, _, metadata in vectors
+        )
+
+    def rebuild_lexical_index(self) -> int:
+        """
+        Indexes every knowledge-base chunk held in the docstore, e.g. when the
+        lexical index is enabled on an existing corpus. Returns the chunk count.
+        """
+        if self.lexical_index is None or self.docstore is None:
+            return 0
+        count = 0
+        for batch in self.docstore.iter_texts(LEXICAL_NAMESPACE):
+            self.lexical_index.add((vid, f"{text} {metadata.get('source_file', '')}") for vid, text, metadata in batch)
+            count += len(batch)
+        return count
+
+    @staticmethod
+    def _batches(vectors: List[Any], batch_size: int = 100) -> List[List[Any]]:
+        return [vectors[i:i + batch_size] for i in range(0, len(vectors), batch_size)]
+
+    def _stage_documents(self, vectors: List[tuple], namespace: str) -> List[tuple]:
+        """With a docstore, stores the full payload there and returns the vectors to send to the index (without text)."""
+        if self.docstore is None:
+            return vectors
+        self.docstore.put_many(namespace, vectors)
+        return [(vid, values, index_metadata(metadata)) for vid, values, metadata in vectors]
+
+    def _hydrate(self, results: QueryResult, namespace: str, include_values: bool = False) -> QueryResult:
+        """Adds text, metadata (and vectors) from the docstore to id-only query results."""
+        if self.docstore is None:
+            return results
+        return QueryResult(matches=self.docstore.hydrate(self.index, results.matches, namespace, include_values))
+
+    async def _ahydrate(self, results: QueryResult, namespace: str, include_values: bool = False) -> QueryResult:
+        if self.docstore is None:
+            return results
+        return await self.io_pool.run(self._hydrate, results, namespace, include_values)
+
+    @staticmethod
+    def _build_vectors(chunks: Union[ChunkBatch, List[ProcessedChunk]]) -> List[tuple]:
+        # Metadata is flattened for Pinecone (scalars kept, other values as str); see ChunkBatch.index_vectors
+        if isinstance(chunks, ChunkBatch):
+            return chunks.index_vectors()
+        vectors = []
+        for _, group in itertools.groupby(chunks, key=lambda c: (c.source_file, c.date_added)):
+            vectors.extend(ChunkBatch.from_processed_chunks(list(group)).index_vectors())
+        return vectors
+
+    def search(self, query: str, top_k: int = 5, namespace: str = "knowledge_base", filter: Optional[Dict] = None, query_vector: Optional[Sequence[float]] = None) -> List[Dict[str, Any]]:
         """
         Basic semantic search.
+        Pass `query_vector` to reuse an embedding already computed for this turn.
         """
-        query_embedding = self.embedding_model.encode(query).tolist()
+        query_embedding = self._query_embedding(query, query_vector)
         
         results = self.index.query(
             vector=query_embedding,
             top_k=top_k,
-            include_metadata=True,
+            include_metadata=self.docstore is None,
+            namespace=namespace,
+            filter=filter
+        )
+        
+        return self._format_matches(self._hydrate(results, namespace))
+
+    async def asearch(self, query: str, top_k: int = 5, namespace: str = "knowledge_base", filter: Optional[Dict] = None, query_vector: Optional[Sequence[float]] = None) -> List[Dict[str, Any]]:
+        """
+        Async basic semantic search; encoding and the index query run off the event loop.
+        """
+        query_embedding = await self._aquery_embedding(query, query_vector)
+        
+        results = await self.io_pool.run(
+            self.index.query,
+            vector=query_embedding,
+            top_k=top_k,
+            include_metadata=self.docstore is None,
             namespace=namespace,
             filter=filter
         )
         
+        return self._format_matches(await self._ahydrate(results, namespace))
+
+    async def afetch_chunks(self, ids: List[str], namespace: str = "knowledge_base") -> Dict[str, Dict[str, Any]]:
+        """
+        Chunks by id with one batched read (the docstore, else one index fetch),
+        in the format of search results; unknown ids are left out.
+        """
+        if not ids:
+            return {}
+        matches = await self.io_pool.run(self._fetch_matches, ids, namespace)
+        return {
+            match.id: {"id": match.id, "score": None, "text": match.metadata.get("text", ""), "metadata": match.metadata}
+            for match in matches
+        }
+
+    def _fetch_matches(self, ids: List[str], namespace: str, include_values: bool = False) -> List[IndexMatch]:
+        if self.docstore is not None:
+            return self.docstore.hydrate(self.index, [IndexMatch(id=vid) for vid in ids], namespace, include_values)
+        return list(self.index.fetch(list(ids), namespace=namespace).values())
+
+    def _exact_match(self, query: str, top_k: int, namespace: str, filter: Optional[Dict]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Chunks for a query that is an exact identifier in the lexical index
+        (score 1.0), read by id without an index query; None when not applicable.
+        """
+        if not self._lexical(namespace) or filter or not query:
+            return None
+        hits = self.lexical_index.exact_match(query, top_k)
+        if not hits:
+            return None
+        matches = {m.id: m for m in self._fetch_matches([vid for vid, _ in hits], namespace)}
+        chunks = [
+            {"id": vid, "score": 1.0, "text": matches[vid].metadata.get("text", ""), "metadata": matches[vid].metadata}
+            for vid, _ in hits if vid in matches
+        ]
+        return chunks or None
+
+    def _fuse(self, query: str, results: QueryResult, fetch_k: int, namespace: str, filter: Optional[Dict]) -> Tuple[QueryResult, Optional[List[float]]]:
+        """
+        Hybrid retrieval: merges the vector candidates with the top lexical ones
+        by reciprocal rank fusion. Lexical-only candidates are fetched (with
+        vectors, for MMR) in one batch and checked against `filter`. Returns the
+        fused candidates, best first, and their fused scores scaled to [0, 1].
+        """
+        if not (self.hybrid and self._lexical(namespace)) or not query:
+            return results, None
+        lexical = self.lexical_index.search(query, fetch_k)
+        if not lexical:
+            return results, None
+
+        by_id = {m.id: m for m in results.matches}
+        missing = [vid for vid, _ in lexical if vid not in by_id]
+        if missing:
+            for match in self._fetch_matches(missing, namespace, include_values=True):
+                if match.values is not None and matches_filter(match.metadata, filter):
+                    by_id[match.id] = match
+
+        fused: Dict[str, float] = defaultdict(float)
+        for rank, match in enumerate(results.matches):
+            fused[match.id] += 1.0 / (self.rrf_k + rank + 1)
+        for rank, (vid, _) in enumerate(lexical):
+            fused[vid] += 1.0 / (self.rrf_k + rank + 1)
+        ranked = sorted(by_id, key=lambda vid: -fused[vid])[:fetch_k]
+        if not ranked:
+            return results, None
+        best = fused[ranked[0]]
+        return QueryResult(matches=[by_id[vid] for vid in ranked]), [fused[vid] / best for vid in ranked]
+
+    # Query vectors stay float32 arrays; only the Pinecone adapter converts them to lists
+
+    def _query_embedding(self, query: str, query_vector: Optional[Sequence[float]]) -> np.ndarray:
+        if query_vector is None:
+            query_vector = self.embedding_model.embed_query(query)
+        return np.asarray(query_vector, dtype=np.float32).reshape(-1)
+
+    async def _aquery_embedding(self, query: str, query_vector: Optional[Sequence[float]]) -> np.ndarray:
+        if query_vector is None:
+            query_vector = await self.embedding_model.aembed_query(query)
+        return np.asarray(query_vector, dtype=np.float32).reshape(-1)
+
+    @staticmethod
+    def _format_matches(results) -> List[Dict[str, Any]]:
         return [
             {
                 "id": match.id,
@@ -72,98 +306,245 @@ class VectorStore:
             for match in results.matches
         ]
 
-    def mmr_search(self, query: str, top_k: int = 5, diversity: float = 0.5, namespace: str = "knowledge_base", filter: Optional[Dict] = None) -> List[Dict[str, Any]]:
+    def mmr_search(self, query: str, top_k: int = 5, diversity: float = 0.5, namespace: str = "knowledge_base", filter: Optional[Dict] = None, query_vector: Optional[Sequence[float]] = None) -> List[Dict[str, Any]]:
         """
         Maximal Marginal Relevance (MMR) search to optimize for similarity and diversity.
         diversity: 0.0 (max similarity) to 1.0 (max diversity).
+        Pass `query_vector` to reuse an embedding already computed for this turn.
         """
-        query_embedding = self.embedding_model.encode(query).tolist()
+        exact = self._exact_match(query, top_k, namespace, filter)
+        if exact is not None:
+            return exact
+
+        query_embedding = self._query_embedding(query, query_vector)
         
         # Fetch more candidates than top_k to re-rank
         fetch_k = top_k * 4
         results = self.index.query(
             vector=query_embedding,
             top_k=fetch_k,
-            include_values=True, # Need vectors for MMR
-            include_metadata=True,
+            include_values=self.docstore is None, # Need vectors for MMR (read locally with a docstore)
+            include_metadata=self.docstore is None,
+            namespace=namespace,
+            filter=filter
+        )
+        results = self._hydrate(results, namespace, include_values=True)
+        results, relevance = self._fuse(query, results, fetch_k, namespace, filter)
+        
+        return self._select_mmr(query_embedding, results, top_k, diversity, relevance)
+
+    async def ammr_search(self, query: str, top_k: int = 5, diversity: float = 0.5, namespace: str = "knowledge_base", filter: Optional[Dict] = None, query_vector: Optional[Sequence[float]] = None) -> List[Dict[str, Any]]:
+        """
+        Async MMR search. The encode goes through the shared embedding engine and the
+        index query through the I/O pool, so concurrent searches overlap.
+        Identifier queries found in the lexical index skip the index query.
+        """
+        if self._lexical(namespace) and not filter:
+            exact = await self.io_pool.run(self._exact_match, query, top_k, namespace, filter)
+            if exact is not None:
+                return exact
+
+        query_embedding = await self._aquery_embedding(query, query_vector)
+        
+        fetch_k = top_k * 4
+        results = await self.io_pool.run(
+            self.index.query,
+            vector=query_embedding,
+            top_k=fetch_k,
+            include_values=self.docstore is None,
+            include_metadata=self.docstore is None,
             namespace=namespace,
             filter=filter
         )
+        results = await self._ahydrate(results, namespace, include_values=True)
+        relevance = None
+        if self.hybrid and self._lexical(namespace):
+            results, relevance = await self.io_pool.run(self._fuse, query, results, fetch_k, namespace, filter)
+        
+        return self._select_mmr(query_embedding, results, top_k, diversity, relevance)
+
+    async def ammr_search_many(self, queries: List[Dict[str, Any]], top_k: int = 5, diversity: float = 0.5, namespace: str = "knowledge_base") -> List[List[Dict[str, Any]]]:
+        """
+        MMR search for several queries at once (used by detailed mode).
+        Each item in `queries` is {"query": str, "filter": Optional[dict]}.
+        Encodes and index queries run concurrently, then all candidate sets are
+        re-ranked in a single batched MMR call. Returns one result list per query.
+        """
+        embeddings = await asyncio.gather(*[self._aquery_embedding(q["query"], None) for q in queries])
         
+        fetch_k = top_k * 4
+        results = await asyncio.gather(*[
+            self.io_pool.run(
+                self.index.query,
+                vector=embedding,
+                top_k=fetch_k,
+                include_values=self.docstore is None,
+                include_metadata=self.docstore is None,
+                namespace=namespace,
+                filter=q.get("filter") or None
+            )
+            for q, embedding in zip(queries, embeddings)
+        ])
+        if self.docstore is not None:
+            # One docstore read for the candidates of all queries
+            hydrated = await self.io_pool.run(
+                self.docstore.hydrate_many, self.index, [res.matches for res in results], namespace, True
+            )
+            results = [QueryResult(matches=matches) for matches in hydrated]
+        relevance = None
+        if self.hybrid and self._lexical(namespace):
+            fused = await asyncio.gather(*[
+                self.io_pool.run(self._fuse, q["query"], res, fetch_k, namespace, q.get("filter") or None)
+                for q, res in zip(queries, results)
+            ])
+            results = [res for res, _ in fused]
+            relevance = [scores for _, scores in fused]
+        
+        selections = batch_mmr(
+            embeddings,
+            [[match.values for match in res.matches] for res in results],
+            top_k,
+            diversity,
+            normalized=self.embedding_model.normalized,
+            relevance_scores=relevance
+        )
+        return [
+            self._format_selection(res.matches, indices, scores)
+            for res, (indices, scores) in zip(results, selections)
+        ]
+
+    async def amulti_query_search(self, queries: List[Dict[str, Any]], top_k: int = 10, min_per_query: int = 1, diversity: float = 0.5, namespace: str = "knowledge_base") -> List[Dict[str, Any]]:
+        """
+        Retrieval for several sub-queries in one pass (used by detailed mode).
+        Each item in `queries` is {"query": str, "filter": Optional[dict]}.
+
+        All sub-queries are encoded in one batch; index queries run concurrently,
+        with sub-queries sharing a filter sent as one batched query when the
+        backend supports it. The candidates are pooled and one MMR pass over the
+        union picks `top_k` chunks, at least `min_per_query` for each sub-query
+        that has candidates. Returns one deduplicated list; each chunk's score
+        is its best similarity to any sub-query.
+        """
+        # Identical sub-queries are searched once
+        unique: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for q in queries:
+            unique.setdefault((q["query"], self._filter_key(q.get("filter") or None)), q)
+        queries = list(unique.values())
+        if not queries:
+            return []
+
+        embeddings = np.asarray(await self.embedding_model.aencode([q["query"] for q in queries]), dtype=np.float32)
+        fetch_k = 4 * max(min_per_query, math.ceil(top_k / len(queries)))
+
+        groups: Dict[str, List[int]] = {}
+        for i, q in enumerate(queries):
+            groups.setdefault(self._filter_key(q.get("filter") or None), []).append(i)
+        calls, call_members = [], []
+        for members in groups.values():
+            filter = queries[members[0]].get("filter") or None
+            kwargs = dict(top_k=fetch_k, include_values=self.docstore is None, include_metadata=self.docstore is None, namespace=namespace, filter=filter)
+            if self.index.batch_queries and len(members) > 1:
+                calls.append(self.io_pool.run(self.index.query_many, embeddings[members], **kwargs))
+                call_members.append(members)
+            else:
+                calls.extend(self.io_pool.run(self.index.query, vector=embeddings[i], **kwargs) for i in members)
+                call_members.extend([i] for i in members)
+        results: List[Optional[QueryResult]] = [None] * len(queries)
+        for members, outcome in zip(call_members, await asyncio.gather(*calls)):
+            for i, res in zip(members, outcome if isinstance(outcome, list) else [outcome]):
+                results[i] = res
+
+        if self.docstore is not None:
+            # One docstore read for the candidates of all sub-queries
+            hydrated = await self.io_pool.run(
+                self.docstore.hydrate_many, self.index, [res.matches for res in results], namespace, True
+            )
+            results = [QueryResult(matches=matches) for matches in hydrated]
+        fused_scores: Optional[List[Optional[List[float]]]] = None
+        if self.hybrid and self._lexical(namespace):
+            fused = await asyncio.gather(*[
+                self.io_pool.run(self._fuse, q["query"], res, fetch_k, namespace, q.get("filter") or None)
+                for q, res in zip(queries, results)
+            ])
+            results = [res for res, _ in fused]
+            fused_scores = [scores for _, scores in fused]
+
+        # Pool the candidates: one row per distinct chunk, remembering which sub-queries found it
+        pooled: Dict[str, int] = {}
+        matches = []
+        for res in results:
+            for match in res.matches:
+                if match.id not in pooled and match.values is not None:
+                    pooled[match.id] = len(matches)
+                    matches.append(match)
+        if not matches:
+            return []
+        membership = np.zeros((len(matches), len(queries)), dtype=bool)
+        for j, res in enumerate(results):
+            rows = [pooled[match.id] for match in res.matches if match.id in pooled]
+            membership[rows, j] = True
+        relevance = None
+        if fused_scores is not None and any(scores is not None for scores in fused_scores):
+            # Sub-queries with lexical candidates rank by their fused score, the others by similarity
+            relevance = as_float_matrix([match.values for match in matches]) @ embeddings.T
+            for j, (res, scores) in enumerate(zip(results, fused_scores)):
+                if scores is None:
+                    continue
+                relevance[:, j] = 0.0
+                for match, score in zip(res.matches, scores):
+                    if match.id in pooled:
+                        relevance[pooled[match.id], j] = score
+
+        selected, scores = multi_query_mmr(
+            embeddings,
+            [match.values for match in matches],
+            membership,
+            top_k,
+            diversity,
+            min_per_query=min_per_query,
+            normalized=self.embedding_model.normalized,
+            relevance_scores=relevance,
+        )
+        return self._format_selection(matches, selected, scores)
+
+    @staticmethod
+    def _filter_key(filter: Optional[Dict]) -> str:
+        return json.dumps(filter, sort_keys=True, default=str) if filter else ""
+
+    def _select_mmr(self, query_embedding: np.ndarray, results, top_k: int, diversity: float, relevance: Optional[List[float]] = None) -> List[Dict[str, Any]]:
         if not results.matches:
             return []
 
-        # Extract vectors and metadata
+        # Extract vectors
         candidate_vectors = [match.values for match in results.matches]
-        candidate_ids = [match.id for match in results.matches]
-        candidate_metadata = [match.metadata for match in results.matches]
         
         # Calculate MMR
-        selected_indices = self._calculate_mmr(
+        selected_indices, scores = mmr(
             query_embedding, 
             candidate_vectors, 
             top_k, 
-            diversity
+            diversity,
+            normalized=self.embedding_model.normalized,
+            relevance_scores=relevance
         )
         
+        return self._format_selection(results.matches, selected_indices, scores)
+
+    @staticmethod
+    def _format_selection(matches, selected_indices: List[int], scores: List[float]) -> List[Dict[str, Any]]:
         return [
             {
-                "id": candidate_ids[i],
-                "score": 0.0, # MMR doesn't yield a direct similarity score in the same way
-                "text": candidate_metadata[i].get("text", ""),
-                "metadata": candidate_metadata[i]
+                "id": matches[i].id,
+                "score": score, # Similarity to the query (MMR only decides the order)
+                "text": matches[i].metadata.get("text", ""),
+                "metadata": matches[i].metadata
             }
-            for i in selected_indices
+            for i, score in zip(selected_indices, scores)
         ]
 
     def _calculate_mmr(self, query_embedding: List[float], candidate_vectors: List[List[float]], top_k: int, lambda_param: float) -> List[int]:
         """
-        Core MMR calculation.
+        Core MMR calculation (see app/services/mmr.py).
         """
-        if not candidate_vectors:
-            return []
-
-        # Convert to numpy for efficiency
-        query_vec = np.array(query_embedding).reshape(1, -1)
-        candidate_matrix = np.array(candidate_vectors)
-        
-        # Cosine similarity between query and candidates
-        # (Assuming normalized vectors, dot product = cosine similarity)
-        # Using dot product for speed (SentenceTransformers produces normalized vectors usually)
-        # Safe bet: compute cosine similarity properly
-        from sklearn.metrics.pairwise import cosine_similarity
-        
-        # Sim(query, candidates)
-        sim_query_candidates = cosine_similarity(query_vec, candidate_matrix)[0]
-        
-        # Sim(candidates, candidates)
-        sim_candidate_candidate = cosine_similarity(candidate_matrix, candidate_matrix)
-        
-        selected_indices = []
-        candidate_indices = list(range(len(candidate_vectors)))
-        
-        for _ in range(min(top_k, len(candidate_vectors))):
-            best_mmr = -float("inf")
-            best_idx = -1
-            
-            for idx in candidate_indices:
-                # Sim with query
-                sim_q = sim_query_candidates[idx]
-                
-                # Max sim with already selected
-                if not selected_indices:
-                    max_sim_selected = 0
-                else:
-                    max_sim_selected = max([sim_candidate_candidate[idx][sel_idx] for sel_idx in selected_indices])
-                
-                # MMR formula: lambda * Sim(Q, D) - (1-lambda) * max(Sim(D, Selected))
-                mmr_score = lambda_param * sim_q - (1 - lambda_param) * max_sim_selected
-                
-                if mmr_score > best_mmr:
-                    best_mmr = mmr_score
-                    best_idx = idx
-            
-            selected_indices.append(best_idx)
-            candidate_indices.remove(best_idx)
-            
+        selected_indices, _ = mmr(query_embedding, candidate_vectors, top_k, lambda_param)
         return selected_indices
@@ -0,0 +1,231 @@
+"""
+Write-Behind Service
+
+This service takes writes that the user doesn't wait for - new long-term
+memories and assistant chat messages - off the request path.
+Writes are put on a bounded queue and a background task drains it in batches:
+memories of a batch are embedded with one encode and upserted with one
+multi-vector upsert, chat messages are inserted in one transaction.
+
+A full queue applies backpressure (enqueueing waits for space), failed batches
+are retried with exponential backoff, and `close()` flushes everything still
+queued before the process exits. Writes are only held in memory, so a crash
+loses whatever has not been flushed yet.
+"""
+from typing import List, Dict, Any, Optional, Union, Callable
+from dataclasses import dataclass, field
+from datetime import datetime
+import asyncio
+import time
+from app.core.config import settings
+from app.core.logging import logger
+from app.services.memory_service import MemoryService
+from app.services.chat_history import ChatHistoryRepository
+
+
+@dataclass
+class MemoryWrite:
+    text: str
+    user_id: str
+    session_id: str
+
+
+@dataclass
+class ChatWrite:
+    session_id: str
+    role: str
+    content: str
+    chunks_used: List[Any] = field(default_factory=list)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # Stamped at enqueue time so history order doesn't depend on flush timing
+    created_at: datetime = field(default_factory=datetime.utcnow)
+
+
+_Write = Union[MemoryWrite, ChatWrite]
+
+
+class WriteBehindQueue:
+    """
+    Bounded write-behind queue with a single background flusher.
+
+    The flusher waits for a first write, then collects more for at most
+    `max_wait_ms` (up to `max_batch_size` writes) and flushes them together.
+    """
+
+    def __init__(
+        self,
+        memory_service: MemoryService,
+        chat_history: ChatHistoryRepository,
+        session_factory: Callable[[], Any],
+        max_size: int = settings.WRITE_BEHIND_QUEUE_SIZE,
+        max_batch_size: int = settings.WRITE_BEHIND_MAX_BATCH_SIZE,
+        max_wait_ms: float = settings.WRITE_BEHIND_MAX_WAIT_MS,
+        max_retries: int = settings.WRITE_BEHIND_MAX_RETRIES,
+        retry_backoff_s: float = settings.WRITE_BEHIND_RETRY_BACKOFF_S,
+    ):
+        self.memory_service = memory_service
+        self.chat_history = chat_history
+        # Returns a new AsyncSession (async context manager), e.g. AsyncSessionLocal
+        self.session_factory = session_factory
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_retries = max(0, max_retries)
+        self.retry_backoff = max(0.0, retry_backoff_s)
+
+        self._queue: "asyncio.Queue[_Write]" = asyncio.Queue(maxsize=max(1, max_size))
+        self._worker: Optional[asyncio.Task] = None
+        self._closed = False
+
+        # Stats
+        self._batches = 0
+        self._memories_written = 0
+        self._chats_written = 0
+        self._retries = 0
+        self._dropped = 0
+        self._backpressure_waits = 0
+        self._total_flush = 0.0
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    async def add_memory(self, text: str, user_id: str, session_id: str):
+        """Queues a memory for a batched embed + upsert."""
+        await self._put(MemoryWrite(text=text, user_id=user_id, session_id=session_id))
+
+    async def add_message(
+        self,
+        session_id: str,
+        role: str,
+        content: str,
+        chunks_used: Optional[List[Any]] = None,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+    ):
+        """
+        Queues a chat message for a batched insert. The session's history
+        buffer is updated right away, so the next turn already sees it.
+        """
+        write = ChatWrite(
+            session_id=session_id,
+            role=role,
+            content=content,
+            chunks_used=chunks_used or [],
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+        )
+        await self._put(write)
+        self.chat_history.record(session_id, role, content)
+
+    async def close(self):
+        """Stops accepting writes and flushes everything still queued."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._worker is not None:
+            await self._queue.join()
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        pending = self._queue.qsize()
+        if pending:
+            # Only possible if the worker never started
+            logger.warning("Write-behind queue closed with %d unflushed writes", pending)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize(),
+            "batches": self._batches,
+            "memories_written": self._memories_written,
+            "chats_written": self._chats_written,
+            "retries": self._retries,
+            "dropped": self._dropped,
+            "backpressure_waits": self._backpressure_waits,
+            "avg_flush_ms": (self._total_flush / self._batches * 1000.0) if self._batches else 0.0,
+        }
+
+    async def _put(self, write: _Write):
+        if self._closed:
+            raise RuntimeError("WriteBehindQueue is closed")
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run(), name="write-behind")
+        if self._queue.full():
+            self._backpressure_waits += 1
+        await self._queue.put(write)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                try:
+                    if timeout <= 0:
+                        batch.append(self._queue.get_nowait())
+                    else:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch: List[_Write]):
+        started = time.perf_counter()
+        memories = [w for w in batch if isinstance(w, MemoryWrite)]
+        chats = [w for w in batch if isinstance(w, ChatWrite)]
+
+        if memories:
+            if await self._with_retries("memory upsert", self._write_memories, memories):
+                self._memories_written += len(memories)
+            else:
+                self._dropped += len(memories)
+        if chats:
+            if await self._with_retries("chat insert", self._write_chats, chats):
+                self._chats_written += len(chats)
+            else:
+                self._dropped += len(chats)
+
+        self._batches += 1
+        self._total_flush += time.perf_counter() - started
+
+    async def _with_retries(self, what: str, fn, writes: List[_Write]) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                await fn(writes)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error("Write-behind %s of %d writes failed, dropping: %s", what, len(writes), e)
+                    return False
+                self._retries += 1
+                delay = self.retry_backoff * (2 ** attempt)
+                logger.warning("Write-behind %s failed (attempt %d), retrying in %.2fs: %s", what, attempt + 1, delay, e)
+                await asyncio.sleep(delay)
+        return False
+
+    async def _write_memories(self, memories: List[MemoryWrite]):
+        await self.memory_service.aadd_memories([(m.text, m.user_id, m.session_id) for m in memories])
+
+    async def _write_chats(self, chats: List[ChatWrite]):
+        async with self.session_factory() as db:
+            for c in chats:
+                self.chat_history.stage_message(
+                    db,
+                    c.session_id,
+                    role=c.role,
+                    content=c.content,
+                    chunks_used=c.chunks_used,
+                    prompt_tokens=c.prompt_tokens,
+                    completion_tokens=c.completion_tokens,
+                    created_at=c.created_at,
+                )
+            await db.commit()
@@ -0,0 +1,142 @@
+"""
+Ingestion assembly benchmark: per-chunk Pydantic models vs ChunkBatch.
+
+Assembles 100k chunks (1000 characters, extracted metadata with a few fields,
+compact embeddings) into index upsert tuples, in ingestion-sized batches:
+
+- legacy: one ProcessedChunk + ChunkMetadata per chunk with its own
+  timestamp, a second linking pass, then flattening each model into a
+  metadata dict (the previous process_text / _build_vectors, copied below)
+- columnar: ChunkBatch (ids, one text buffer + offsets, metadata columns)
+  and ChunkBatch.index_vectors
+
+Reports wall time and peak traced memory of each. Embedding and metadata
+extraction are not part of the measurement.
+
+Run from the project root:
+    python benchmarks/chunk_batch_benchmark.py [num_chunks]
+"""
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Settings require an API key; the benchmark never calls the LLM
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import numpy as np
+from app.core.config import settings
+from app.schemas.ingestion import ProcessedChunk, ChunkMetadata
+from app.services.chunk_batch import ChunkBatch
+from app.services.compact_embedding import EmbeddingBatch
+from app.services.ingestion_manifest import chunk_id
+
+DIM = 384
+BATCH_SIZE = settings.INGEST_BATCH_SIZE
+SOURCE = "corpus.txt"
+
+
+def legacy_assemble(ids, texts, embeddings, metadata_results):
+    processed_chunks = []
+    for i, (chunk_text, embedding, extracted_metadata) in enumerate(zip(texts, embeddings, metadata_results)):
+        metadata = ChunkMetadata(
+            next_chunk_id=None,
+            previous_chunk_id=processed_chunks[-1].chunk_id if i > 0 else None,
+            data=extracted_metadata
+        )
+        processed_chunks.append(ProcessedChunk(
+            chunk_id=ids[i],
+            text=chunk_text,
+            metadata=metadata,
+            embedding=embedding,
+            source_file=SOURCE,
+            date_added=datetime.now().isoformat()
+        ))
+    for i in range(len(processed_chunks) - 1):
+        processed_chunks[i].metadata.next_chunk_id = processed_chunks[i + 1].chunk_id
+
+    vectors = []
+    for chunk in processed_chunks:
+        metadata = {
+            "text": chunk.text,
+            "source_file": chunk.source_file,
+            "date_added": chunk.date_added,
+            "previous_chunk_id": chunk.metadata.previous_chunk_id or "",
+            "next_chunk_id": chunk.metadata.next_chunk_id or "",
+            "type": "document_chunk"
+        }
+        for k, v in chunk.metadata.data.items():
+            metadata[k] = v if isinstance(v, (str, int, float, bool)) else str(v)
+        vectors.append((chunk.chunk_id, chunk.embedding, metadata))
+    return vectors
+
+
+def columnar_assemble(ids, texts, embeddings, metadata_results):
+    batch = ChunkBatch(
+        ids=ids,
+        texts=texts,
+        previous_ids=[None] + ids[:-1],
+        next_ids=ids[1:] + [None],
+        source_file=SOURCE,
+        date_added=datetime.now().isoformat(),
+        embeddings=embeddings,
+    )
+    batch.set_metadata(metadata_results)
+    return batch.index_vectors()
+
+
+def make_inputs(n, rng):
+    words = np.array("policy account refund card limit transfer fee branch loan rate".split())
+    texts = [" ".join(rng.choice(words, 180))[:1000] + f" #{i}" for i in range(n)]
+    ids = [chunk_id(SOURCE, text) for text in texts]
+    embeddings = EmbeddingBatch.from_float(rng.standard_normal((n, DIM)).astype(np.float32))
+    metadata = [
+        {"topic": str(words[i % len(words)]), "year": 2000 + i % 25, "entities": ["bank", str(words[i % 7])]}
+        for i in range(n)
+    ]
+    return ids, texts, embeddings, metadata
+
+
+def run(assemble, inputs, n):
+    ids, texts, embeddings, metadata = inputs
+    upserts = 0
+    for start in range(0, n, BATCH_SIZE):
+        end = min(start + BATCH_SIZE, n)
+        upserts += len(assemble(ids[start:end], texts[start:end], embeddings[start:end], metadata[start:end]))
+    return upserts
+
+
+def measure(assemble, inputs, n):
+    gc.collect()
+    start = time.perf_counter()
+    assert run(assemble, inputs, n) == n
+    elapsed = time.perf_counter() - start
+    # Peak memory of one batch (ingestion holds a few batches in flight)
+    gc.collect()
+    ids, texts, embeddings, metadata = inputs
+    tracemalloc.start()
+    assemble(ids[:BATCH_SIZE], texts[:BATCH_SIZE], embeddings[:BATCH_SIZE], metadata[:BATCH_SIZE])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = np.random.default_rng(0)
+    inputs = make_inputs(n, rng)
+    print(f"{n} chunks in batches of {BATCH_SIZE}\n")
+
+    legacy_s, legacy_peak = measure(legacy_assemble, inputs, n)
+    columnar_s, columnar_peak = measure(columnar_assemble, inputs, n)
+    print(f"{'legacy (Pydantic per chunk)':<30} {legacy_s:>7.2f} s  {n / legacy_s:>9.0f} chunks/s  peak/batch {legacy_peak / 1024:>7.0f} KiB")
+    print(f"{'columnar (ChunkBatch)':<30} {columnar_s:>7.2f} s  {n / columnar_s:>9.0f} chunks/s  peak/batch {columnar_peak / 1024:>7.0f} KiB")
+    print(f"\nspeedup x{legacy_s / columnar_s:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Docstore benchmark: query payload size and latency with and without a docstore.
+
+Runs VectorStore.mmr_search (fetch_k = 4 * top_k candidates) over a corpus of
+1000-character chunks, once with the text and vectors coming back from the
+index (current path) and once with a local SQLite docstore, where the index
+returns ids and scores only and the candidates are hydrated with one read.
+
+The index is a local in-process index wrapped so every query result is
+serialized the way a remote index (Pinecone) would send it: per query we
+record the response bytes, JSON encode + decode time, and a modeled transfer
+time at BANDWIDTH_MBPS. Docstore reads are measured for real.
+
+Run from the project root:
+    python benchmarks/docstore_benchmark.py
+"""
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Settings require an API key; the benchmark never calls the LLM
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import numpy as np
+from app.services.compact_embedding import as_list
+from app.services.docstore import DocStore
+from app.services.vector_index import LocalVectorIndex, QueryResult, IndexMatch
+from app.services.vector_store import VectorStore
+
+DIM = 384
+CHUNKS = 20000
+QUERIES = 200
+TOP_K = 5
+BANDWIDTH_MBPS = 100.0
+NAMESPACE = "knowledge_base"
+
+
+class WireIndex(LocalVectorIndex):
+    """Local index whose query results go through a Pinecone-style JSON round trip."""
+
+    def __init__(self):
+        super().__init__(path=None)
+        self.samples = []
+
+    def query(self, vector, top_k, namespace="", filter=None, include_values=False, include_metadata=True) -> QueryResult:
+        results = super().query(vector, top_k, namespace, filter, include_values, include_metadata)
+        start = time.perf_counter()
+        payload = json.dumps({"matches": [
+            {
+                "id": m.id,
+                "score": m.score,
+                **({"values": as_list(m.values)} if include_values else {}),
+                **({"metadata": m.metadata} if include_metadata else {}),
+            }
+            for m in results.matches
+        ]}).encode()
+        decoded = json.loads(payload)
+        codec_s = time.perf_counter() - start
+        self.samples.append((len(payload), codec_s))
+        return QueryResult(matches=[
+            IndexMatch(id=m["id"], score=m["score"], values=m.get("values"), metadata=m.get("metadata") or {})
+            for m in decoded["matches"]
+        ])
+
+
+def make_corpus(rng):
+    words = np.array("policy account refund card limit transfer fee branch loan rate statement".split())
+    vectors = rng.standard_normal((CHUNKS, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    records = []
+    for i in range(CHUNKS):
+        records.append((f"chunk-{i}", vectors[i], {
+            "text": " ".join(rng.choice(words, 170))[:1000],
+            "source_file": f"doc-{i // 100}.md",
+            "date_added": "2026-01-01T00:00:00",
+            "previous_chunk_id": f"chunk-{i - 1}" if i else "",
+            "next_chunk_id": f"chunk-{i + 1}",
+            "type": "document_chunk",
+            "topic": str(words[i % len(words)]),
+        }))
+    return records
+
+
+def run(store, index, queries):
+    index.samples.clear()
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        store.mmr_search("", top_k=TOP_K, namespace=NAMESPACE, query_vector=q)
+        latencies.append(time.perf_counter() - start)
+    sizes = [size for size, _ in index.samples]
+    codec = [codec_s for _, codec_s in index.samples]
+    transfer_ms = statistics.mean(sizes) * 8 / (BANDWIDTH_MBPS * 1e6) * 1000
+    return {
+        "bytes": statistics.mean(sizes),
+        "codec_ms": statistics.mean(codec) * 1000,
+        "transfer_ms": transfer_ms,
+        # Local work (index scan, JSON round trip, docstore read, MMR) plus modeled transfer
+        "latency_ms": statistics.mean(latencies) * 1000 + transfer_ms,
+    }
+
+
+def main():
+    rng = np.random.default_rng(0)
+    records = make_corpus(rng)
+    queries = rng.standard_normal((QUERIES, DIM)).astype(np.float32)
+    engine = SimpleNamespace(normalized=True)
+    print(f"{CHUNKS} chunks, {QUERIES} MMR queries (top_k={TOP_K}, fetch_k={TOP_K * 4}), {BANDWIDTH_MBPS:.0f} Mbit/s\n")
+
+    index = WireIndex()
+    index.upsert(records, namespace=NAMESPACE)
+    current = run(VectorStore(embedding_engine=engine, index=index), index, queries)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        docstore = DocStore(path=os.path.join(tmp, "docstore.sqlite3"))
+        ids_index = WireIndex()
+        store = VectorStore(embedding_engine=engine, index=ids_index, docstore=docstore)
+        ids_index.upsert(store._stage_documents(records, NAMESPACE), namespace=NAMESPACE)
+        with_docstore = run(store, ids_index, queries)
+        docstore.close()
+
+    for name, r in (("index payload (current)", current), ("ids only + docstore", with_docstore)):
+        print(
+            f"{name:<24} response {r['bytes'] / 1024:>7.1f} KiB  json {r['codec_ms']:>6.2f} ms  "
+            f"transfer {r['transfer_ms']:>6.2f} ms  total {r['latency_ms']:>6.2f} ms/query"
+        )
+    print(f"\npayload x{current['bytes'] / with_docstore['bytes']:.0f} smaller, latency x{current['latency_ms'] / with_docstore['latency_ms']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
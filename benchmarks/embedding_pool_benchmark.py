@@ -0,0 +1,80 @@
+"""
+Ingestion embedding throughput: in-process engine vs process pool.
+
+Embeds a synthetic corpus of ~1000-character chunks (the ingestion chunk size)
+in ingestion-sized batches, first with the in-process EmbeddingEngine and then
+with ProcessEmbeddingPool at increasing worker counts, and reports chunks/sec
+for each. Model loading in the workers is excluded from the timings.
+
+Run from the project root:
+    python benchmarks/embedding_pool_benchmark.py [num_chunks]
+"""
+import os
+import sys
+import time
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Settings require an API key; the benchmark never calls the LLM
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import numpy as np
+from app.core.config import settings
+from app.services.embedding_service import EmbeddingEngine
+from app.services.embedding_pool import ProcessEmbeddingPool
+
+WORDS = (
+    "refund policy account balance transfer limit card statement payment dispute "
+    "interest rate overdraft branch mobile app verification fee schedule loan "
+    "mortgage savings deposit withdrawal currency exchange fraud alert support"
+).split()
+BATCH_SIZE = settings.INGEST_BATCH_SIZE
+WARMUP = ["warm up"] * 8
+
+
+def make_chunks(n, rng):
+    chunks = []
+    for _ in range(n):
+        words = rng.choice(WORDS, size=160)
+        chunks.append(" ".join(words)[:settings.INGEST_CHUNK_SIZE])
+    return chunks
+
+
+def run(embedder, chunks):
+    """Submits every batch up front (as ingestion keeps several batches in flight) and waits for all."""
+    embedder.encode(WARMUP)
+    start = time.perf_counter()
+    futures = [embedder.submit(chunks[i:i + BATCH_SIZE]) for i in range(0, len(chunks), BATCH_SIZE)]
+    vectors = np.vstack([f.result() for f in futures])
+    elapsed = time.perf_counter() - start
+    return vectors, len(chunks) / elapsed
+
+
+def main():
+    num_chunks = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rng = np.random.default_rng(0)
+    chunks = make_chunks(num_chunks, rng)
+    cpus = os.cpu_count() or 1
+    print(f"{num_chunks} chunks, batch size {BATCH_SIZE}, model {settings.EMBEDDING_MODEL_NAME}, {cpus} CPUs\n")
+
+    engine = EmbeddingEngine()
+    try:
+        reference, baseline = run(engine, chunks)
+    finally:
+        engine.close()
+    print(f"{'in-process engine':<22} {baseline:>10.1f} chunks/s")
+
+    workers = 1
+    while workers <= cpus:
+        pool = ProcessEmbeddingPool(num_workers=workers)
+        try:
+            vectors, rate = run(pool, chunks)
+        finally:
+            pool.close()
+        max_diff = float(np.abs(vectors - reference).max())
+        print(f"{f'pool, {workers} workers':<22} {rate:>10.1f} chunks/s  x{rate / baseline:.2f}  max |diff| {max_diff:.1e}")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
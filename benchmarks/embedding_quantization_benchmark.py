@@ -0,0 +1,124 @@
+"""
+Compact embedding benchmark: memory, accuracy and recall vs float32.
+
+Builds a synthetic corpus of clustered unit vectors (384-d, like
+all-MiniLM-L6-v2) and compares the storage dtypes of EmbeddingBatch and the
+local vector index:
+
+- memory per vector: Python List[float] vs float32 / float16 / int8 arrays
+- accuracy: cosine error of dequantized vectors against float32
+- recall@k of LocalVectorIndex top-k against an exact float32 index
+- MMR agreement: overlap of the MMR selection with the float32 one
+
+Exits non-zero when a dtype falls below its recall threshold.
+
+Run from the project root:
+    python benchmarks/embedding_quantization_benchmark.py
+"""
+import os
+import sys
+import time
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Settings require an API key; the benchmark never calls the LLM
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import numpy as np
+from app.services.compact_embedding import EmbeddingBatch
+from app.services.mmr import mmr
+from app.services.vector_index import LocalVectorIndex
+
+DIM = 384
+VECTORS = 50000
+CLUSTERS = 200
+QUERIES = 200
+TOP_K = 10
+MMR_FETCH_K = 40
+# Minimum mean recall@TOP_K against float32
+RECALL_THRESHOLDS = {"float32": 1.0, "float16": 0.99, "int8": 0.95}
+
+
+def unit(matrix):
+    return (matrix / np.linalg.norm(matrix, axis=-1, keepdims=True)).astype(np.float32)
+
+
+def make_corpus(rng):
+    centers = unit(rng.standard_normal((CLUSTERS, DIM)))
+    labels = rng.integers(0, CLUSTERS, VECTORS)
+    corpus = unit(centers[labels] + 0.08 * rng.standard_normal((VECTORS, DIM)))
+    queries = unit(centers[rng.integers(0, CLUSTERS, QUERIES)] + 0.08 * rng.standard_normal((QUERIES, DIM)))
+    return corpus, queries
+
+
+def list_bytes(vector):
+    """Memory of one embedding held as a Python List[float]."""
+    as_list = vector.tolist()
+    return sys.getsizeof(as_list) + sum(sys.getsizeof(x) for x in as_list)
+
+
+def build_index(dtype, corpus):
+    index = LocalVectorIndex(path=None, dtype=dtype)
+    ids = [f"v{i}" for i in range(len(corpus))]
+    batch = EmbeddingBatch.from_float(corpus, dtype)
+    for start in range(0, len(corpus), 1000):
+        index.upsert([
+            (ids[i], batch[i], {"type": "document_chunk"})
+            for i in range(start, min(start + 1000, len(corpus)))
+        ])
+    return index
+
+
+def mmr_ids(index, query):
+    matches = index.query(query, MMR_FETCH_K, include_values=True).matches
+    selected, _ = mmr(query, [m.values for m in matches], TOP_K, 0.5, normalized=True)
+    return [matches[i].id for i in selected]
+
+
+def main():
+    rng = np.random.default_rng(0)
+    corpus, queries = make_corpus(rng)
+    print(f"{VECTORS} vectors x {DIM} dims, {QUERIES} queries, recall@{TOP_K}\n")
+
+    print(f"{'List[float]':<10} {list_bytes(corpus[0]):>8} bytes/vector")
+    reference = build_index("float32", corpus)
+    reference_hits = [
+        [m.id for m in reference.query(q, TOP_K).matches]
+        for q in queries
+    ]
+    reference_mmr = [mmr_ids(reference, q) for q in queries]
+
+    failed = False
+    for dtype in ("float32", "float16", "int8"):
+        batch = EmbeddingBatch.from_float(corpus, dtype)
+        error = 1.0 - np.sum(unit(batch.to_float()) * corpus, axis=1)
+
+        index = reference if dtype == "float32" else build_index(dtype, corpus)
+        start = time.perf_counter()
+        results = [index.query(q, TOP_K).matches for q in queries]
+        latency_ms = (time.perf_counter() - start) * 1000 / QUERIES
+        recall = np.mean([
+            len({m.id for m in matches} & set(expected)) / TOP_K
+            for matches, expected in zip(results, reference_hits)
+        ])
+        mmr_overlap = np.mean([
+            len(set(mmr_ids(index, q)) & set(expected)) / len(expected)
+            for q, expected in zip(queries, reference_mmr)
+        ])
+        stats = index.describe_index_stats()
+
+        ok = recall >= RECALL_THRESHOLDS[dtype]
+        failed = failed or not ok
+        print(
+            f"{dtype:<10} {batch.nbytes / VECTORS:>8.0f} bytes/vector  "
+            f"index {stats['vector_bytes'] / 2**20:>6.1f} MiB  "
+            f"cosine err mean {error.mean():.1e} max {error.max():.1e}  "
+            f"recall@{TOP_K} {recall:.4f}  mmr overlap {mmr_overlap:.2%}  "
+            f"query {latency_ms:.2f} ms  {'ok' if ok else 'BELOW THRESHOLD'}"
+        )
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Event-loop stall load test for chat persistence.
+
+Runs concurrent chat turns (get-or-create user/session, store the user message,
+load history, a simulated LLM wait, store the assistant message) against a
+temporary SQLite database while a probe coroutine measures how late the event
+loop wakes it up. Compares the previous synchronous Session code running on the
+loop thread (copied below) with the async engine and single-transaction turn
+used by the chat endpoint now.
+
+Run from the project root:
+    python benchmarks/event_loop_stall_benchmark.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Settings require an API key; the benchmark never calls the LLM
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.db.base import Base
+from app.models import Chat, Session as DbSession, User
+from app.schemas.chat import ChatRequest
+from app.services.chat_history import ChatHistoryRepository
+from app.api.api_v1.endpoints.chat import _start_turn, _save_assistant_message
+
+SESSIONS = 50
+PREFILLED_MESSAGES = 500
+TURNS = 400
+CONCURRENCY = 32
+LLM_LATENCY_S = 0.02
+PROBE_INTERVAL_S = 0.001
+
+
+def legacy_start_turn(db, request):
+    """The previous synchronous _start_turn (four commits, refresh, full history)."""
+    db_session = db.query(DbSession).filter(DbSession.id == request.session_id).first()
+    if not db_session:
+        user = db.query(User).filter(User.id == request.user_id).first()
+        if not user:
+            user = User(id=request.user_id, email=f"user{request.user_id}@example.com")
+            db.add(user)
+            db.commit()
+            db.refresh(user)
+
+        db_session = DbSession(id=request.session_id, user_id=request.user_id, title=request.query[:30])
+        db.add(db_session)
+        db.commit()
+        db.refresh(db_session)
+
+    user_msg = Chat(session_id=request.session_id, role="user", content=request.query)
+    db.add(user_msg)
+    db.commit()
+
+    full_history = db.query(Chat).filter(Chat.session_id == request.session_id).order_by(Chat.created_at).all()
+    return [{"role": msg.role, "content": msg.content} for msg in full_history]
+
+
+def legacy_save_assistant_message(db, session_id, answer):
+    db.add(Chat(session_id=session_id, role="assistant", content=answer, chunks_used=[], prompt_tokens=0, completion_tokens=0))
+    db.commit()
+
+
+def prepare_db(path):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as db:
+        # Half of the sessions already exist with history; the rest are created by the load
+        start = datetime(2024, 1, 1)
+        db.add(User(id=1, email="user1@example.com"))
+        for s in range(SESSIONS // 2):
+            db.add(DbSession(id=f"s{s}", user_id=1, title="bench"))
+        db.commit()
+        db.bulk_insert_mappings(Chat, [
+            {"session_id": f"s{s}", "role": "user", "content": "previous message " * 10, "created_at": start + timedelta(seconds=i)}
+            for s in range(SESSIONS // 2) for i in range(PREFILLED_MESSAGES)
+        ])
+        db.commit()
+    engine.dispose()
+
+
+async def probe(stop: asyncio.Event, lags: list):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + PROBE_INTERVAL_S
+        await asyncio.sleep(PROBE_INTERVAL_S)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+async def run_load(turn):
+    stop = asyncio.Event()
+    lags: list = []
+    probe_task = asyncio.create_task(probe(stop, lags))
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def one(i):
+        async with semaphore:
+            request = ChatRequest(query=f"question {i}", user_id=1, session_id=f"s{i % SESSIONS}")
+            await turn(request)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(TURNS)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe_task
+
+    lags_ms = np.array(lags) * 1000.0
+    return {
+        "turns_per_s": TURNS / elapsed,
+        "stall_total_ms": float(lags_ms[lags_ms > 1.0].sum()),
+        "lag_p99_ms": float(np.percentile(lags_ms, 99)),
+        "lag_max_ms": float(lags_ms.max()),
+    }
+
+
+async def legacy(path):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    async def turn(request):
+        db = SessionLocal()
+        try:
+            legacy_start_turn(db, request)
+            await asyncio.sleep(LLM_LATENCY_S)
+            legacy_save_assistant_message(db, request.session_id, "answer")
+        finally:
+            db.close()
+
+    result = await run_load(turn)
+    engine.dispose()
+    return result
+
+
+async def current(path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    AsyncSessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    history = ChatHistoryRepository(window=10, max_sessions=1000)
+
+    async def turn(request):
+        async with AsyncSessionLocal() as db:
+            await _start_turn(db, history, request)
+            await asyncio.sleep(LLM_LATENCY_S)
+            await _save_assistant_message(db, history, request.session_id, "answer", [], {})
+
+    result = await run_load(turn)
+    await engine.dispose()
+    return result
+
+
+def main():
+    print(f"{TURNS} turns, concurrency {CONCURRENCY}, {SESSIONS} sessions ({PREFILLED_MESSAGES} prior messages in half)")
+    print(f"{'variant':>10} | {'turns/s':>8} | {'stall total ms':>14} | {'lag p99 ms':>10} | {'lag max ms':>10}")
+    for name, variant in (("sync", legacy), ("async", current)):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "stall.db")
+            prepare_db(path)
+            r = asyncio.run(variant(path))
+        print(f"{name:>10} | {r['turns_per_s']:>8.1f} | {r['stall_total_ms']:>14.1f} | {r['lag_p99_ms']:>10.2f} | {r['lag_max_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
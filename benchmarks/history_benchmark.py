@@ -0,0 +1,92 @@
+"""
+Chat history benchmark.
+
+Compares the previous history load (every message of the session, ordered by
+created_at, converted to dicts) with ChatHistoryRepository: a windowed query
+on the (session_id, created_at) index, and a warm ring-buffer read. Sessions of
+10, 1k and 100k messages in a temporary SQLite database.
+
+Run from the project root:
+    python benchmarks/history_benchmark.py
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Settings require an API key; the benchmark never calls the LLM
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.db.base import Base
+from app.models import Chat, Session as DbSession, User
+from app.services.chat_history import ChatHistoryRepository
+
+SESSION_SIZES = [10, 1_000, 100_000]
+REPEATS = 20
+
+
+def legacy_history(db, session_id):
+    """The previous _start_turn history load."""
+    full_history = db.query(Chat).filter(Chat.session_id == session_id).order_by(Chat.created_at).all()
+    return [{"role": msg.role, "content": msg.content} for msg in full_history]
+
+
+def populate(db, session_id, n):
+    db.add(DbSession(id=session_id, user_id=1, title=session_id))
+    start = datetime(2024, 1, 1)
+    db.bulk_insert_mappings(Chat, [
+        {
+            "session_id": session_id,
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": f"message {i} " + "lorem ipsum dolor sit amet " * 8,
+            "created_at": start + timedelta(seconds=i),
+        }
+        for i in range(n)
+    ])
+    db.commit()
+
+
+def timed(fn, repeats=REPEATS):
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - started) / repeats * 1000.0
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'history.db')}")
+        Base.metadata.create_all(engine)
+        SessionMaker = sessionmaker(bind=engine)
+
+        with SessionMaker() as db:
+            db.add(User(id=1, email="bench@example.com"))
+            db.commit()
+            for n in SESSION_SIZES:
+                populate(db, f"s{n}", n)
+
+        print(f"{'messages':>9} | {'full load ms':>12} | {'windowed ms':>11} | {'buffered ms':>11} | speedup")
+        for n in SESSION_SIZES:
+            session_id = f"s{n}"
+            with SessionMaker() as db:
+                full_ms = timed(lambda: legacy_history(db, session_id), repeats=3 if n >= 100_000 else REPEATS)
+
+                cold = ChatHistoryRepository(window=10, max_sessions=0)
+                windowed_ms = timed(lambda: cold.recent(db, session_id))
+
+                warm = ChatHistoryRepository(window=10, max_sessions=100)
+                warm.recent(db, session_id)
+                buffered_ms = timed(lambda: warm.recent(db, session_id))
+
+                assert cold.recent(db, session_id) == legacy_history(db, session_id)[-10:]
+            print(f"{n:>9} | {full_ms:>12.3f} | {windowed_ms:>11.3f} | {buffered_ms:>11.4f} | {full_ms / windowed_ms:>6.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Lexical index benchmark: build, memory, persistence and lookup latency.
+
+Indexes a synthetic corpus of 1000-character chunks that mention product
+codes (SKU-xxxxx) and file names, then reports:
+
+- indexing throughput (incremental `add` in ingestion-sized batches)
+- posting list memory (compact arrays) vs the same postings as Python lists
+- snapshot size on disk and reload time
+- latency of BM25 search and of the exact identifier fast path, and the
+  accuracy of identifier lookups (the chunk mentioning a code is returned first)
+
+Run from the project root:
+    python benchmarks/lexical_index_benchmark.py [num_chunks]
+"""
+import os
+import sys
+import tempfile
+import time
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Settings require an API key; the benchmark never calls the LLM
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import numpy as np
+from app.core.config import settings
+from app.services.lexical_index import LexicalIndex
+
+QUERIES = 2000
+WORDS = (
+    "policy account refund card limit transfer fee branch loan rate statement customer "
+    "balance interest payment deposit withdrawal overdraft credit debit mortgage savings"
+).split()
+
+
+def make_corpus(n, rng):
+    chunks = []
+    for i in range(n):
+        words = " ".join(rng.choice(WORDS, 140))
+        chunks.append((f"chunk-{i}", f"SKU-{i:06d} see catalog_{i // 50}.pdf {words}"[:1000]))
+    return chunks
+
+
+def array_postings_bytes(index):
+    """Memory of the posting arrays, object overhead included."""
+    return sum(sys.getsizeof(docs) + sys.getsizeof(tfs) for docs, tfs in index._postings.values())
+
+
+def list_postings_bytes(index):
+    """Memory the same postings would take as Python lists of (doc, tf) ints."""
+    postings = sum(len(docs) for docs, _ in index._postings.values())
+    # List slot (8) per entry in two lists; small ints are cached, larger ones are 28-byte objects
+    return postings * (8 + 8 + 28) + len(index._postings) * 2 * sys.getsizeof([])
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = np.random.default_rng(0)
+    chunks = make_corpus(n, rng)
+    print(f"{n} chunks, batches of {settings.INGEST_BATCH_SIZE}\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = LexicalIndex(path=tmp)
+        start = time.perf_counter()
+        for i in range(0, n, settings.INGEST_BATCH_SIZE):
+            index.add(chunks[i:i + settings.INGEST_BATCH_SIZE])
+        build_s = time.perf_counter() - start
+        stats = index.stats()
+        print(f"indexing          {build_s:>7.2f} s  {n / build_s:>9.0f} chunks/s  {stats['terms']} terms, {stats['postings']} postings")
+        print(f"posting memory    {array_postings_bytes(index) / 2**20:>7.1f} MiB compact arrays vs ~{list_postings_bytes(index) / 2**20:.1f} MiB as lists")
+
+        start = time.perf_counter()
+        index.close()
+        snapshot_s = time.perf_counter() - start
+        size = os.path.getsize(os.path.join(tmp, "snapshot.bin"))
+        start = time.perf_counter()
+        index = LexicalIndex(path=tmp)
+        load_s = time.perf_counter() - start
+        print(f"snapshot          {size / 2**20:>7.1f} MiB  write {snapshot_s:.2f} s  reload {load_s:.2f} s\n")
+
+        targets = rng.integers(0, n, QUERIES)
+        start = time.perf_counter()
+        exact = [index.exact_match(f"SKU-{t:06d}", 5) for t in targets]
+        exact_ms = (time.perf_counter() - start) * 1000 / QUERIES
+        hits = sum(bool(r) and r[0][0] == f"chunk-{t}" for r, t in zip(exact, targets))
+
+        start = time.perf_counter()
+        searched = [index.search(f"{rng.choice(WORDS)} {rng.choice(WORDS)} SKU-{t:06d}", 20) for t in targets]
+        search_ms = (time.perf_counter() - start) * 1000 / QUERIES
+        top1 = sum(bool(r) and r[0][0] == f"chunk-{t}" for r, t in zip(searched, targets))
+
+        print(f"exact fast path   {exact_ms:>7.3f} ms/query  identifier found first {hits / QUERIES:.1%}")
+        print(f"BM25 search       {search_ms:>7.3f} ms/query  identifier chunk ranked first {top1 / QUERIES:.1%}")
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+LLM scheduler benchmark.
+
+Starts benchmarks/llm_stub_server.py on a local port and sends a burst of bulk
+(ingestion-style metadata) calls with interactive chat calls arriving during
+the burst. Compares calls sent straight to the API (no limits, no retries,
+like the previous LLMService) with the shared LLMScheduler configured for the
+stub's limit: failed calls, 429s seen by the server, interactive latency and
+the time to finish the bulk work.
+
+Run from the project root:
+    python benchmarks/llm_scheduler_benchmark.py
+"""
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import numpy as np
+import uvicorn
+from benchmarks import llm_stub_server
+from app.core.config import settings
+from app.services.llm_service import LLMService
+from app.services.rate_limiter import LLMScheduler, Priority
+
+BULK_CALLS = 300
+INTERACTIVE_CALLS = 30
+INTERACTIVE_INTERVAL_S = 0.2
+SCHEMA = {"type": "object", "properties": {}}
+
+
+def start_stub() -> str:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(llm_stub_server.app, host="127.0.0.1", port=port, log_level="error"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+async def run(llm: LLMService):
+    failures = {"bulk": 0, "interactive": 0}
+    interactive_latencies = []
+
+    async def bulk(i):
+        try:
+            await llm.get_structured_response(f"Extract metadata from chunk {i}", SCHEMA, "system", priority=Priority.BULK)
+        except Exception:
+            failures["bulk"] += 1
+
+    async def interactive(i):
+        await asyncio.sleep(i * INTERACTIVE_INTERVAL_S)
+        started = time.perf_counter()
+        try:
+            await llm.get_structured_response(f"User question {i}", SCHEMA, "system")
+            interactive_latencies.append((time.perf_counter() - started) * 1000.0)
+        except Exception:
+            failures["interactive"] += 1
+
+    started = time.perf_counter()
+    bulk_done = asyncio.gather(*(bulk(i) for i in range(BULK_CALLS)))
+    await asyncio.gather(bulk_done, *(interactive(i) for i in range(INTERACTIVE_CALLS)))
+    elapsed = time.perf_counter() - started
+    await llm.close()
+
+    latencies = np.array(interactive_latencies) if interactive_latencies else np.array([float("nan")])
+    return failures, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 95)), elapsed
+
+
+def main():
+    # LLMService reads the base URL when it is constructed
+    settings.OPENAI_BASE_URL = start_stub()
+
+    rps = llm_stub_server.REQUESTS_PER_SECOND
+    variants = {
+        # No limits and no retries: every call goes out at once
+        "direct": LLMScheduler(requests_per_minute=0, tokens_per_minute=0, max_concurrency=100_000, bulk_max_share=1.0, max_retries=0),
+        # Slightly under the stub's limit; the token limit is not binding here
+        "scheduled": LLMScheduler(requests_per_minute=int(rps * 60 * 0.9), tokens_per_minute=0, max_concurrency=32),
+    }
+    print(f"{BULK_CALLS} bulk + {INTERACTIVE_CALLS} interactive calls, stub limit {rps} req/s, latency {llm_stub_server.LATENCY_S}s")
+    print(f"{'variant':>10} | {'failed bulk':>11} | {'failed chat':>11} | {'429s':>5} | {'chat p50 ms':>11} | {'chat p95 ms':>11} | {'total s':>7}")
+    for name, scheduler in variants.items():
+        before = llm_stub_server.counters["rate_limited"]
+        failures, p50, p95, elapsed = asyncio.run(run(LLMService(scheduler=scheduler)))
+        limited = llm_stub_server.counters["rate_limited"] - before
+        print(f"{name:>10} | {failures['bulk']:>11} | {failures['interactive']:>11} | {limited:>5} | {p50:>11.0f} | {p95:>11.0f} | {elapsed:>7.1f}")
+        time.sleep(1.5) # let the stub's window reset
+
+
+if __name__ == "__main__":
+    main()
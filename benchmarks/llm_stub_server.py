@@ -0,0 +1,87 @@
+"""
+Local OpenAI-compatible stub server.
+
+Serves /v1/chat/completions (plain and streaming) with a fixed latency and
+enforces its own requests-per-second limit, answering 429 with a Retry-After
+header when it is exceeded - enough to exercise LLMService and its scheduler
+without calling the real API. Responses are always the JSON object "{}" so
+structured-output callers can parse them.
+
+Run from the project root and point the app at it:
+    uvicorn benchmarks.llm_stub_server:app --port 8001
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1
+Tune with STUB_LATENCY_S, STUB_REQUESTS_PER_SECOND and STUB_RETRY_AFTER_S.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY_S = float(os.getenv("STUB_LATENCY_S", "0.2"))
+REQUESTS_PER_SECOND = int(os.getenv("STUB_REQUESTS_PER_SECOND", "20"))
+RETRY_AFTER_S = float(os.getenv("STUB_RETRY_AFTER_S", "1"))
+
+app = FastAPI()
+_recent = deque()
+counters = {"requests": 0, "rate_limited": 0, "max_concurrency": 0, "inflight": 0}
+
+
+def _over_limit() -> bool:
+    now = time.monotonic()
+    while _recent and now - _recent[0] > 1.0:
+        _recent.popleft()
+    if len(_recent) >= REQUESTS_PER_SECOND:
+        return True
+    _recent.append(now)
+    return False
+
+
+def _usage(body) -> dict:
+    prompt_tokens = sum(len(m.get("content", "")) // 4 for m in body.get("messages", []))
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": 1, "total_tokens": prompt_tokens + 1}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    counters["requests"] += 1
+    if _over_limit():
+        counters["rate_limited"] += 1
+        return JSONResponse(
+            {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+            status_code=429,
+            headers={"retry-after": str(RETRY_AFTER_S)},
+        )
+
+    counters["inflight"] += 1
+    counters["max_concurrency"] = max(counters["max_concurrency"], counters["inflight"])
+    try:
+        await asyncio.sleep(LATENCY_S)
+    finally:
+        counters["inflight"] -= 1
+
+    base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": body.get("model", "stub")}
+    if not body.get("stream"):
+        return {
+            **base,
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "{}"}, "finish_reason": "stop"}],
+            "usage": _usage(body),
+        }
+
+    async def events():
+        delta = {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"role": "assistant", "content": "{}"}, "finish_reason": None}]}
+        yield f"data: {json.dumps(delta)}\n\n"
+        done = {**base, "object": "chat.completion.chunk", "choices": [], "usage": _usage(body)}
+        yield f"data: {json.dumps(done)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/stats")
+def stats():
+    return counters
@@ -0,0 +1,99 @@
+"""
+MMR micro-benchmark.
+
+Compares the previous VectorStore._calculate_mmr (sklearn similarity matrix +
+Python double loop) against the NumPy implementation in app/services/mmr.py
+for fetch_k from 20 to 1000, and the batched entry point against per-query calls.
+
+Run from the project root:
+    python benchmarks/mmr_benchmark.py
+"""
+import os
+import sys
+import time
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.mmr import mmr, batch_mmr
+
+DIM = 384
+LAMBDA = 0.5
+
+
+def legacy_mmr(query_embedding, candidate_vectors, top_k, lambda_param):
+    """Verbatim copy of the previous VectorStore._calculate_mmr."""
+    if not candidate_vectors:
+        return []
+    query_vec = np.array(query_embedding).reshape(1, -1)
+    candidate_matrix = np.array(candidate_vectors)
+    from sklearn.metrics.pairwise import cosine_similarity
+    sim_query_candidates = cosine_similarity(query_vec, candidate_matrix)[0]
+    sim_candidate_candidate = cosine_similarity(candidate_matrix, candidate_matrix)
+
+    selected_indices = []
+    candidate_indices = list(range(len(candidate_vectors)))
+    for _ in range(min(top_k, len(candidate_vectors))):
+        best_mmr = -float("inf")
+        best_idx = -1
+        for idx in candidate_indices:
+            sim_q = sim_query_candidates[idx]
+            if not selected_indices:
+                max_sim_selected = 0
+            else:
+                max_sim_selected = max([sim_candidate_candidate[idx][sel_idx] for sel_idx in selected_indices])
+            mmr_score = lambda_param * sim_q - (1 - lambda_param) * max_sim_selected
+            if mmr_score > best_mmr:
+                best_mmr = mmr_score
+                best_idx = idx
+        selected_indices.append(best_idx)
+        candidate_indices.remove(best_idx)
+    return selected_indices
+
+
+def unit(rng, *shape):
+    x = rng.standard_normal(shape).astype(np.float32)
+    return x / np.linalg.norm(x, axis=-1, keepdims=True)
+
+
+def timeit(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000.0
+
+
+def main():
+    rng = np.random.default_rng(0)
+
+    print(f"{'fetch_k':>8} {'top_k':>6} {'legacy ms':>10} {'numpy ms':>10} {'speedup':>8} {'same':>5}")
+    for fetch_k in [20, 50, 100, 200, 500, 1000]:
+        top_k = max(5, fetch_k // 4)
+        query = unit(rng, DIM)
+        candidates = unit(rng, fetch_k, DIM)
+        # Legacy path received Python lists from the index client
+        query_list, candidates_list = query.tolist(), candidates.tolist()
+
+        repeat = 3 if fetch_k >= 500 else 10
+        legacy_ms = timeit(lambda: legacy_mmr(query_list, candidates_list, top_k, LAMBDA), repeat)
+        new_ms = timeit(lambda: mmr(query, candidates, top_k, LAMBDA, normalized=True), repeat)
+
+        same = legacy_mmr(query_list, candidates_list, top_k, LAMBDA) == mmr(query, candidates, top_k, LAMBDA)[0]
+        print(f"{fetch_k:>8} {top_k:>6} {legacy_ms:>10.2f} {new_ms:>10.2f} {legacy_ms / new_ms:>7.1f}x {str(same):>5}")
+
+    print("\nBatched re-ranking vs per-query calls")
+    for n_queries, fetch_k, top_k in [(5, 8, 2), (5, 200, 10)]:
+        queries = unit(rng, n_queries, DIM)
+        sets = [unit(rng, fetch_k, DIM) for _ in range(n_queries)]
+        loop_ms = timeit(lambda: [mmr(q, c, top_k, LAMBDA, normalized=True) for q, c in zip(queries, sets)], 20)
+        batch_ms = timeit(lambda: batch_mmr(queries, sets, top_k, LAMBDA, normalized=True), 20)
+        same = [r[0] for r in batch_mmr(queries, sets, top_k, LAMBDA, normalized=True)] == \
+            [mmr(q, c, top_k, LAMBDA, normalized=True)[0] for q, c in zip(queries, sets)]
+        print(f"  queries={n_queries} fetch_k={fetch_k}: per-query {loop_ms:.3f} ms, batched {batch_ms:.3f} ms, same={same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Detailed-mode retrieval benchmark: per-sub-query MMR vs single-pass multi-query.
+
+Runs the retrieval of detailed mode (5 planned sub-queries, 10 chunks of
+context) over a clustered synthetic corpus two ways:
+
+- per sub-query: `ammr_search_many` (one encode and one index query per
+  sub-query, top_k=2 MMR each) followed by a dedupe by id (previous path)
+- single pass: `amulti_query_search` (one batch encode, sub-queries with the
+  same filter in one batched index query, one MMR over the pooled candidates
+  with at least one chunk per sub-query)
+
+The index is a local in-process index with a modeled network round trip
+(ROUND_TRIP_MS per call), and the encoder is a stub with a fixed cost per
+call plus per text. Reports latency, index calls and encoder calls per turn,
+the context chunks returned, their redundancy (mean pairwise cosine
+similarity) and the share of sub-queries with one of their 8 nearest chunks
+in the context.
+
+Run from the project root:
+    python benchmarks/multi_query_benchmark.py
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Settings require an API key; the benchmark never calls the LLM
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import numpy as np
+from app.services.vector_index import LocalVectorIndex
+from app.services.vector_store import VectorStore
+
+DIM = 384
+CHUNKS = 20000
+CLUSTERS = 400
+TURNS = 100
+SUB_QUERIES = 5
+ROUND_TRIP_MS = 15.0
+ENCODE_CALL_MS = 4.0
+ENCODE_TEXT_MS = 0.5
+NAMESPACE = "knowledge_base"
+
+
+def unit(matrix):
+    return (matrix / np.linalg.norm(matrix, axis=-1, keepdims=True)).astype(np.float32)
+
+
+class RemoteIndex(LocalVectorIndex):
+    """Local index that sleeps one round trip per call and counts calls."""
+
+    def __init__(self):
+        super().__init__(path=None)
+        self.calls = 0
+
+    # LocalVectorIndex.query goes through query_many, so this counts both
+    def query_many(self, vectors, *args, **kwargs):
+        self.calls += 1
+        time.sleep(ROUND_TRIP_MS / 1000)
+        return super().query_many(vectors, *args, **kwargs)
+
+
+class StubEncoder:
+    """Maps query strings to precomputed vectors with a modeled encode cost."""
+
+    normalized = True
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.calls = 0
+
+    async def aencode(self, texts):
+        self.calls += 1
+        await asyncio.sleep((ENCODE_CALL_MS + ENCODE_TEXT_MS * len(texts)) / 1000)
+        return np.stack([self.vectors[t] for t in texts])
+
+    async def aembed_query(self, text):
+        return (await self.aencode([text]))[0]
+
+
+def make_turns(rng, centers):
+    """Sub-queries of a turn: around 2-3 related topics, some sharing a filter."""
+    vectors, turns = {}, []
+    for t in range(TURNS):
+        topics = rng.choice(CLUSTERS, 3, replace=False)
+        subs = []
+        for s in range(SUB_QUERIES):
+            name = f"turn {t} sub-query {s}"
+            vectors[name] = unit(centers[topics[s % 3]] + 0.05 * rng.standard_normal(DIM))
+            subs.append({"query": name, "filter": {"type": "document_chunk"} if s % 2 else None})
+        turns.append(subs)
+    return vectors, turns
+
+
+def redundancy(chunks, by_id):
+    if len(chunks) < 2:
+        return 0.0
+    matrix = np.stack([by_id[c["id"]] for c in chunks])
+    sims = matrix @ matrix.T
+    return float(sims[np.triu_indices(len(chunks), 1)].mean())
+
+
+async def per_sub_query(store, subs):
+    results = await store.ammr_search_many(subs, top_k=2)
+    unique = {}
+    for res in results:
+        for chunk in res:
+            unique.setdefault(chunk["id"], chunk)
+    return list(unique.values())
+
+
+async def single_pass(store, subs):
+    return await store.amulti_query_search(subs, top_k=2 * len(subs), min_per_query=1)
+
+
+async def run(name, retrieve, store, index, encoder, turns, vectors, by_id, corpus, ids):
+    index.calls = encoder.calls = 0
+    latencies, counts, redundancies, covered = [], [], [], []
+    for subs in turns:
+        start = time.perf_counter()
+        chunks = await retrieve(store, subs)
+        latencies.append(time.perf_counter() - start)
+        counts.append(len(chunks))
+        redundancies.append(redundancy(chunks, by_id))
+        # A sub-query is covered when some returned chunk is among its 8 nearest
+        for sub in subs:
+            nearest = {ids[i] for i in np.argsort(-(corpus @ vectors[sub["query"]]))[:8]}
+            covered.append(any(c["id"] in nearest for c in chunks))
+    print(
+        f"{name:<16} {statistics.mean(latencies) * 1000:>7.1f} ms/turn  "
+        f"index calls {index.calls / len(turns):>4.1f}  encode calls {encoder.calls / len(turns):>4.1f}  "
+        f"chunks {statistics.mean(counts):>5.2f}  redundancy {statistics.mean(redundancies):.3f}  "
+        f"sub-queries covered {np.mean(covered):.1%}"
+    )
+
+
+async def main():
+    rng = np.random.default_rng(0)
+    centers = unit(rng.standard_normal((CLUSTERS, DIM)))
+    corpus = unit(centers[rng.integers(0, CLUSTERS, CHUNKS)] + 0.08 * rng.standard_normal((CHUNKS, DIM)))
+    index = RemoteIndex()
+    ids = [f"chunk-{i}" for i in range(CHUNKS)]
+    for start in range(0, CHUNKS, 1000):
+        index.upsert([
+            (ids[i], corpus[i], {"text": f"chunk {i}", "type": "document_chunk"})
+            for i in range(start, min(start + 1000, CHUNKS))
+        ], namespace=NAMESPACE)
+    by_id = dict(zip(ids, corpus))
+    vectors, turns = make_turns(rng, centers)
+    encoder = StubEncoder(vectors)
+    store = VectorStore(embedding_engine=encoder, index=index)
+    print(f"{CHUNKS} chunks, {TURNS} turns x {SUB_QUERIES} sub-queries, {ROUND_TRIP_MS:.0f} ms per index call\n")
+
+    await run("per sub-query", per_sub_query, store, index, encoder, turns, vectors, by_id, corpus, ids)
+    await run("single pass", single_pass, store, index, encoder, turns, vectors, by_id, corpus, ids)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,14 +3,30 @@ Main Application Entry Point
 
 This file initializes the FastAPI application, includes the API router,
 and defines the root endpoint. It serves as the starting point for running the server.
+Long-lived services are built once in the lifespan handler and shut down on exit.
 """
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.core.config import settings
 from app.api.api_v1.api import api_router
+from app.services.container import ServiceContainer
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    services = ServiceContainer()
+    await services.start()
+    if settings.WARMUP_ON_STARTUP:
+        await services.warmup()
+    app.state.services = services
+    try:
+        yield
+    finally:
+        await services.shutdown()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
@@ -0,0 +1,10 @@
+"""
+Shared test setup: makes the project importable and gives Settings the API key
+it requires (no test calls the LLM). Async code is driven with asyncio.run, so
+plain pytest is enough.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("OPENAI_API_KEY", "test")
@@ -0,0 +1,197 @@
+"""IngestionJobRunner: leases, takeover of orphaned jobs and cross-process cancellation."""
+import asyncio
+import os
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.db.migrations import apply_schema_updates
+from app.models import IngestionJob
+from app.schemas.ingestion import IngestionProgress
+from app.services.ingestion_jobs import IngestionJobRunner
+
+
+class FakeIngestion:
+    """Reads the spooled source and reports `batches` progress updates, `delay` seconds apart."""
+
+    def __init__(self, batches=3, delay=0.01):
+        self.batches = batches
+        self.delay = delay
+        self.completed = []
+
+    async def ingest_stream(self, source, source_file, vector_store, metadata_schema=None, system_prompt="", on_progress=None):
+        async for _ in source:
+            pass
+        progress = IngestionProgress(source_file=source_file)
+        for _ in range(self.batches):
+            await asyncio.sleep(self.delay)
+            progress.chunks_upserted += 1
+            await on_progress(progress.model_copy())
+        self.completed.append(source_file)
+        progress.done = True
+        return progress
+
+
+async def wait_for(predicate, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not await predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("condition not reached")
+        await asyncio.sleep(0.02)
+
+
+@pytest.fixture
+def database(tmp_path):
+    """URL of a SQLite database with the application's schema updates applied."""
+    url = f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}"
+
+    async def setup():
+        engine = create_async_engine(url)
+        await apply_schema_updates(engine)
+        await engine.dispose()
+    asyncio.run(setup())
+    return url
+
+
+def run(database, main):
+    """Runs `main(engine)` with an engine created on the test's own event loop."""
+    async def wrapper():
+        engine = create_async_engine(database)
+        try:
+            await main(engine)
+        finally:
+            await engine.dispose()
+    asyncio.run(wrapper())
+
+
+def make_runner(engine, tmp_path, ingestion, **kwargs):
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+    options = {"lease_seconds": 0.5, "heartbeat_seconds": 0.05, "num_workers": 1}
+    options.update(kwargs)
+    return IngestionJobRunner(ingestion, vector_store=None, session_factory=sessions, spool_path=str(tmp_path / "spool"), **options)
+
+
+async def add_job(runner, job_id="job-1", **values):
+    """Spools one source and records the job directly, without queueing it in `runner`."""
+    path = os.path.join(runner.spool_dir(job_id), "0")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write("some text")
+    async with runner.session_factory() as db:
+        db.add(IngestionJob(id=job_id, items=[{"source_file": "a.md", "path": path}], items_done=0, progress={}, **values))
+        await db.commit()
+
+
+async def has_status(runner, expected, job_id="job-1"):
+    return (await runner.get(job_id)).status == expected
+
+
+async def idle(runner):
+    return not runner._running
+
+
+def test_job_with_live_lease_is_not_taken_over(database, tmp_path):
+    async def main(engine):
+        ingestion = FakeIngestion()
+        runner = make_runner(engine, tmp_path, ingestion)
+        # Running in another process that is still renewing its lease
+        await add_job(runner, status="running", owner="other", lease_expires_at=datetime.utcnow() + timedelta(hours=1))
+        await runner.start()
+        await asyncio.sleep(0.3)
+        job = await runner.get("job-1")
+        await runner.close()
+        assert job.status == "running" and job.owner == "other"
+        assert ingestion.completed == []
+
+    run(database, main)
+
+
+def test_job_with_expired_lease_is_resumed(database, tmp_path):
+    async def main(engine):
+        ingestion = FakeIngestion()
+        runner = make_runner(engine, tmp_path, ingestion)
+        # Its runner died: the lease ran out
+        await add_job(runner, status="running", owner="dead", lease_expires_at=datetime.utcnow() - timedelta(seconds=1))
+        await runner.start()
+        await wait_for(lambda: has_status(runner, "succeeded"))
+        job = await runner.get("job-1")
+        await runner.close()
+        assert ingestion.completed == ["a.md"]
+        assert job.owner is None and job.progress["chunks_upserted"] == 3
+
+    run(database, main)
+
+
+def test_lease_expiring_while_running_is_picked_up_by_heartbeat(database, tmp_path):
+    async def main(engine):
+        ingestion = FakeIngestion()
+        runner = make_runner(engine, tmp_path, ingestion)
+        await add_job(runner, status="running", owner="dying", lease_expires_at=datetime.utcnow() + timedelta(seconds=0.2))
+        await runner.start()
+        assert await has_status(runner, "running")
+        await wait_for(lambda: has_status(runner, "succeeded"))
+        await runner.close()
+
+    run(database, main)
+
+
+def test_cancel_from_another_runner_stops_job_between_batches(database, tmp_path):
+    async def main(engine):
+        ingestion = FakeIngestion(batches=1000, delay=0.01)
+        worker = make_runner(engine, tmp_path, ingestion)
+        api = make_runner(engine, tmp_path, FakeIngestion())
+        await worker.start()
+        await add_job(worker, status="queued")
+        worker._enqueue("job-1")
+        await wait_for(lambda: has_status(worker, "running"))
+
+        # `api` doesn't run the job: cancellation has to go through the database
+        job = await api.cancel("job-1")
+        assert job.cancel_requested and job.status == "running"
+
+        await wait_for(lambda: has_status(worker, "cancelled"))
+        await wait_for(lambda: idle(worker))
+        job = await worker.get("job-1")
+        await worker.close()
+        assert ingestion.completed == []
+        assert job.owner is None and job.finished_at is not None
+        assert not os.path.exists(worker.spool_dir("job-1"))
+
+    run(database, main)
+
+
+def test_shutdown_requeues_running_job(database, tmp_path):
+    async def main(engine):
+        ingestion = FakeIngestion(batches=1000, delay=0.01)
+        runner = make_runner(engine, tmp_path, ingestion)
+        await runner.start()
+        await add_job(runner, status="queued")
+        runner._enqueue("job-1")
+        await wait_for(lambda: has_status(runner, "running"))
+        await runner.close()
+
+        job = await runner.get("job-1")
+        assert job.status == "queued" and job.owner is None and job.lease_expires_at is None
+
+    run(database, main)
+
+
+def test_schema_update_adds_lease_columns(tmp_path):
+    async def main():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'old.db'}")
+        async with engine.begin() as conn:
+            # ingestion_jobs as created before leases existed
+            await conn.execute(text(
+                "CREATE TABLE ingestion_jobs (id VARCHAR PRIMARY KEY, status VARCHAR NOT NULL, items JSON NOT NULL, "
+                "metadata_schema JSON, system_prompt TEXT, items_done INTEGER, progress JSON, error TEXT, "
+                "cancel_requested BOOLEAN, created_at DATETIME, started_at DATETIME, finished_at DATETIME)"
+            ))
+        await apply_schema_updates(engine)
+        # Idempotent
+        await apply_schema_updates(engine)
+        async with engine.connect() as conn:
+            columns = {row[1] for row in (await conn.execute(text("PRAGMA table_info(ingestion_jobs)"))).all()}
+        await engine.dispose()
+        assert {"owner", "lease_expires_at"} <= columns
+
+    asyncio.run(main())
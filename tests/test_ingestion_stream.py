@@ -0,0 +1,118 @@
+"""IngestionService.ingest_stream: failed batches abort the run before any cleanup."""
+import asyncio
+import numpy as np
+import pytest
+from app.services.ingestion_manifest import ManifestStore
+from app.services.ingestion_service import IngestionService
+
+
+class FakeEmbedding:
+    model_name = "fake-embedding"
+
+    async def aencode(self, texts):
+        await asyncio.sleep(0)
+        return np.ones((len(texts), 8), dtype=np.float32)
+
+
+class FakeVectorStore:
+    def __init__(self, fail_on_upsert=None):
+        self.fail_on_upsert = fail_on_upsert
+        self.upserts = 0
+        self.live = set()
+        self.deleted = []
+
+    async def aupsert_chunks(self, batch):
+        self.upserts += 1
+        await asyncio.sleep(0.001)
+        if self.upserts == self.fail_on_upsert:
+            raise RuntimeError("upsert failed")
+        self.live.update(batch.ids)
+
+    async def arelink_chunks(self, relinks):
+        pass
+
+    async def adelete_chunks(self, ids):
+        self.deleted.extend(ids)
+        self.live.difference_update(ids)
+
+
+async def slow_source(text, block=1500):
+    for start in range(0, len(text), block):
+        await asyncio.sleep(0.001)
+        yield text[start:start + block]
+
+
+def document(version, chunks=40):
+    # Distinct 800-character steps, so every chunk's content (and id) depends on `version`
+    return "".join(f"{version}-{i:04d} ".ljust(800, "x") for i in range(chunks)) + "end"
+
+
+def ingest(service, store, text):
+    return asyncio.run(service.ingest_stream(slow_source(text), "doc.md", store, batch_size=4, max_inflight_batches=2))
+
+
+def test_failed_batch_raises_and_keeps_previous_version():
+    manifests = ManifestStore(path=None)
+    service = IngestionService(embedding_engine=FakeEmbedding(), llm_service=object(), manifest_store=manifests)
+    store = FakeVectorStore()
+    first = ingest(service, store, document("v1"))
+    assert first.done
+    old_ids = list(manifests.load("doc.md").chunk_ids)
+    assert store.live == set(old_ids)
+
+    store.fail_on_upsert = store.upserts + 1
+    with pytest.raises(RuntimeError, match="upsert failed"):
+        ingest(service, store, document("v2"))
+
+    # Nothing of the previous version was deleted and its manifest is kept,
+    # so the next run re-processes every chunk of the new version
+    assert store.deleted == []
+    assert set(old_ids) <= store.live
+    assert manifests.load("doc.md").chunk_ids == old_ids
+
+
+def test_rerun_after_failure_converges():
+    manifests = ManifestStore(path=None)
+    service = IngestionService(embedding_engine=FakeEmbedding(), llm_service=object(), manifest_store=manifests)
+    store = FakeVectorStore()
+    ingest(service, store, document("v1"))
+    old_ids = set(manifests.load("doc.md").chunk_ids)
+
+    store.fail_on_upsert = store.upserts + 2
+    with pytest.raises(RuntimeError):
+        ingest(service, store, document("v2"))
+    progress = ingest(service, store, document("v2"))
+
+    new_ids = manifests.load("doc.md").chunk_ids
+    assert progress.done
+    assert store.live == set(new_ids)
+    assert store.live.isdisjoint(old_ids - set(new_ids))
+
+
+def test_successful_reingest_deletes_removed_chunks():
+    manifests = ManifestStore(path=None)
+    service = IngestionService(embedding_engine=FakeEmbedding(), llm_service=object(), manifest_store=manifests)
+    store = FakeVectorStore()
+    ingest(service, store, document("v1"))
+    old_ids = set(manifests.load("doc.md").chunk_ids)
+
+    progress = ingest(service, store, document("v2"))
+    new_ids = manifests.load("doc.md").chunk_ids
+    assert progress.done
+    assert store.live == set(new_ids)
+    assert set(store.deleted) == old_ids - set(new_ids)
+
+
+@pytest.mark.parametrize("block", [7, 999, 1000, 4096])
+def test_iter_chunks_matches_chunk_text(block):
+    service = IngestionService(embedding_engine=FakeEmbedding(), llm_service=object(), manifest_store=ManifestStore(path=None))
+    text = "".join(chr(0x61 + i % 26) if i % 97 else "é" for i in range(12345))
+
+    data = text.encode("utf-8")
+
+    async def collect():
+        # Byte blocks may split a multi-byte character
+        blocks = (data[i:i + block] for i in range(0, len(data), block))
+        return [chunk async for chunk in service.iter_chunks(blocks, chunk_size=1000, overlap=200)]
+
+    assert asyncio.run(collect()) == service._chunk_text(text, 1000, 200)